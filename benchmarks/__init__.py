@@ -0,0 +1,3 @@
+# benchmarks - Synthetic population generator and matching benchmarks
+#
+# Run with `python -m benchmarks.run`; see benchmarks/run.py for options.
@@ -0,0 +1,116 @@
+# benchmarks/harness.py - Latency percentiles and query counting
+
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, List
+
+from sqlalchemy import event
+
+
+@dataclass
+class BenchResult:
+    name: str
+    users: int
+    calls: int
+    p50_ms: float
+    p99_ms: float
+    queries_per_call: float
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class QueryCounter:
+    """Counts statements sent to the database by an engine or a DatabasePool"""
+
+    def __init__(self):
+        self.count = 0
+
+    def attach_engine(self, engine):
+        """Count every cursor execute of a SQLAlchemy (async) engine"""
+        sync_engine = getattr(engine, 'sync_engine', engine)
+        event.listen(sync_engine, 'before_cursor_execute', self._on_execute)
+
+    def wrap_pool(self, db) -> 'CountingPool':
+        return CountingPool(db, self)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+class CountingPool:
+    """DatabasePool proxy that counts fetch/fetchrow/fetchval/execute/stream calls"""
+
+    def __init__(self, db, counter: QueryCounter):
+        self.db = db
+        self.counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    async def fetch(self, query: str, *args):
+        self.counter.count += 1
+        return await self.db.fetch(query, *args)
+
+    async def fetchrow(self, query: str, *args):
+        self.counter.count += 1
+        return await self.db.fetchrow(query, *args)
+
+    async def fetchval(self, query: str, *args):
+        self.counter.count += 1
+        return await self.db.fetchval(query, *args)
+
+    async def execute(self, query: str, *args):
+        self.counter.count += 1
+        return await self.db.execute(query, *args)
+
+    async def stream(self, query: str, *args, prefetch: int = 50):
+        self.counter.count += 1
+        async for row in self.db.stream(query, *args, prefetch=prefetch):
+            yield row
+
+
+async def bench(name: str, users: int, call: Callable[[Any], Awaitable[Any]],
+                inputs: Iterable[Any], counter: QueryCounter, warmup: int = 5) -> BenchResult:
+    """
+    Time call(x) for every x in inputs, one at a time
+
+    The first `warmup` inputs are run but not measured (connection pool,
+    caches, code paths). Queries per call counts statements, not round
+    trips saved by pipelining.
+    """
+    inputs = list(inputs)
+    for x in inputs[:warmup]:
+        await call(x)
+
+    timings = []
+    queries_before = counter.count
+    for x in inputs[warmup:]:
+        started = time.perf_counter()
+        await call(x)
+        timings.append((time.perf_counter() - started) * 1000)
+    queries = counter.count - queries_before
+
+    timings.sort()
+    calls = len(timings)
+    return BenchResult(
+        name=name,
+        users=users,
+        calls=calls,
+        p50_ms=percentile(timings, 50),
+        p99_ms=percentile(timings, 99),
+        queries_per_call=queries / calls if calls else 0.0
+    )
+
+
+def format_results(results: List[BenchResult]) -> str:
+    lines = [f"{'benchmark':<40}{'users':>10}{'calls':>8}{'p50 ms':>10}{'p99 ms':>10}{'queries':>9}"]
+    for r in results:
+        lines.append(f"{r.name:<40}{r.users:>10}{r.calls:>8}{r.p50_ms:>10.2f}"
+                     f"{r.p99_ms:>10.2f}{r.queries_per_call:>9.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,142 @@
+# benchmarks/load.py - Write a synthetic population into the benchmark databases
+
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import insert
+
+from benchmarks.population import PopulationConfig, generate_swipes, generate_users, matches_of
+from src.database import Base, Like, Match, Skip, User
+
+# Rows per INSERT
+CHUNK_SIZE = 5000
+
+# asyncpg allows 32767 bind parameters per statement
+MAX_PARAMS = 30000
+
+
+def _chunks(rows: List, size: int = CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+async def load_orm(engine, config: PopulationConfig) -> Dict[str, int]:
+    """
+    Recreate the src/database.py tables on engine and fill them
+
+    Works for SQLite and PostgreSQL; counters on users are set to match the
+    generated history.
+    """
+    now = datetime.utcnow()
+    users = list(generate_users(config, now))
+    swipes = list(generate_swipes(config, users, now))
+    matches = list(matches_of(swipes))
+
+    likes_sent = Counter(from_id for from_id, _, liked, _ in swipes if liked)
+    likes_received = Counter(to_id for _, to_id, liked, _ in swipes if liked)
+    matches_count = Counter(user_id for user1, user2, _ in matches for user_id in (user1, user2))
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with engine.begin() as conn:
+        for chunk in _chunks(users):
+            await conn.execute(insert(User), [{
+                'id': u['id'],
+                'telegram_id': u['telegram_id'],
+                'username': u['username'],
+                'name': u['name'],
+                'age': u['age'],
+                'gender': u['gender'],
+                'looking_for': u['looking_for'],
+                'bio': u['bio'],
+                'photos': ",".join(f"bench_{u['id']}_{i}" for i in range(len(u['photo_qualities']))) or None,
+                'city': u['city'],
+                'country': u['country'],
+                'latitude': u['latitude'],
+                'longitude': u['longitude'],
+                'likes_sent': likes_sent[u['id']],
+                'likes_received': likes_received[u['id']],
+                'matches_count': matches_count[u['id']],
+                'views_count': 0,
+                'subscription_type': 'free',
+                'premium_until': now + timedelta(days=30) if u['id'] % 20 == 0 else None,
+                'bonus_likes': 0,
+                'is_active': True,
+                'is_banned': False,
+                'last_active': u['last_active'],
+                'created_at': u['created_at'],
+            } for u in chunk])
+
+        like_rows = [{'from_user_id': f, 'to_user_id': t, 'is_super_like': False, 'created_at': c}
+                     for f, t, liked, c in swipes if liked]
+        skip_rows = [{'from_user_id': f, 'to_user_id': t, 'created_at': c}
+                     for f, t, liked, c in swipes if not liked]
+        match_rows = [{'user1_id': a, 'user2_id': b, 'is_active': True, 'created_at': c}
+                      for a, b, c in matches]
+        for model, rows in ((Like, like_rows), (Skip, skip_rows), (Match, match_rows)):
+            for chunk in _chunks(rows):
+                await conn.execute(insert(model), chunk)
+
+    return {'users': len(users), 'likes': len(like_rows), 'skips': len(skip_rows), 'matches': len(matches)}
+
+
+async def load_schema(db, config: PopulationConfig) -> Dict[str, int]:
+    """
+    Fill a PostgreSQL database created from database/schema.sql
+
+    Used by the src/matching_engine.py benchmarks (PostGIS location,
+    user_interests, photos). Existing rows are truncated; users.likes_*
+    and matches_count are maintained by the schema's triggers.
+    """
+    now = datetime.utcnow()
+    users = list(generate_users(config, now))
+    swipes = list(generate_swipes(config, users, now))
+    matches = list(matches_of(swipes))
+
+    await db.execute(
+        "TRUNCATE users, photos, user_interests, likes, matches, user_features RESTART IDENTITY CASCADE"
+    )
+
+    await _insert(
+        db, "users (id, telegram_id, username, name, age, gender, looking_for, bio, city, country,"
+            " last_active, created_at, location)",
+        [(u['id'], u['telegram_id'], u['username'], u['name'], u['age'], u['gender'],
+          u['looking_for'], u['bio'], u['city'], u['country'], u['last_active'], u['created_at'],
+          u['longitude'], u['latitude']) for u in users],
+        row_template="({}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {},"
+                     " ST_SetSRID(ST_MakePoint({}::float8, {}::float8), 4326)::geography)"
+    )
+    await db.execute("SELECT setval('users_id_seq', $1)", len(users))
+
+    await _insert(db, "user_interests (user_id, interest_id)",
+                  [(u['id'], interest_id) for u in users for interest_id in u['interest_ids']])
+    await _insert(
+        db, "photos (user_id, original_url, medium_url, position, moderation_status, quality_score)",
+        [(u['id'], f"bench/{u['id']}/{i}.jpg", f"bench/{u['id']}/{i}_m.jpg", i, 'approved', quality)
+         for u in users for i, quality in enumerate(u['photo_qualities'])]
+    )
+    await _insert(db, "likes (from_user_id, to_user_id, action, created_at)",
+                  [(f, t, 'like' if liked else 'dislike', c) for f, t, liked, c in swipes])
+    await _insert(db, "matches (user1_id, user2_id, created_at)", matches)
+
+    likes = sum(1 for swipe in swipes if swipe[2])
+    return {'users': len(users), 'likes': likes, 'skips': len(swipes) - likes, 'matches': len(matches)}
+
+
+async def _insert(db, target: str, rows: List[tuple], row_template: str = None):
+    """Multi-row INSERT INTO target VALUES ..., chunked under the parameter limit"""
+    if not rows:
+        return
+    width = len(rows[0])
+    row_template = row_template or "(" + ", ".join(["{}"] * width) + ")"
+
+    for chunk in _chunks(rows, max(1, MAX_PARAMS // width)):
+        values = ", ".join(
+            row_template.format(*(f"${i * width + j + 1}" for j in range(width)))
+            for i in range(len(chunk))
+        )
+        await db.execute(f"INSERT INTO {target} VALUES {values}",
+                         *[value for row in chunk for value in row])
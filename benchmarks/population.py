@@ -0,0 +1,145 @@
+# benchmarks/population.py - Synthetic user population with swipe history
+
+import math
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+# (city, country, latitude, longitude, share of users)
+CITIES = (
+    ('Москва', 'Россия', 55.7558, 37.6173, 0.30),
+    ('Санкт-Петербург', 'Россия', 59.9343, 30.3351, 0.15),
+    ('Киев', 'Украина', 50.4501, 30.5234, 0.12),
+    ('Минск', 'Беларусь', 53.9006, 27.5590, 0.08),
+    ('Казань', 'Россия', 55.8304, 49.0661, 0.08),
+    ('Новосибирск', 'Россия', 55.0084, 82.9357, 0.07),
+    ('Алматы', 'Казахстан', 43.2220, 76.8512, 0.07),
+    ('Екатеринбург', 'Россия', 56.8389, 60.6057, 0.07),
+    ('Варшава', 'Польша', 52.2297, 21.0122, 0.06),
+)
+
+# Rows in the interests table of database/schema.sql
+INTEREST_COUNT = 22
+
+# Spread of users around the city centre, degrees (~15 km)
+CITY_SPREAD_DEG = 0.15
+
+
+@dataclass
+class PopulationConfig:
+    users: int = 10_000
+    swipes_per_user: float = 20.0   # mean; exponential, so a few heavy swipers
+    like_ratio: float = 0.35        # share of swipes that are likes
+    mutual_ratio: float = 0.15      # share of likes answered with a like (a match)
+    no_location_ratio: float = 0.05
+    seed: int = 42
+
+
+def generate_users(config: PopulationConfig, now: datetime = None) -> Iterator[Dict]:
+    """
+    Users with ids 1..N
+
+    Ages are a right-skewed normal around 29, genders ~49/49/2 with mostly
+    heterosexual preferences, locations scattered around CITIES by
+    population share. Each user gets 0-6 photo quality scores and 3-8
+    interest ids.
+    """
+    rng = random.Random(config.seed)
+    now = now or datetime.utcnow()
+    city_weights = [city[4] for city in CITIES]
+
+    for user_id in range(1, config.users + 1):
+        age = int(min(65, max(18, rng.gauss(27, 6) + abs(rng.gauss(0, 4)))))
+
+        roll = rng.random()
+        gender = 'male' if roll < 0.49 else 'female' if roll < 0.98 else 'other'
+        if gender == 'other' or rng.random() < 0.06:
+            looking_for = 'both'
+        else:
+            looking_for = 'female' if gender == 'male' else 'male'
+
+        city, country, lat, lon, _ = rng.choices(CITIES, city_weights)[0]
+        if rng.random() < config.no_location_ratio:
+            latitude = longitude = None
+        else:
+            latitude = lat + rng.gauss(0, CITY_SPREAD_DEG)
+            longitude = lon + rng.gauss(0, CITY_SPREAD_DEG) / math.cos(math.radians(lat))
+
+        created_at = now - timedelta(days=min(730.0, rng.expovariate(1 / 120)))
+        last_active = max(created_at, now - timedelta(hours=rng.expovariate(1 / 72)))
+
+        photo_count = rng.choices(range(7), (10, 20, 25, 20, 12, 8, 5))[0]
+        yield {
+            'id': user_id,
+            'telegram_id': 10_000_000 + user_id,
+            'username': f'bench_{user_id}',
+            'name': f'User {user_id}',
+            'age': age,
+            'gender': gender,
+            'looking_for': looking_for,
+            'bio': None if rng.random() < 0.3 else 'Benchmark user',
+            'city': city,
+            'country': country,
+            'latitude': latitude,
+            'longitude': longitude,
+            'photo_qualities': [round(rng.uniform(0.3, 1.0), 2) for _ in range(photo_count)],
+            'interest_ids': rng.sample(range(1, INTEREST_COUNT + 1), rng.randint(3, 8)),
+            'created_at': created_at,
+            'last_active': last_active,
+        }
+
+
+def generate_swipes(config: PopulationConfig, users: List[Dict],
+                    now: datetime = None) -> Iterator[Tuple[int, int, bool, datetime]]:
+    """
+    (from_user_id, to_user_id, liked, created_at), unique per direction
+
+    Swipers see people of the gender they look for, mostly in their own
+    city. A mutual like is emitted right after the like it answers, so
+    matches can be derived on the fly (see matches_of()).
+    """
+    rng = random.Random(config.seed + 1)
+    now = now or datetime.utcnow()
+
+    # Candidate lists per (city, gender)
+    by_city: Dict[Tuple[str, str], List[int]] = {}
+    by_gender: Dict[str, List[int]] = {}
+    for user in users:
+        by_city.setdefault((user['city'], user['gender']), []).append(user['id'])
+        by_gender.setdefault(user['gender'], []).append(user['id'])
+
+    swiped = set()
+    for user in users:
+        wanted = ('male', 'female') if user['looking_for'] == 'both' else (user['looking_for'],)
+        count = int(rng.expovariate(1 / config.swipes_per_user)) if config.swipes_per_user else 0
+
+        for _ in range(count):
+            gender = rng.choice(wanted)
+            pool = by_city.get((user['city'], gender)) if rng.random() < 0.9 else None
+            pool = pool or by_gender.get(gender)
+            if not pool:
+                break
+            target = rng.choice(pool)
+            if target == user['id'] or (user['id'], target) in swiped:
+                continue
+
+            swiped.add((user['id'], target))
+            created_at = max(user['created_at'], now - timedelta(hours=rng.expovariate(1 / 240)))
+            liked = rng.random() < config.like_ratio
+            yield user['id'], target, liked, created_at
+
+            if liked and rng.random() < config.mutual_ratio and (target, user['id']) not in swiped:
+                swiped.add((target, user['id']))
+                yield target, user['id'], True, created_at + timedelta(minutes=rng.randint(1, 600))
+
+
+def matches_of(swipes: Iterator[Tuple[int, int, bool, datetime]]) -> Iterator[Tuple[int, int, datetime]]:
+    """(user1_id, user2_id, created_at) with user1_id < user2_id for every mutual like"""
+    likes = set()
+    for from_id, to_id, liked, created_at in swipes:
+        if not liked:
+            continue
+        if (to_id, from_id) in likes:
+            yield min(from_id, to_id), max(from_id, to_id), created_at
+        likes.add((from_id, to_id))
@@ -0,0 +1,158 @@
+# benchmarks/run.py - Matching benchmarks over synthetic populations
+#
+#   python -m benchmarks.run --users 10000,100000,1000000
+#   python -m benchmarks.run --users 100000 --database-url postgresql+asyncpg://... \
+#       --schema-url postgresql://...   # database created from database/schema.sql
+#
+# --database-url holds the src/database.py tables and is recreated (default:
+# a SQLite file in the temp directory). --schema-url, if given, is truncated
+# and refilled for the src/matching_engine.py benchmark.
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from typing import List
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from benchmarks.harness import BenchResult, QueryCounter, bench, format_results
+from benchmarks.load import load_orm, load_schema
+from benchmarks.population import PopulationConfig
+from src.database import User, async_session_maker
+from src.db_pool import DatabasePool
+from src.db_utils import DatabaseManager
+from src.geo_index import geo_index
+from src.matching import MatchingEngine
+from src.write_behind import write_behind
+
+WARMUP_CALLS = 5
+
+
+async def run_orm(database_url: str, config: PopulationConfig, calls: int) -> List[BenchResult]:
+    """src/matching.py and DatabaseManager benchmarks on the ORM schema"""
+    engine = create_async_engine(database_url)
+    # Every module shares this sessionmaker, so rebinding it moves them all
+    async_session_maker.configure(bind=engine)
+
+    summary = await load_orm(engine, config)
+    print(f"ORM population: {summary}")
+    await DatabaseManager.load_geo_index()
+
+    counter = QueryCounter()
+    counter.attach_engine(engine)
+    rng = random.Random(config.seed + 2)
+    sample = rng.sample(range(1, config.users + 1), min(config.users, calls + WARMUP_CALLS))
+
+    async def potential_matches(user_id: int):
+        async with async_session_maker() as session:
+            user = await session.get(User, user_id)
+            await MatchingEngine.get_potential_matches(user, session, limit=10)
+
+    async def process_like(pair):
+        await DatabaseManager.process_like(*pair)
+
+    pairs = [(user_id, rng.randint(1, config.users)) for user_id in sample]
+    pairs = [(a, b) for a, b in pairs if a != b]
+
+    results = [
+        await bench("matching.get_potential_matches", config.users, potential_matches,
+                    sample, counter, WARMUP_CALLS),
+        await bench("DatabaseManager.process_like", config.users, process_like,
+                    pairs, counter, WARMUP_CALLS),
+        await bench("DatabaseManager.get_user_stats", config.users, DatabaseManager.get_user_stats,
+                    sample, counter, WARMUP_CALLS),
+    ]
+
+    await write_behind.flush()
+    await engine.dispose()
+    return results
+
+
+async def run_schema(schema_url: str, config: PopulationConfig, calls: int) -> List[BenchResult]:
+    """src/matching_engine.py benchmark on the PostGIS schema"""
+    from src.cache_service import CacheService
+    from src.matching_engine import MatchingEngine as CandidateEngine
+
+    db = DatabasePool(schema_url, pool_size=4, max_overflow=0)
+    await db.open()
+    try:
+        summary = await load_schema(db, config)
+        print(f"Schema population: {summary}")
+
+        # Same warm-up as FlirtlyApp.initialize_geo_index
+        geo_index.load(await db.fetch("""
+            SELECT id, gender, age,
+                   ST_Y(location::geometry) AS latitude,
+                   ST_X(location::geometry) AS longitude
+            FROM users
+            WHERE is_active = true AND location IS NOT NULL
+        """))
+
+        counter = QueryCounter()
+        cache = CacheService()
+        await cache.connect()
+        engine = CandidateEngine(counter.wrap_pool(db), cache)
+
+        rng = random.Random(config.seed + 3)
+        sample = rng.sample(range(1, config.users + 1), min(config.users, calls + WARMUP_CALLS))
+
+        async def get_candidates(user_id: int):
+            await engine.get_candidates(user_id, limit=50)
+
+        return [await bench("matching_engine.get_candidates", config.users, get_candidates,
+                            sample, counter, WARMUP_CALLS)]
+    finally:
+        await db.close()
+
+
+async def run_size(args, users: int):
+    config = PopulationConfig(users=users, swipes_per_user=args.swipes, seed=args.seed)
+
+    database_url = args.database_url
+    if not database_url:
+        path = os.path.join(tempfile.gettempdir(), f"flirtly_bench_{users}.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        database_url = f"sqlite+aiosqlite:///{path}"
+
+    results = await run_orm(database_url, config, args.calls)
+    if args.schema_url:
+        results += await run_schema(args.schema_url, config, args.calls)
+    print(format_results(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matching benchmarks over synthetic populations")
+    parser.add_argument("--users", default="10000",
+                        help="comma-separated population sizes, e.g. 10000,100000,1000000")
+    parser.add_argument("--swipes", type=float, default=20.0, help="mean swipes per user")
+    parser.add_argument("--calls", type=int, default=200, help="measured calls per benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="ORM database (recreated); default: temp SQLite file")
+    parser.add_argument("--schema-url", help="PostgreSQL database with database/schema.sql (truncated)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.users.split(",")]
+    if len(sizes) == 1:
+        asyncio.run(run_size(args, sizes[0]))
+        return
+
+    # One process per size: the geo index, seen filters and caches are
+    # process-wide singletons and must start cold for every population
+    for size in sizes:
+        argv = ["--users", str(size), "--swipes", str(args.swipes),
+                "--calls", str(args.calls), "--seed", str(args.seed)]
+        if args.database_url:
+            argv += ["--database-url", args.database_url]
+        if args.schema_url:
+            argv += ["--schema-url", args.schema_url]
+        subprocess.run([sys.executable, "-m", "benchmarks.run", *argv], check=True)
+
+
+if __name__ == "__main__":
+    main()
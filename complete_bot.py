@@ -1,5 +1,6 @@
 # complete_bot.py - Полноценный бот с базой данных и всеми функциями
 
+import asyncio
 import requests
 import json
 import time
@@ -9,6 +10,11 @@ import os
 from datetime import datetime, timedelta
 import uuid
 
+from src.cache_service import CacheService
+from src.notification_preferences import (
+    NOTIFICATION_TYPES, mask_from_settings, notification_preferences, settings_from_mask
+)
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -23,6 +29,15 @@ class CompleteBot:
         self.last_update_id = 0
         self.running = True
         self.init_database()
+        self.init_cache()
+    
+    def init_cache(self):
+        """Redis для рассылки сброса настроек уведомлений другим процессам (main.py)"""
+        # Бот синхронный - асинхронный кэш работает на собственном event loop
+        self.loop = asyncio.new_event_loop()
+        self.cache = CacheService(os.getenv("REDIS_URL", "redis://localhost:6379"))
+        self.loop.run_until_complete(self.cache.connect())
+        notification_preferences.attach(None, self.cache)
     
     def init_database(self):
         """Инициализация базы данных"""
@@ -52,10 +67,16 @@ class CompleteBot:
                 likes_received INTEGER DEFAULT 0,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 last_active DATETIME DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1
+                is_active BOOLEAN DEFAULT 1,
+                notification_settings TEXT
             )
         ''')
         
+        # Базы, созданные до появления настроек уведомлений
+        cursor.execute("PRAGMA table_info(users)")
+        if 'notification_settings' not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE users ADD COLUMN notification_settings TEXT")
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS photos (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -170,6 +191,35 @@ class CompleteBot:
         conn.commit()
         conn.close()
     
+    def get_notification_settings(self, telegram_id):
+        """Настройки уведомлений пользователя: {тип: включено}"""
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute("SELECT notification_settings FROM users WHERE telegram_id = ?", (telegram_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return settings_from_mask(mask_from_settings(row[0] if row else None))
+    
+    def set_notification_setting(self, telegram_id, notification_type, enabled):
+        """Включение/выключение типа уведомлений"""
+        settings = self.get_notification_settings(telegram_id)
+        settings[notification_type] = enabled
+        
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE users SET notification_settings = ? WHERE telegram_id = ?",
+            (json.dumps(settings), telegram_id)
+        )
+        cursor.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
+        row = cursor.fetchone()
+        conn.commit()
+        conn.close()
+        
+        # Сбрасываем закэшированную маску настроек здесь и в остальных процессах
+        if row:
+            self.loop.run_until_complete(notification_preferences.invalidate_everywhere(row[0]))
+    
     def get_user_matches(self, user_id):
         """Получение матчей пользователя"""
         conn = sqlite3.connect(DB_PATH)
@@ -352,6 +402,17 @@ class CompleteBot:
         elif data == "notifications":
             self.handle_notifications(chat_id, message_id, user)
         
+        elif data.startswith("notify_toggle_"):
+            notification_type = data[len("notify_toggle_"):]
+            if notification_type in NOTIFICATION_TYPES:
+                settings = self.get_notification_settings(telegram_id)
+                self.set_notification_setting(telegram_id, notification_type, not settings[notification_type])
+            self.handle_notifications(chat_id, message_id, user)
+        
+        elif data == "disable_premium_notifications":
+            self.set_notification_setting(telegram_id, 'premium', False)
+            self.edit_message_text(chat_id, message_id, "🔕 Premium предложения отключены.\n\nВключить обратно можно в /settings → Уведомления.")
+        
         elif data == "privacy":
             self.handle_privacy(chat_id, message_id, user)
         
@@ -790,20 +851,35 @@ class CompleteBot:
     
     def handle_notifications(self, chat_id, message_id, user):
         """Обработка настроек уведомлений"""
-        text = """🔔 <b>Настройки уведомлений</b>
+        settings = self.get_notification_settings(user["id"])
+        labels = {
+            'matches': "Новые матчи",
+            'messages': "Сообщения",
+            'likes': "Лайки",
+            'premium': "Premium предложения",
+            'reminders': "Напоминания",
+            'digest': "Лайки и сообщения сводкой"
+        }
+        
+        lines = "\n".join(
+            f"• {labels[notification_type]} {'✅' if settings[notification_type] else '❌'}"
+            for notification_type in NOTIFICATION_TYPES
+        )
+        text = f"""🔔 <b>Настройки уведомлений</b>
 
 Управляй тем, какие уведомления ты хочешь получать:
 
 <b>Типы уведомлений:</b>
-• Новые матчи ✅
-• Сообщения ✅
-• Лайки ✅
-• Premium предложения ❌
+{lines}
 
-<b>Настрой через Web App для полного контроля!</b>"""
+<b>Нажми на тип, чтобы включить или выключить его.</b>"""
         
         keyboard = {
             "inline_keyboard": [
+                [{"text": f"{'🔕' if settings[notification_type] else '🔔'} {labels[notification_type]}",
+                  "callback_data": f"notify_toggle_{notification_type}"}]
+                for notification_type in NOTIFICATION_TYPES
+            ] + [
                 [{"text": "⚡ Открыть настройки", "web_app": {"url": f"{WEBAPP_URL}/notifications"}}],
                 [{"text": "◀️ Назад", "callback_data": "settings"}]
             ]
@@ -897,6 +973,9 @@ class CompleteBot:
             except Exception as e:
                 logger.error(f"Error: {e}")
                 time.sleep(5)
+        
+        self.loop.run_until_complete(self.cache.close())
+        self.loop.close()
 
 if __name__ == "__main__":
     bot = CompleteBot()
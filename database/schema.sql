@@ -27,6 +27,7 @@ CREATE TABLE users (
     age_min INTEGER DEFAULT 18 CHECK (age_min >= 18),
     age_max INTEGER DEFAULT 99 CHECK (age_max <= 99),
     max_distance INTEGER DEFAULT 50 CHECK (max_distance > 0 AND max_distance <= 1000),
+    notification_settings JSONB DEFAULT '{}', -- {"premium": false, ...}; нет ключа = включено
     
     -- Stats
     matches_count INTEGER DEFAULT 0,
@@ -34,6 +35,7 @@ CREATE TABLE users (
     likes_received INTEGER DEFAULT 0,
     views_count INTEGER DEFAULT 0,
     response_rate DECIMAL(3,2) DEFAULT 0.0, -- процент ответов на сообщения
+    elo_rating DOUBLE PRECISION DEFAULT 1200, -- рейтинг желанности (ELO по лайкам/пропускам)
     
     -- Premium
     is_premium BOOLEAN DEFAULT false,
@@ -65,6 +67,8 @@ CREATE INDEX idx_users_location ON users USING GIST(location);
 CREATE INDEX idx_users_age_gender ON users(age, gender) WHERE is_active = true;
 CREATE INDEX idx_users_premium ON users(is_premium, premium_until) WHERE is_active = true;
 CREATE INDEX idx_users_last_active ON users(last_active) WHERE is_active = true;
+-- Лента кандидатов: keyset-курсор (last_active, id) в пределах пола
+CREATE INDEX idx_users_feed ON users(gender, last_active DESC, id DESC) WHERE is_active = true;
 
 -- ===================================
 -- PHOTOS TABLE
@@ -153,6 +157,19 @@ INSERT INTO interests (name, category, emoji) VALUES
 ('Карьера', 'lifestyle', '💼'),
 ('Семья', 'lifestyle', '👨‍👩‍👧‍👦');
 
+-- ===================================
+-- USER FEATURES (ночной пересчет: python -m src.user_features)
+-- ===================================
+-- Факторы ранжирования, зависящие только от пользователя
+CREATE TABLE user_features (
+    user_id BIGINT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    photo_quality_score REAL NOT NULL,
+    popularity_score REAL NOT NULL,
+    freshness_score REAL NOT NULL, -- корзина по дням с регистрации
+    elo_score REAL NOT NULL,
+    computed_at TIMESTAMP DEFAULT NOW()
+);
+
 -- ===================================
 -- LIKES TABLE (interactions)
 -- ===================================
@@ -171,6 +188,32 @@ CREATE INDEX idx_likes_to ON likes(to_user_id);
 CREATE INDEX idx_likes_mutual ON likes(from_user_id, to_user_id);
 CREATE INDEX idx_likes_created ON likes(created_at);
 
+-- ===================================
+-- NOTIFICATION OUTBOX (src/notification_outbox.py)
+-- ===================================
+-- Исходящие сообщения бота до подтверждения Telegram
+CREATE TABLE notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    payload TEXT NOT NULL, -- JSON аргументов send_message
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP NOT NULL
+);
+
+-- ===================================
+-- NOTIFICATION CAMPAIGNS (src/notification_campaigns.py)
+-- ===================================
+-- Прогресс последнего запуска каждой кампании (checkpoint для продолжения)
+CREATE TABLE notification_campaign_runs (
+    campaign VARCHAR(50) PRIMARY KEY,
+    started_at TIMESTAMP NOT NULL,
+    last_user_id BIGINT NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    finished_at TIMESTAMP
+);
+
 -- ===================================
 -- MATCHES TABLE
 -- ===================================
@@ -368,6 +411,56 @@ $$ language 'plpgsql';
 CREATE TRIGGER update_like_stats_trigger AFTER INSERT ON likes
     FOR EACH ROW EXECUTE FUNCTION update_like_stats();
 
+-- Атомарная обработка лайка за один вызов: идемпотентная вставка,
+-- проверка взаимности и создание матча. Лайки одной пары сериализуются
+-- advisory lock'ом, поэтому одновременные взаимные лайки не разминутся.
+CREATE OR REPLACE FUNCTION process_like(p_from_user_id BIGINT, p_to_user_id BIGINT, p_action VARCHAR)
+RETURNS TABLE(like_created BOOLEAN, match_created BOOLEAN, new_match_id BIGINT) AS $$
+DECLARE
+    v_inserted BOOLEAN;
+    v_match_id BIGINT;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtextextended(
+        'like:' || LEAST(p_from_user_id, p_to_user_id) || ':' || GREATEST(p_from_user_id, p_to_user_id), 0
+    ));
+    
+    -- Повторный лайк ничего не меняет; дизлайк превращается в лайк
+    INSERT INTO likes (from_user_id, to_user_id, action, created_at)
+    VALUES (p_from_user_id, p_to_user_id, p_action, NOW())
+    ON CONFLICT (from_user_id, to_user_id) DO UPDATE SET
+        action = EXCLUDED.action,
+        created_at = NOW()
+    WHERE likes.action = 'dislike'
+    RETURNING (xmax = 0) INTO v_inserted;
+    
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT false, false, NULL::BIGINT;
+        RETURN;
+    END IF;
+    
+    -- Триггер статистики срабатывает только на INSERT
+    IF NOT v_inserted THEN
+        UPDATE users SET likes_given = likes_given + 1 WHERE id = p_from_user_id;
+        UPDATE users SET likes_received = likes_received + 1 WHERE id = p_to_user_id;
+    END IF;
+    
+    UPDATE users SET last_active = NOW() WHERE id = p_from_user_id;
+    
+    IF EXISTS (
+        SELECT 1 FROM likes
+        WHERE from_user_id = p_to_user_id AND to_user_id = p_from_user_id
+          AND action IN ('like', 'superlike')
+    ) THEN
+        INSERT INTO matches (user1_id, user2_id, created_at)
+        VALUES (LEAST(p_from_user_id, p_to_user_id), GREATEST(p_from_user_id, p_to_user_id), NOW())
+        ON CONFLICT (user1_id, user2_id) DO NOTHING
+        RETURNING id INTO v_match_id;
+    END IF;
+    
+    RETURN QUERY SELECT true, v_match_id IS NOT NULL, v_match_id;
+END;
+$$ language 'plpgsql';
+
 -- ===================================
 -- VIEWS FOR ANALYTICS
 -- ===================================
@@ -13,6 +13,18 @@ from bot_full import FlirtlyBot
 from matching_engine import MatchingEngine
 from messaging_service import MessagingService, WebSocketService
 from notification_service import NotificationService, NotificationScheduler
+from src.geo_index import geo_index
+from src.db_pool import DatabasePool
+from src.cache_service import CacheService
+from src.profile_cache import profile_cache
+from src.seen_filter import seen_filters
+from src.elo_ratings import elo_ratings
+from src.user_features import FeaturePrecomputer
+from src.ranking_profiles import RankingExperiment
+from src.notification_outbox import NotificationOutbox
+from src.notification_preferences import notification_preferences
+from src.notification_digest import NotificationCoalescer
+from config.database import DB_POOL_SIZE, DB_MAX_OVERFLOW
 
 # Настройка логирования
 logging.basicConfig(
@@ -38,44 +50,53 @@ class FlirtlyApp:
         self.messaging_service = None
         self.notification_service = None
         self.notification_scheduler = None
+        self.scheduler_task = None
+        self.notification_outbox = None
+        self.notification_digest = None
+        self.feature_precomputer = None
+        self.feature_task = None
     
     async def initialize_database(self):
-        """Инициализация базы данных"""
+        """Инициализация пула соединений с базой данных"""
         try:
-            # Для SQLite (простая версия)
-            if self.database_url.startswith("sqlite"):
-                import aiosqlite
-                self.db = await aiosqlite.connect("flirtly.db")
-                logger.info("SQLite database connected")
-            
-            # Для PostgreSQL (production версия)
-            elif self.database_url.startswith("postgresql"):
-                import asyncpg
-                self.db = await asyncpg.connect(self.database_url)
-                logger.info("PostgreSQL database connected")
-            
-            else:
-                raise ValueError(f"Unsupported database URL: {self.database_url}")
+            # SQLite (пул aiosqlite в режиме WAL) или PostgreSQL (asyncpg pool)
+            self.db = DatabasePool(
+                self.database_url,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW
+            )
+            await self.db.open()
+            logger.info(f"Database pool connected: {self.database_url.split(':')[0]}")
                 
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
             raise
     
     async def initialize_cache(self):
-        """Инициализация кэша (Redis)"""
+        """Инициализация кэша (Redis, при недоступности - in-process LRU+TTL)"""
+        self.cache = CacheService(os.getenv("REDIS_URL", "redis://localhost:6379"))
+        await self.cache.connect()
+        logger.info(f"Cache backend: {self.cache.backend}")
+        
+        # Кэш профилей: L1 в процессе, L2 в Redis, инвалидация через pub/sub
+        profile_cache.attach(self.cache)
+        await profile_cache.start()
+    
+    async def initialize_geo_index(self):
+        """Загрузка активных пользователей с геолокацией в in-memory индекс"""
         try:
-            import redis.asyncio as redis
-            
-            redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-            self.cache = redis.from_url(redis_url)
-            
-            # Тестируем подключение
-            await self.cache.ping()
-            logger.info("Redis cache connected")
+            rows = await self.db.fetch("""
+                SELECT id, gender, age,
+                       ST_Y(location::geometry) AS latitude,
+                       ST_X(location::geometry) AS longitude
+                FROM users
+                WHERE is_active = true AND is_banned = false AND location IS NOT NULL
+            """)
+            geo_index.load(rows)
+            logger.info(f"Geo index loaded: {len(geo_index)} users")
             
         except Exception as e:
-            logger.warning(f"Redis cache not available: {e}")
-            self.cache = None
+            logger.warning(f"Geo index not available, falling back to PostGIS: {e}")
     
     async def initialize_services(self):
         """Инициализация всех сервисов"""
@@ -84,21 +105,45 @@ class FlirtlyApp:
         self.websocket = WebSocketService()
         
         # Matching Engine
-        self.matching_engine = MatchingEngine(self.db, self.cache)
+        # Веса ранжирования: A/B-эксперимент из $RANKING_EXPERIMENT_FILE, если задан
+        self.matching_engine = MatchingEngine(
+            self.db, self.cache, experiment=RankingExperiment.from_env()
+        )
         
-        # Messaging Service
-        self.messaging_service = MessagingService(
+        # ELO-рейтинги: свайпы копятся и применяются пачками в фоне
+        elo_ratings.attach(self.db)
+        
+        # Ночной пересчет факторов кандидатов (user_features)
+        self.feature_precomputer = FeaturePrecomputer(self.db)
+        
+        # Настройки уведомлений: битовые маски в памяти, загрузка пачками
+        notification_preferences.attach(self.db, self.cache)
+        
+        # Outbox уведомлений: обработчики ставят в очередь, воркеры шлют в Telegram
+        self.notification_outbox = NotificationOutbox(self.bot, self.db)
+        
+        # Сводки лайков/сообщений: события копятся по получателю в течение окна
+        self.notification_digest = NotificationCoalescer(
+            window=float(os.getenv("NOTIFICATION_DIGEST_WINDOW", "300"))
+        )
+        
+        # Notification Service
+        self.notification_service = NotificationService(
             bot=self.bot,
             db_connection=self.db,
             cache_service=self.cache,
-            websocket_service=self.websocket
+            outbox=self.notification_outbox,
+            digest=self.notification_digest
         )
         
-        # Notification Service
-        self.notification_service = NotificationService(
+        # Messaging Service (уведомления о сообщениях - через NotificationService и его сводки)
+        self.messaging_service = MessagingService(
             bot=self.bot,
             db_connection=self.db,
-            cache_service=self.cache
+            cache_service=self.cache,
+            websocket_service=self.websocket,
+            outbox=self.notification_outbox,
+            notification_service=self.notification_service
         )
         
         # Notification Scheduler
@@ -134,6 +179,21 @@ class FlirtlyApp:
             except Exception as e:
                 logger.error(f"Error handling webapp data: {e}")
         
+        # Кнопка "Не показывать" под Premium предложением
+        @self.bot.app.callback_query_handler(func=lambda call: call.data == 'disable_premium_notifications')
+        async def handle_disable_premium_notifications(call):
+            try:
+                user_id = await self.db.fetchval(
+                    "SELECT id FROM users WHERE telegram_id = $1", call.from_user.id
+                )
+                if user_id:
+                    # Сохраняет настройку и сбрасывает маску (и в других воркерах)
+                    await notification_preferences.set(user_id, 'premium', False)
+                await call.answer("Premium предложения отключены")
+                
+            except Exception as e:
+                logger.error(f"Error disabling premium notifications: {e}")
+        
         logger.info("WebHook handlers set up")
     
     async def _handle_registration(self, message, data):
@@ -173,6 +233,12 @@ class FlirtlyApp:
                 data.get('country')
             )
             
+            # Пол и возраст участвуют в фильтрах geo-индекса
+            previous = geo_index.entries.get(user_id)
+            old_gender = previous.gender if previous else None
+            location = (previous.lat, previous.lon) if previous else None
+            geo_index.update_attributes(user_id, data.get('gender'), data.get('age'))
+            
             # Обрабатываем фото
             photos = data.get('photos', [])
             for i, photo_url in enumerate(photos):
@@ -195,6 +261,13 @@ class FlirtlyApp:
                         user_id, interest_id
                     )
             
+            # Профиль, фото и интересы изменились - сбрасываем кэш профилей
+            # и общие пулы кандидатов, в которые пользователь попадает
+            profile_cache.invalidate(user_id, telegram_id)
+            await self.matching_engine.on_profile_changed(
+                data.get('gender'), location, old_gender, location
+            )
+            
             # Отправляем подтверждение
             await message.reply_text(
                 "🎉 <b>Регистрация завершена!</b>\n\n"
@@ -223,33 +296,21 @@ class FlirtlyApp:
                 await message.reply_text("❌ Пользователь не найден")
                 return
             
-            # Создаем лайк
-            like_query = """
-                INSERT INTO likes (from_user_id, to_user_id, action, created_at)
-                VALUES ($1, $2, 'like', NOW())
-                ON CONFLICT (from_user_id, to_user_id) DO UPDATE SET
-                    action = 'like',
-                    created_at = NOW()
-            """
-            await self.db.execute(like_query, from_user_db_id, to_user_id)
-            
-            # Проверяем взаимность
-            mutual_like = await self.db.fetchval(
-                "SELECT 1 FROM likes WHERE from_user_id = $1 AND to_user_id = $2 AND action IN ('like', 'superlike')",
-                to_user_id, from_user_db_id
+            # Лайк, проверка взаимности и матч - одним вызовом хранимой функции
+            action = 'superlike' if data.get('action') == 'superlike' else 'like'
+            result = await self.db.fetchrow(
+                "SELECT * FROM process_like($1, $2, $3)",
+                from_user_db_id, to_user_id, action
             )
             
-            if mutual_like:
-                # Создаем матч
-                match_query = """
-                    INSERT INTO matches (user1_id, user2_id, created_at)
-                    VALUES ($1, $2, NOW())
-                    ON CONFLICT (user1_id, user2_id) DO NOTHING
-                """
-                await self.db.execute(match_query, 
-                                    min(from_user_db_id, to_user_id),
-                                    max(from_user_db_id, to_user_id))
-                
+            if not result['like_created']:
+                await message.reply_text("❤️ Лайк уже отправлен")
+                return
+            
+            seen_filters.add(from_user_db_id, to_user_id)
+            elo_ratings.record_swipe(from_user_db_id, to_user_id, liked=True)
+            
+            if result['match_created']:
                 # Отправляем уведомления
                 await self.notification_service.send_match_notification(from_user_id, to_user_id)
                 await self.notification_service.send_match_notification(to_user_id, from_user_id)
@@ -290,6 +351,8 @@ class FlirtlyApp:
                         created_at = NOW()
                 """
                 await self.db.execute(skip_query, from_user_db_id, to_user_id)
+                seen_filters.add(from_user_db_id, to_user_id)
+                elo_ratings.record_swipe(from_user_db_id, to_user_id, liked=False)
             
             logger.info(f"Skip processed: {from_user_db_id} -> {to_user_id}")
             
@@ -328,13 +391,31 @@ class FlirtlyApp:
             longitude = data.get('longitude')
             city = data.get('city')
             
-            if latitude and longitude:
+            # 0.0 - допустимая координата (экватор, Гринвич)
+            if latitude is not None and longitude is not None:
                 location_query = """
                     UPDATE users 
                     SET location = ST_Point($1, $2), city = $3, updated_at = NOW()
                     WHERE telegram_id = $4
+                    RETURNING id, gender, age, is_active, is_banned
                 """
-                await self.db.execute(location_query, longitude, latitude, city, telegram_id)
+                row = await self.db.fetchrow(location_query, longitude, latitude, city, telegram_id)
+                
+                if row:
+                    profile_cache.invalidate(row['id'], telegram_id)
+                
+                # Обновляем in-memory geo-индекс; неактивных и забаненных в нем нет
+                if row and (not row['is_active'] or row['is_banned']):
+                    geo_index.remove(row['id'])
+                elif row:
+                    previous = geo_index.entries.get(row['id'])
+                    geo_index.upsert(row['id'], latitude, longitude, row['gender'], row['age'])
+                    
+                    # Пользователь уходит из пулов старой ячейки и попадает в новые
+                    await self.matching_engine.on_profile_changed(
+                        row['gender'], (latitude, longitude),
+                        row['gender'], (previous.lat, previous.lon) if previous else None
+                    )
             
             logger.info(f"Location updated for user {telegram_id}")
             
@@ -349,6 +430,7 @@ class FlirtlyApp:
             # Инициализация компонентов
             await self.initialize_database()
             await self.initialize_cache()
+            await self.initialize_geo_index()
             
             # Инициализация бота
             self.bot = FlirtlyBot(self.bot_token, self.webapp_url)
@@ -359,9 +441,18 @@ class FlirtlyApp:
             # Настройка WebHook обработчиков
             await self.setup_webhook_handlers()
             
+            # Отправители уведомлений (и повтор неотправленных с прошлого запуска)
+            await self.notification_outbox.start()
+            await notification_preferences.start()
+            await self.notification_digest.start()
+            
+            # Фоновое применение ELO-обновлений
+            await elo_ratings.start()
+            self.feature_task = asyncio.create_task(self.feature_precomputer.run_nightly())
+            
             # Запуск планировщика уведомлений
             if self.notification_scheduler:
-                asyncio.create_task(self.notification_scheduler.start())
+                self.scheduler_task = asyncio.create_task(self.notification_scheduler.start())
             
             logger.info("Flirtly App started successfully!")
             
@@ -379,11 +470,44 @@ class FlirtlyApp:
             
             if self.notification_scheduler:
                 await self.notification_scheduler.stop()
+                if self.scheduler_task:
+                    # Кампании дописывают текущую страницу и сохраняют checkpoint
+                    try:
+                        await asyncio.wait_for(self.scheduler_task, timeout=60)
+                    except Exception as e:
+                        logger.warning(f"Notification scheduler did not stop cleanly: {e!r}")
+                logger.info(f"Notification campaign metrics: {self.notification_scheduler.metrics()}")
+            
+            if self.notification_digest:
+                # Отдаем накопленные сводки в outbox до его остановки
+                logger.info(f"Notification digest metrics: {self.notification_digest.metrics()}")
+                await self.notification_digest.stop()
+            
+            if self.notification_outbox:
+                logger.info(f"Notification outbox metrics: {self.notification_outbox.metrics()}")
+                await self.notification_outbox.stop()
+            
+            logger.info(f"Notification preferences metrics: {notification_preferences.metrics()}")
+            await notification_preferences.stop()
+            
+            if self.feature_task:
+                self.feature_task.cancel()
+                await asyncio.gather(self.feature_task, return_exceptions=True)
+            
+            if self.matching_engine and self.matching_engine.candidate_cache:
+                logger.info(f"Candidate cache metrics: {self.matching_engine.candidate_cache.metrics()}")
+            
+            logger.info(f"ELO ratings metrics: {elo_ratings.metrics()}")
+            await elo_ratings.stop()
+            
+            logger.info(f"Profile cache metrics: {profile_cache.metrics()}")
+            await profile_cache.stop()
             
             if self.cache:
                 await self.cache.close()
             
             if self.db:
+                logger.info(f"Database pool metrics: {self.db.metrics()}")
                 await self.db.close()
             
             logger.info("Flirtly App stopped")
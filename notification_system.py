@@ -1,11 +1,15 @@
 # notification_system.py - Система push-уведомлений
 
-import requests
+import asyncio
 import json
-import sqlite3
 import logging
-from datetime import datetime, timedelta
-import time
+from collections import defaultdict
+from datetime import datetime
+
+import aiohttp
+import aiosqlite
+
+from src.notification_outbox import GLOBAL_RATE, TokenBucket
 
 logger = logging.getLogger(__name__)
 
@@ -13,16 +17,76 @@ BOT_TOKEN = "8430527446:AAFLoCZqvreDpsgz4d5z4J5LXMLC42B9ex0"
 BASE_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
 DB_PATH = "flirtly.db"
 
+# Одновременных запросов к Bot API
+CONCURRENCY = 10
+
+# Уведомлений в одном пакетном INSERT и пользователей в одной пачке рассылки
+BATCH_SIZE = 500
+
+# Не дольше этого (секунды) отправленные уведомления ждут записи в БД
+FLUSH_INTERVAL = 2.0
+
+# Попыток на сообщение, если Telegram ответил 429
+MAX_ATTEMPTS = 3
+
 class NotificationSystem:
-    def __init__(self):
-        self.init_database()
+    """
+    Асинхронная отправка уведомлений
+
+    Одна keep-alive сессия aiohttp (без TLS-рукопожатия на каждое сообщение)
+    и одно долгоживущее соединение aiosqlite. Отправленные уведомления
+    копятся и пишутся в notifications пакетным INSERT; одновременных
+    запросов к Telegram не больше CONCURRENCY, темп - в пределах лимита Bot API.
+
+        async with NotificationSystem() as notification_system:
+            await notification_system.send_bulk_notification(user_ids, title, message)
+    """
+    
+    def __init__(self, db_path=DB_PATH, concurrency=CONCURRENCY):
+        self.db_path = db_path
+        self.concurrency = concurrency
+        self.db = None
+        self.session = None
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rate = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        
+        # Отправленные, но еще не записанные уведомления
+        self.pending = []
+        self.flush_lock = asyncio.Lock()
+        self.flush_task = None
+        self.flush_handle = None
     
-    def init_database(self):
+    async def open(self):
+        """Открытие соединения с БД и HTTP-сессии (повторный вызов ничего не делает)"""
+        if self.db is None:
+            self.db = await aiosqlite.connect(self.db_path)
+            await self.init_database()
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+    
+    async def close(self):
+        """Запись накопленных уведомлений и закрытие соединений"""
+        if self.db is not None:
+            await self.flush()
+            await self.db.close()
+            self.db = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+    
+    async def __aenter__(self):
+        await self.open()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    async def init_database(self):
         """Инициализация таблицы уведомлений"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        await self.db.execute('''
             CREATE TABLE IF NOT EXISTS notifications (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
@@ -36,58 +100,28 @@ class NotificationSystem:
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
         ''')
-        
-        conn.commit()
-        conn.close()
+        await self.db.commit()
     
-    def send_notification(self, user_id, notification_type, title, message, data=None):
+    async def send_notification(self, user_id, notification_type, title, message, data=None):
         """Отправка уведомления пользователю"""
         try:
-            # Получаем telegram_id пользователя
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("SELECT telegram_id FROM users WHERE id = ?", (user_id,))
-            result = cursor.fetchone()
+            await self.open()
             
-            if not result:
+            # Получаем telegram_id пользователя
+            telegram_ids = await self._get_telegram_ids([user_id])
+            if user_id not in telegram_ids:
                 logger.error(f"User {user_id} not found")
                 return False
             
-            telegram_id = result[0]
-            
-            # Создаем клавиатуру в зависимости от типа уведомления
-            keyboard = self._create_keyboard(notification_type, data)
-            
-            # Отправляем сообщение
-            url = f"{BASE_URL}/sendMessage"
-            payload = {
-                "chat_id": telegram_id,
-                "text": f"🔔 <b>{title}</b>\n\n{message}",
-                "parse_mode": "HTML"
-            }
-            
-            if keyboard:
-                payload["reply_markup"] = json.dumps(keyboard)
-            
-            response = requests.post(url, json=payload)
-            
-            if response.json().get("ok"):
-                # Сохраняем уведомление в БД
-                self._save_notification(user_id, notification_type, title, message, data)
-                logger.info(f"Notification sent to user {user_id} ({telegram_id})")
-                return True
-            else:
-                logger.error(f"Failed to send notification: {response.json()}")
-                return False
+            return await self._deliver(user_id, telegram_ids[user_id], notification_type, title, message, data)
                 
         except Exception as e:
             logger.error(f"Error sending notification: {e}")
             return False
-        finally:
-            conn.close()
     
     def _create_keyboard(self, notification_type, data):
         """Создание клавиатуры для уведомления"""
+        data = data or {}  # premium/activity/boost/custom приходят без data
         keyboards = {
             'match': {
                 "inline_keyboard": [
@@ -123,19 +157,33 @@ class NotificationSystem:
         return keyboards.get(notification_type)
     
     def _save_notification(self, user_id, notification_type, title, message, data):
-        """Сохранение уведомления в БД"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO notifications (user_id, type, title, message, data, is_sent, sent_at)
-            VALUES (?, ?, ?, ?, ?, 1, CURRENT_TIMESTAMP)
-        ''', (user_id, notification_type, title, message, json.dumps(data) if data else None))
-        
-        conn.commit()
-        conn.close()
+        """Сохранение уведомления в БД (пакетом, см. flush)"""
+        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')  # как CURRENT_TIMESTAMP
+        self.pending.append(
+            (user_id, notification_type, title, message, json.dumps(data) if data else None, now, now)
+        )
+        self._maybe_flush()
+    
+    async def flush(self):
+        """Запись накопленных уведомлений одним пакетным INSERT"""
+        async with self.flush_lock:
+            if self.flush_handle:
+                self.flush_handle.cancel()
+                self.flush_handle = None
+            if not self.pending or self.db is None:
+                return
+            
+            rows, self.pending = self.pending, []
+            try:
+                await self.db.executemany('''
+                    INSERT INTO notifications (user_id, type, title, message, data, is_sent, sent_at, created_at)
+                    VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+                ''', rows)
+                await self.db.commit()
+            except Exception as e:
+                logger.error(f"Error saving {len(rows)} notifications: {e}")
     
-    def send_match_notification(self, user_id, partner_name, partner_age, match_id):
+    async def send_match_notification(self, user_id, partner_name, partner_age, match_id):
         """Уведомление о новом матче"""
         title = "🎉 Новый матч!"
         message = f"{partner_name}, {partner_age} тоже лайкнул(а) тебя!\n\nЭто взаимная симпатия! Начните общаться!"
@@ -146,9 +194,9 @@ class NotificationSystem:
             'partner_age': partner_age
         }
         
-        return self.send_notification(user_id, 'match', title, message, data)
+        return await self.send_notification(user_id, 'match', title, message, data)
     
-    def send_like_notification(self, user_id, liker_name, liker_age, liker_id):
+    async def send_like_notification(self, user_id, liker_name, liker_age, liker_id):
         """Уведомление о лайке"""
         title = "❤️ Кто-то лайкнул твой профиль!"
         message = f"{liker_name}, {liker_age} понравился твой профиль!\n\nЛайкни в ответ и получи матч!"
@@ -159,9 +207,9 @@ class NotificationSystem:
             'liker_age': liker_age
         }
         
-        return self.send_notification(user_id, 'like', title, message, data)
+        return await self.send_notification(user_id, 'like', title, message, data)
     
-    def send_message_notification(self, user_id, sender_name, message_preview, match_id):
+    async def send_message_notification(self, user_id, sender_name, message_preview, match_id):
         """Уведомление о новом сообщении"""
         title = f"💬 Новое сообщение от {sender_name}"
         message = f"{message_preview[:100]}{'...' if len(message_preview) > 100 else ''}\n\nОтвечай быстро для лучшего общения!"
@@ -171,17 +219,26 @@ class NotificationSystem:
             'sender_name': sender_name
         }
         
-        return self.send_notification(user_id, 'message', title, message, data)
+        return await self.send_notification(user_id, 'message', title, message, data)
     
-    def send_premium_offer_notification(self, user_id):
+    async def send_premium_offer_notification(self, user_id):
         """Уведомление о предложении Premium"""
         title = "⭐ Специальное предложение!"
         message = "Первая неделя Premium - БЕСПЛАТНО! 🎁\n\n• Безлимитные лайки ❤️\n• 5 суперлайков в день ⚡\n• Расширенные фильтры 🔍\n• Видеть кто лайкнул 👀\n\nОграниченное время! Активируй сейчас!"
         
-        return self.send_notification(user_id, 'premium', title, message)
+        return await self.send_notification(user_id, 'premium', title, message)
     
-    def send_activity_reminder(self, user_id, days_inactive):
+    async def send_activity_reminder(self, user_id, days_inactive):
         """Напоминание об активности"""
+        reminder = self.activity_reminder(days_inactive)
+        if reminder is None:
+            return False
+        
+        title, message = reminder
+        return await self.send_notification(user_id, 'activity', title, message)
+    
+    def activity_reminder(self, days_inactive):
+        """(title, message) напоминания после days_inactive дней; None - в этот день не напоминаем"""
         if days_inactive == 1:
             title = "💔 Мы скучаем!"
             message = "Ты не заходил в Flirtly целый день.\n\nВозможно, кто-то уже лайкнул твой профиль! Проверь прямо сейчас!"
@@ -192,96 +249,160 @@ class NotificationSystem:
             title = "💌 Долго не виделись!"
             message = "Прошла целая неделя без тебя в Flirtly.\n\nЗа это время:\n• +50 новых пользователей в твоем городе\n• 12 потенциальных матчей\n• 5 лайков на твой профиль\n\nНе упускай шанс найти любовь!"
         else:
-            return False
+            return None
         
-        return self.send_notification(user_id, 'activity', title, message)
+        return title, message
     
-    def send_boost_notification(self, user_id):
+    async def send_boost_notification(self, user_id):
         """Уведомление о доступном бусте"""
         title = "🚀 Буст профиля доступен!"
         message = "Получи в 10 раз больше просмотров на 30 минут!\n\n• Твой профиль будет показан первым\n• Больше лайков и матчей\n• Приоритет в рекомендациях\n\nИспользуй буст и найди больше матчей!"
         
-        return self.send_notification(user_id, 'boost', title, message)
+        return await self.send_notification(user_id, 'boost', title, message)
     
-    def send_custom_notification(self, user_id, title, message):
+    async def send_custom_notification(self, user_id, title, message):
         """Отправка кастомного уведомления"""
-        return self.send_notification(user_id, 'custom', title, message)
+        return await self.send_notification(user_id, 'custom', title, message)
     
-    def send_bulk_notification(self, user_ids, title, message, notification_type='custom'):
+    async def send_bulk_notification(self, user_ids, title, message, notification_type='custom'):
         """Массовая рассылка уведомлений"""
+        await self.open()
+        user_ids = list(user_ids)
         success_count = 0
         
-        for user_id in user_ids:
-            if self.send_notification(user_id, notification_type, title, message):
-                success_count += 1
-            time.sleep(0.1)  # Задержка между отправками
+        # Пачками: один запрос telegram_id на пачку, отправка параллельно (не больше CONCURRENCY)
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            batch = user_ids[start:start + BATCH_SIZE]
+            telegram_ids = await self._get_telegram_ids(batch)
+            
+            async def send(user_id):
+                if user_id not in telegram_ids:
+                    logger.error(f"User {user_id} not found")
+                    return False
+                try:
+                    return await self._deliver(user_id, telegram_ids[user_id], notification_type, title, message)
+                except Exception as e:
+                    logger.error(f"Error sending notification: {e}")
+                    return False
+            
+            results = await asyncio.gather(*(send(user_id) for user_id in batch))
+            success_count += sum(results)
         
         logger.info(f"Bulk notification sent: {success_count}/{len(user_ids)}")
         return success_count
     
-    def get_notification_history(self, user_id, limit=50):
+    async def get_notification_history(self, user_id, limit=50):
         """Получение истории уведомлений пользователя"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        await self.open()
+        await self.flush()
         
-        cursor.execute('''
+        async with self.db.execute('''
             SELECT type, title, message, is_sent, sent_at, created_at
             FROM notifications
             WHERE user_id = ?
             ORDER BY created_at DESC
             LIMIT ?
-        ''', (user_id, limit))
-        
-        notifications = cursor.fetchall()
-        conn.close()
+        ''', (user_id, limit)) as cursor:
+            notifications = await cursor.fetchall()
         
         return notifications
     
-    def mark_notification_as_read(self, notification_id):
+    async def mark_notification_as_read(self, notification_id):
         """Отметить уведомление как прочитанное"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        await self.open()
+        await self.flush()
         
-        cursor.execute('''
+        await self.db.execute('''
             UPDATE notifications
             SET is_read = 1, read_at = CURRENT_TIMESTAMP
             WHERE id = ?
         ''', (notification_id,))
-        
-        conn.commit()
-        conn.close()
+        await self.db.commit()
     
-    def get_unread_notifications_count(self, user_id):
+    async def get_unread_notifications_count(self, user_id):
         """Получение количества непрочитанных уведомлений"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        await self.open()
+        await self.flush()
         
-        cursor.execute('''
+        async with self.db.execute('''
             SELECT COUNT(*) FROM notifications
             WHERE user_id = ? AND is_sent = 1 AND (is_read = 0 OR is_read IS NULL)
-        ''', (user_id,))
-        
-        count = cursor.fetchone()[0]
-        conn.close()
+        ''', (user_id,)) as cursor:
+            count = (await cursor.fetchone())[0]
         
         return count
     
-    def cleanup_old_notifications(self, days=30):
+    async def cleanup_old_notifications(self, days=30):
         """Очистка старых уведомлений"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        await self.open()
+        await self.flush()
         
-        cursor.execute('''
+        cursor = await self.db.execute('''
             DELETE FROM notifications
             WHERE created_at < datetime('now', '-{} days')
         '''.format(days))
         
         deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
+        await self.db.commit()
         
         logger.info(f"Cleaned up {deleted_count} old notifications")
         return deleted_count
+    
+    async def _get_telegram_ids(self, user_ids):
+        """{user_id: telegram_id} одним запросом"""
+        placeholders = ", ".join("?" * len(user_ids))
+        async with self.db.execute(
+            f"SELECT id, telegram_id FROM users WHERE id IN ({placeholders})", list(user_ids)
+        ) as cursor:
+            return {row[0]: row[1] for row in await cursor.fetchall()}
+    
+    async def _deliver(self, user_id, telegram_id, notification_type, title, message, data=None):
+        """Отправка через общую сессию с учетом лимитов Bot API"""
+        # Создаем клавиатуру в зависимости от типа уведомления
+        keyboard = self._create_keyboard(notification_type, data)
+        
+        payload = {
+            "chat_id": telegram_id,
+            "text": f"🔔 <b>{title}</b>\n\n{message}",
+            "parse_mode": "HTML"
+        }
+        
+        if keyboard:
+            payload["reply_markup"] = json.dumps(keyboard)
+        
+        for _ in range(MAX_ATTEMPTS):
+            async with self.semaphore:
+                await asyncio.sleep(self.rate.reserve())
+                async with self.session.post(f"{BASE_URL}/sendMessage", json=payload) as response:
+                    result = await response.json()
+            
+            if result.get("ok"):
+                # Сохраняем уведомление в БД
+                self._save_notification(user_id, notification_type, title, message, data)
+                logger.info(f"Notification sent to user {user_id} ({telegram_id})")
+                return True
+            
+            retry_after = result.get("parameters", {}).get("retry_after")
+            if not retry_after:
+                break
+            # Flood control: притормаживаем все отправки
+            self.rate.pause(retry_after)
+        
+        logger.error(f"Failed to send notification: {result}")
+        return False
+    
+    def _maybe_flush(self):
+        loop = asyncio.get_running_loop()
+        if len(self.pending) >= BATCH_SIZE:
+            if not self.flush_task or self.flush_task.done():
+                self.flush_task = loop.create_task(self.flush())
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(FLUSH_INTERVAL, self._flush_later)
+    
+    def _flush_later(self):
+        self.flush_handle = None
+        if not self.flush_task or self.flush_task.done():
+            self.flush_task = asyncio.get_running_loop().create_task(self.flush())
 
 # Scheduler для автоматических уведомлений
 class NotificationScheduler:
@@ -289,63 +410,76 @@ class NotificationScheduler:
         self.notification_system = NotificationSystem()
         self.running = False
     
-    def start(self):
+    async def start(self):
         """Запуск планировщика"""
         self.running = True
+        await self.notification_system.open()
         logger.info("Notification scheduler started")
         
-        while self.running:
-            try:
-                self._send_daily_notifications()
-                time.sleep(3600)  # Проверяем каждый час
-            except Exception as e:
-                logger.error(f"Error in notification scheduler: {e}")
-                time.sleep(300)  # Ждем 5 минут при ошибке
+        try:
+            while self.running:
+                try:
+                    await self._send_daily_notifications()
+                    await asyncio.sleep(3600)  # Проверяем каждый час
+                except Exception as e:
+                    logger.error(f"Error in notification scheduler: {e}")
+                    await asyncio.sleep(300)  # Ждем 5 минут при ошибке
+        finally:
+            await self.notification_system.close()
     
     def stop(self):
         """Остановка планировщика"""
         self.running = False
         logger.info("Notification scheduler stopped")
     
-    def _send_daily_notifications(self):
+    async def _send_daily_notifications(self):
         """Отправка ежедневных уведомлений"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        db = self.notification_system.db
         
         # Неактивные пользователи
-        cursor.execute('''
+        async with db.execute('''
             SELECT id, name, last_active FROM users
             WHERE is_active = 1 AND last_active < datetime('now', '-1 day')
-        ''')
-        
-        inactive_users = cursor.fetchall()
+        ''') as cursor:
+            inactive_users = await cursor.fetchall()
         
+        # Одно напоминание на группу по дням неактивности: рассылка пачками по BATCH_SIZE
+        groups = defaultdict(list)
+        now = datetime.now()
         for user_id, name, last_active in inactive_users:
-            days_inactive = (datetime.now() - datetime.strptime(last_active, '%Y-%m-%d %H:%M:%S')).days
-            self.notification_system.send_activity_reminder(user_id, days_inactive)
+            days_inactive = (now - datetime.strptime(last_active, '%Y-%m-%d %H:%M:%S')).days
+            groups[days_inactive].append(user_id)
+        
+        for days_inactive, user_ids in groups.items():
+            reminder = self.notification_system.activity_reminder(days_inactive)
+            if reminder is None:
+                continue
+            title, message = reminder
+            await self.notification_system.send_bulk_notification(user_ids, title, message, 'activity')
         
         # Пользователи без Premium
-        cursor.execute('''
+        async with db.execute('''
             SELECT id FROM users
             WHERE is_active = 1 AND (is_premium = 0 OR premium_until < datetime('now'))
             ORDER BY RANDOM()
             LIMIT 10
-        ''')
+        ''') as cursor:
+            free_users = [row[0] for row in await cursor.fetchall()]
         
-        free_users = [row[0] for row in cursor.fetchall()]
-        
-        for user_id in free_users:
+        await asyncio.gather(*(
             self.notification_system.send_premium_offer_notification(user_id)
-        
-        conn.close()
+            for user_id in free_users
+        ))
 
-if __name__ == "__main__":
+async def main():
     # Тестирование системы уведомлений
-    notification_system = NotificationSystem()
-    
-    # Пример отправки уведомления
-    notification_system.send_match_notification(1, "Анна", 25, 1)
-    notification_system.send_like_notification(1, "Михаил", 28, 2)
-    notification_system.send_message_notification(1, "Елена", "Привет! Как дела?", 1)
+    async with NotificationSystem() as notification_system:
+        # Пример отправки уведомления
+        await notification_system.send_match_notification(1, "Анна", 25, 1)
+        await notification_system.send_like_notification(1, "Михаил", 28, 2)
+        await notification_system.send_message_notification(1, "Елена", "Привет! Как дела?", 1)
     
     print("Notification system test completed")
+
+if __name__ == "__main__":
+    asyncio.run(main())
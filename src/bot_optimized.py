@@ -3,12 +3,21 @@
 import asyncio
 import logging
 import json
+import os
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database import init_db
-from src.db_utils import DatabaseManager
+from src.db_utils import DatabaseManager, after_commit, commit_unit_of_work
+from src.db_middleware import DbSessionMiddleware
+from src.candidate_queue import CandidateQueue
+from src.seen_filter import seen_filters
+from src.write_behind import write_behind
+from src.user_stats import user_stats
+from src.cache_service import CacheService
+from src.profile_cache import profile_cache
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +31,18 @@ WEBAPP_URL = "https://vlamay.github.io/flirtly-webapp/"
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 
+# One database session per update; handlers commit before sending messages
+dp.update.outer_middleware(DbSessionMiddleware())
+
+
+async def potential_matches_source(user_id: int, limit: int):
+    """Candidate source for the swipe queue (rank-based scores)"""
+    users = await DatabaseManager.get_potential_matches(user_id, limit)
+    return [(candidate.id, 1.0 - i / len(users)) for i, candidate in enumerate(users)]
+
+
+candidate_queue = CandidateQueue(potential_matches_source)
+
 
 def get_main_keyboard() -> InlineKeyboardMarkup:
     """Main keyboard with Web App"""
@@ -44,20 +65,21 @@ def get_main_keyboard() -> InlineKeyboardMarkup:
 
 
 @dp.message(Command("start"))
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, session: AsyncSession):
     """Start command with referral handling and user management"""
     telegram_id = message.from_user.id
     username = message.from_user.username
     
     # Get or create user
-    user = await DatabaseManager.get_or_create_user(telegram_id, username)
+    user = await DatabaseManager.get_or_create_user(telegram_id, username, session)
     
     # Handle referral
     args = message.text.split()
     if len(args) > 1 and args[1].startswith("ref_"):
         try:
             referrer_telegram_id = int(args[1].replace("ref_", ""))
-            result = await DatabaseManager.process_referral(referrer_telegram_id, user.id)
+            result = await DatabaseManager.process_referral(referrer_telegram_id, user.id, session)
+            await commit_unit_of_work(session)
             
             if result['success']:
                 # Notify referrer
@@ -98,7 +120,7 @@ async def cmd_start(message: Message):
         """.strip()
     else:
         # Existing user with profile
-        stats = await DatabaseManager.get_user_stats(user.id)
+        stats = await DatabaseManager.get_user_stats(user.id, session)
         welcome_text = f"""
 <b>С возвращением, {user.name}! 👋</b>
 
@@ -119,21 +141,20 @@ async def cmd_start(message: Message):
 
 
 @dp.message(F.web_app_data)
-async def handle_webapp_data(message: Message):
+async def handle_webapp_data(message: Message, session: AsyncSession):
     """Handle data from Web App with optimized database operations"""
     try:
         data = json.loads(message.web_app_data.data)
         action = data.get('action')
         telegram_id = message.from_user.id
         
-        user = await DatabaseManager.get_user_by_telegram_id(telegram_id)
-        if not user:
-            user = await DatabaseManager.get_or_create_user(telegram_id, message.from_user.username)
+        user = await DatabaseManager.get_or_create_user(telegram_id, message.from_user.username, session)
         
         if action == 'register':
             # Handle registration with all profile data
             success = await DatabaseManager.update_user_profile(
                 telegram_id,
+                session,
                 name=data.get('name'),
                 age=data.get('age'),
                 gender=data.get('gender'),
@@ -147,6 +168,8 @@ async def handle_webapp_data(message: Message):
             )
             
             if success:
+                after_commit(session, lambda: candidate_queue.on_preferences_changed(user.id))
+                await commit_unit_of_work(session)
                 await message.answer(
                     f"🎉 <b>Регистрация завершена!</b>\n\n"
                     f"Добро пожаловать, {data.get('name')}!\n\n"
@@ -162,7 +185,7 @@ async def handle_webapp_data(message: Message):
             is_super_like = (action == 'superlike')
             
             # Check limits
-            if user.daily_likes_remaining <= 0:
+            if await DatabaseManager.daily_likes_remaining(user, session) <= 0:
                 await message.answer(
                     "😔 <b>Лимит лайков исчерпан!</b>\n\n"
                     "Получи Premium для безлимитных лайков!",
@@ -170,45 +193,45 @@ async def handle_webapp_data(message: Message):
                 )
                 return
             
-            # Create like
-            like = await DatabaseManager.create_like(
+            # Like, mutual check and match creation in one transaction
+            result = await DatabaseManager.process_like(
                 user.id,
                 profile_id,
-                is_super_like
+                is_super_like,
+                session
             )
+            # Release the like's locks before any Telegram call
+            await commit_unit_of_work(session)
             
-            if like:
-                # Check for mutual like (match)
-                is_mutual = await DatabaseManager.check_mutual_like(user.id, profile_id)
+            if result['created']:
+                candidate_queue.on_like(user.id, profile_id)
                 
-                if is_mutual:
-                    # Create match
-                    match = await DatabaseManager.create_match(user.id, profile_id)
+                if result['is_match']:
+                    candidate_queue.on_match(user.id, profile_id)
+                    
+                    # Get matched user info
+                    matched_user = await DatabaseManager.get_user_by_id(profile_id, session)
                     
-                    if match:
-                        # Get matched user info
-                        matched_user = await DatabaseManager.get_user_by_telegram_id(profile_id)
-                        
-                        await message.answer(
-                            f"🎉 <b>Это Match!</b>\n\n"
-                            f"Вы понравились друг другу с {matched_user.name if matched_user else 'пользователем'}!\n\n"
-                            f"Теперь можете начать общаться! 💬",
-                            parse_mode="HTML"
-                        )
-                        
-                        # Notify matched user
-                        if matched_user:
-                            try:
-                                await bot.send_message(
-                                    matched_user.telegram_id,
-                                    f"🎉 <b>Новое совпадение!</b>\n\n"
-                                    f"Вы понравились друг другу с {user.name}!\n\n"
-                                    f"Открой Flirtly и начни общаться! 💬",
-                                    parse_mode="HTML",
-                                    reply_markup=get_main_keyboard()
-                                )
-                            except:
-                                pass
+                    await message.answer(
+                        f"🎉 <b>Это Match!</b>\n\n"
+                        f"Вы понравились друг другу с {matched_user.name if matched_user else 'пользователем'}!\n\n"
+                        f"Теперь можете начать общаться! 💬",
+                        parse_mode="HTML"
+                    )
+                    
+                    # Notify matched user
+                    if matched_user:
+                        try:
+                            await bot.send_message(
+                                matched_user.telegram_id,
+                                f"🎉 <b>Новое совпадение!</b>\n\n"
+                                f"Вы понравились друг другу с {user.name}!\n\n"
+                                f"Открой Flirtly и начни общаться! 💬",
+                                parse_mode="HTML",
+                                reply_markup=get_main_keyboard()
+                            )
+                        except:
+                            pass
                 else:
                     emoji = "⭐" if is_super_like else "❤️"
                     await message.answer(f"{emoji} Лайк отправлен!")
@@ -217,7 +240,9 @@ async def handle_webapp_data(message: Message):
         
         elif action == 'skip':
             profile_id = data.get('profile_id')
-            await DatabaseManager.create_skip(user.id, profile_id)
+            await DatabaseManager.create_skip(user.id, profile_id, session)
+            await commit_unit_of_work(session)
+            candidate_queue.on_skip(user.id, profile_id)
             await message.answer("👎 Пропущено")
         
     except Exception as e:
@@ -226,15 +251,15 @@ async def handle_webapp_data(message: Message):
 
 
 @dp.callback_query(F.data == "profile")
-async def callback_profile(callback):
+async def callback_profile(callback, session: AsyncSession):
     """Show detailed profile information"""
-    user = await DatabaseManager.get_user_by_telegram_id(callback.from_user.id)
+    user = await DatabaseManager.get_user_by_telegram_id(callback.from_user.id, session)
     
     if not user or not user.name:
         await callback.answer("Сначала создай профиль!", show_alert=True)
         return
     
-    stats = await DatabaseManager.get_user_stats(user.id)
+    stats = await DatabaseManager.get_user_stats(user.id, session)
     
     profile_text = f"""
 👤 <b>Твой профиль</b>
@@ -269,15 +294,15 @@ async def callback_profile(callback):
 
 
 @dp.callback_query(F.data == "matches")
-async def callback_matches(callback):
+async def callback_matches(callback, session: AsyncSession):
     """Show user matches"""
-    user = await DatabaseManager.get_user_by_telegram_id(callback.from_user.id)
+    user = await DatabaseManager.get_user_by_telegram_id(callback.from_user.id, session)
     
     if not user:
         await callback.answer("Ошибка", show_alert=True)
         return
     
-    matches = await DatabaseManager.get_user_matches(user.id)
+    matches = await DatabaseManager.get_user_matches(user.id, limit=10, session=session)
     
     if not matches:
         await callback.message.edit_text(
@@ -290,13 +315,14 @@ async def callback_matches(callback):
             ])
         )
     else:
-        text = f"💕 <b>Твои совпадения ({len(matches)})</b>\n\n"
+        total = await DatabaseManager.count_user_matches(user.id, session)
+        text = f"💕 <b>Твои совпадения ({total})</b>\n\n"
         
-        for match in matches[:10]:  # Show first 10 matches
+        for match in matches:  # First page (10 newest matches)
             text += f"• {match['user'].name}, {match['user'].age}\n"
         
-        if len(matches) > 10:
-            text += f"\n... и еще {len(matches) - 10} совпадений"
+        if total > len(matches):
+            text += f"\n... и еще {total - len(matches)} совпадений"
         
         await callback.message.edit_text(
             text,
@@ -310,16 +336,16 @@ async def callback_matches(callback):
 
 
 @dp.callback_query(F.data == "referral")
-async def callback_referral(callback):
+async def callback_referral(callback, session: AsyncSession):
     """Show referral program"""
-    user = await DatabaseManager.get_user_by_telegram_id(callback.from_user.id)
+    user = await DatabaseManager.get_user_by_telegram_id(callback.from_user.id, session)
     
     if not user:
         await callback.answer("Ошибка", show_alert=True)
         return
     
     ref_link = f"https://t.me/FFlirtly_bot?start=ref_{user.telegram_id}"
-    stats = await DatabaseManager.get_referral_stats(user.id)
+    stats = await DatabaseManager.get_referral_stats(user.id, session)
     
     await callback.message.edit_text(
         f"🎁 <b>Реферальная программа</b>\n\n"
@@ -393,11 +419,36 @@ async def main():
     logger.info("Initializing optimized database...")
     await init_db()
     
+    indexed = await DatabaseManager.load_geo_index()
+    logger.info(f"Geo index warmed with {indexed} users")
+    
+    # One-time rollup build for databases created before user_daily_stats
+    await user_stats.backfill()
+    
     logger.info("Starting Flirtly Bot with optimized database operations...")
     
+    # Shared L2 for the profile cache; in-process only when REDIS_URL is unset
+    cache = CacheService(os.getenv("REDIS_URL"))
+    await cache.connect()
+    profile_cache.attach(cache)
+    await profile_cache.start()
+    
+    await candidate_queue.start()
+    await write_behind.start()
+    seen_flusher = asyncio.create_task(seen_filters.run_flusher())
+    
     try:
         await dp.start_polling(bot)
     finally:
+        logger.info(f"Candidate queue metrics: {candidate_queue.metrics()}")
+        await candidate_queue.stop()
+        seen_flusher.cancel()
+        await seen_filters.flush()
+        await write_behind.stop()
+        logger.info(f"Write-behind metrics: {write_behind.metrics()}")
+        logger.info(f"Profile cache metrics: {profile_cache.metrics()}")
+        await profile_cache.stop()
+        await cache.close()
         await bot.session.close()
 
 
@@ -0,0 +1,264 @@
+# src/cache_service.py - Redis cache with in-process LRU+TTL fallback
+
+import asyncio
+import base64
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # JSON serialization when msgpack is not installed
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# How long to serve from the local store after a Redis error before retrying
+REDIS_RETRY_SECONDS = 30
+
+# Keys deleted while Redis was unreachable, remembered for replay (oldest dropped first)
+MAX_MISSED_DELETES = 100_000
+
+# Keys per DEL when replaying
+REPLAY_BATCH = 1000
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, bytes):  # JSON only; msgpack packs bytes natively
+        return {'__bytes__': base64.b64encode(value).decode()}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _decode(value: Dict) -> Any:
+    if '__datetime__' in value:
+        return datetime.fromisoformat(value['__datetime__'])
+    if '__bytes__' in value:
+        return base64.b64decode(value['__bytes__'])
+    return value
+
+
+def serialize(value: Any) -> bytes:
+    if msgpack is not None:
+        return msgpack.packb(value, use_bin_type=True, default=_encode)
+    return json.dumps(value, default=_encode).encode()
+
+
+def deserialize(data: bytes) -> Any:
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False, object_hook=_decode)
+    return json.loads(data, object_hook=_decode)
+
+
+class LocalCache:
+    """Bounded in-process LRU store with per-key expiry"""
+
+    def __init__(self, max_items: int = 10000):
+        self.max_items = max_items
+        self.items: 'OrderedDict[str, Tuple[Optional[float], bytes]]' = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.items.get(key)
+        if entry is None:
+            return None
+        expires, data = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.items[key]
+            return None
+        self.items.move_to_end(key)
+        return data
+
+    def set(self, key: str, data: bytes, ttl: Optional[float] = None):
+        expires = time.monotonic() + ttl if ttl else None
+        self.items[key] = (expires, data)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def delete(self, key: str):
+        self.items.pop(key, None)
+
+
+class CacheService:
+    """
+    Namespaced key/value cache with TTLs
+
+    Backed by Redis when it is reachable; otherwise (or while Redis is
+    failing) by a bounded in-process LRU+TTL store, so callers always get
+    the same get/set(ttl=)/exists contract. Values are msgpack-serialized.
+    Keys deleted while Redis is failing are remembered and deleted from
+    Redis before it is used again, so invalidations made during an outage
+    do not leave stale entries behind.
+    """
+
+    def __init__(self, redis_url: Optional[str] = None, namespace: str = "flirtly",
+                 max_local_items: int = 10000):
+        self.redis_url = redis_url
+        self.namespace = namespace
+        self.redis = None
+        self.local = LocalCache(max_local_items)
+        self.redis_down_until = 0.0
+        self.missed_deletes: 'OrderedDict[str, None]' = OrderedDict()
+        self.missed_deletes_dropped = 0
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._redis_available() else "memory"
+
+    async def connect(self):
+        """Connect to Redis; falls back to the local store if unavailable"""
+        if not self.redis_url:
+            logger.info("Cache: no Redis URL, using in-process store")
+            return
+
+        try:
+            import redis.asyncio as redis
+
+            self.redis = redis.from_url(self.redis_url)
+            await self.redis.ping()
+            logger.info("Cache: Redis connected")
+        except Exception as e:
+            logger.warning(f"Cache: Redis not available ({e}), using in-process store")
+            self.redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    async def close(self):
+        if self.redis:
+            await self.redis.close()
+
+    async def get(self, key: str) -> Any:
+        data = await self._call('get', self._key(key), local=lambda: self.local.get(self._key(key)))
+        return deserialize(data) if data is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        data = serialize(value)
+        await self._call('set', self._key(key), data, ex=ttl,
+                         local=lambda: self.local.set(self._key(key), data, ttl))
+
+    async def exists(self, key: str) -> bool:
+        result = await self._call('exists', self._key(key),
+                                  local=lambda: self.local.get(self._key(key)) is not None)
+        return bool(result)
+
+    async def delete(self, *keys: str):
+        if not keys:
+            return
+        full_keys = [self._key(key) for key in keys]
+
+        def delete_local():
+            for full_key in full_keys:
+                self.local.delete(full_key)
+            if self.redis is not None:
+                self._remember_deletes(full_keys)
+
+        await self._call('delete', *full_keys, local=delete_local)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Values for the keys that are present (one MGET round trip)"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        full_keys = [self._key(key) for key in keys]
+
+        values = await self._call('mget', full_keys,
+                                  local=lambda: [self.local.get(k) for k in full_keys])
+        return {key: deserialize(data) for key, data in zip(keys, values) if data is not None}
+
+    async def set_many(self, mapping: Dict[str, Any], ttl: Optional[int] = None):
+        """Set several keys with the same TTL (one pipelined round trip)"""
+        if not mapping:
+            return
+        items = [(self._key(key), serialize(value)) for key, value in mapping.items()]
+
+        if await self._redis_ready():
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for full_key, data in items:
+                        pipe.set(full_key, data, ex=ttl)
+                    await pipe.execute()
+                return
+            except Exception as e:
+                self._redis_failed(e)
+
+        for full_key, data in items:
+            self.local.set(full_key, data, ttl)
+
+    async def publish(self, channel: str, message: Any):
+        """Broadcast to other processes (no-op without Redis)"""
+        if await self._redis_ready():
+            try:
+                await self.redis.publish(self._key(channel), serialize(message))
+            except Exception as e:
+                self._redis_failed(e)
+
+    async def listen(self, channel: str, callback: Callable[[Any], Awaitable[None]]):
+        """Run callback for every message published on channel (background task)"""
+        if self.redis is None:
+            return
+
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(self._key(channel))
+                async for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        await callback(deserialize(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache: subscription to {channel} lost ({e}), resubscribing")
+                await asyncio.sleep(REDIS_RETRY_SECONDS)
+
+    # ===================================
+    # PRIVATE METHODS
+    # ===================================
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self.redis_down_until
+
+    def _redis_failed(self, error: Exception):
+        logger.warning(f"Cache: Redis error ({error}), using in-process store "
+                       f"for {REDIS_RETRY_SECONDS}s")
+        self.redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    async def _redis_ready(self) -> bool:
+        """Redis is usable, after replaying the deletes it missed"""
+        if not self._redis_available():
+            return False
+        while self.missed_deletes:
+            batch = list(self.missed_deletes)[:REPLAY_BATCH]
+            try:
+                await self.redis.delete(*batch)
+            except Exception as e:
+                self._redis_failed(e)
+                return False
+            for full_key in batch:
+                self.missed_deletes.pop(full_key, None)
+            if not self.missed_deletes:
+                logger.info("Cache: replayed deletes missed during the Redis outage")
+        return True
+
+    def _remember_deletes(self, full_keys):
+        for full_key in full_keys:
+            self.missed_deletes[full_key] = None
+            self.missed_deletes.move_to_end(full_key)
+        while len(self.missed_deletes) > MAX_MISSED_DELETES:
+            self.missed_deletes.popitem(last=False)
+            self.missed_deletes_dropped += 1
+            if self.missed_deletes_dropped == 1:
+                logger.warning("Cache: too many deletes during the Redis outage, "
+                               "the oldest will only expire by TTL")
+
+    async def _call(self, command: str, *args, local, **kwargs):
+        if await self._redis_ready():
+            try:
+                return await getattr(self.redis, command)(*args, **kwargs)
+            except Exception as e:
+                self._redis_failed(e)
+        return local()
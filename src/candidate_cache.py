@@ -0,0 +1,157 @@
+# src/candidate_cache.py - Shared candidate pools keyed by filter signature
+
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src.geo_index import KM_PER_DEGREE
+
+logger = logging.getLogger(__name__)
+
+# Part of the entry key; bump when CandidatePool columns or the entry fields
+# change so entries in the old layout are simply never read again
+POOL_LAYOUT = 6
+
+class CandidateCache:
+    """
+    Pre-filtered candidate pools shared by all users with the same filters
+
+    An entry is a serialized CandidatePool keyed by a canonical signature -
+    wanted gender, age band, grid cell of the searcher and search radius -
+    so a pool fetched for one user serves everyone with those filters,
+    whatever `limit` they ask for. Each reader scores the pool against
+    their own profile. Entries hold no per-user exclusions: the caller
+    drops already-swiped ids when reading.
+
+    Entries are invalidated by events, not by the clock. Each (gender,
+    region) pair has a generation token that is bumped whenever a user of
+    that gender in that region registers, edits the profile or moves; an
+    entry stores the tokens of the regions its search circle overlaps and
+    is discarded as soon as any of them changes. The TTL is only a safety
+    net for slowly drifting columns (activity, counters).
+
+    Every stored pool gets a version (its build time); feed cursors carry
+    it, so a page is never taken by offset from a pool other than the one
+    the previous page came from.
+    """
+
+    def __init__(self, cache_service, cell_size_deg: float = 0.1,
+                 region_size_deg: float = 1.0, ttl: int = 3600):
+        self.cache = cache_service
+        self.cell_size_deg = cell_size_deg
+        self.region_size_deg = region_size_deg
+        self.ttl = ttl
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def cell_center(self, location: Optional[Tuple[float, float]]) -> Optional[Tuple[float, float]]:
+        """Center of the grid cell containing location; pools are scored from here"""
+        if not location:
+            return None
+        size = self.cell_size_deg
+        return (
+            (math.floor(location[0] / size) + 0.5) * size,
+            (math.floor(location[1] / size) + 0.5) * size
+        )
+
+    def signature(self, gender: str, age_range: Dict[str, int],
+                  location: Optional[Tuple[float, float]], radius_km: float) -> str:
+        if location:
+            cell = f"{math.floor(location[0] / self.cell_size_deg)}.{math.floor(location[1] / self.cell_size_deg)}"
+        else:
+            cell = "none"
+        return f"{gender}:{age_range['min']}-{age_range['max']}:{cell}:{radius_km}"
+
+    async def get(self, signature: str, gender: str, location: Optional[Tuple[float, float]],
+                  radius_km: float) -> Tuple[Optional[Dict], Optional[List], Optional[int], Dict[str, int]]:
+        """
+        Cached pool for the signature, if still current
+
+        Returns (CandidatePool.to_dict() data or None, boundary, version,
+        generation tokens). boundary is the feed key [last_active, id] of
+        the pool's last row when the pool was cut at the query limit (None -
+        the pool holds every candidate); the feed continues after it. The
+        tokens are read together with the entry and must be passed to set()
+        when the pool is rebuilt, so a change during the rebuild is not lost.
+        """
+        gen_keys = self._generation_keys(gender, location, radius_km)
+        entry_key = f"candidates:{POOL_LAYOUT}:{signature}"
+        values = await self.cache.get_many([entry_key, *gen_keys])
+        generations = {key: values.get(key, 0) for key in gen_keys}
+
+        entry = values.get(entry_key)
+        if entry is None:
+            self.misses += 1
+            return None, None, None, generations
+
+        if entry['generations'] != generations:
+            self.stale += 1
+            self.misses += 1
+            return None, None, None, generations
+
+        self.hits += 1
+        return entry['pool'], entry['boundary'], entry['version'], generations
+
+    async def set(self, signature: str, pool: Dict, boundary: Optional[List],
+                  generations: Dict[str, int]) -> int:
+        """Store a rebuilt pool; returns its version"""
+        version = time.time_ns()
+        await self.cache.set(f"candidates:{POOL_LAYOUT}:{signature}", {
+            'pool': pool,
+            'boundary': boundary,
+            'generations': generations,
+            'version': version
+        }, ttl=self.ttl)
+        return version
+
+    async def invalidate(self, gender: Optional[str], location: Optional[Tuple[float, float]]):
+        """A user of this gender at this location changed: pools that can contain them are stale"""
+        if not gender:
+            return
+        await self.cache.set(self._region_key(gender, location), time.time_ns(), ttl=self.ttl * 2)
+
+    def metrics(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    # ===================================
+    # PRIVATE METHODS
+    # ===================================
+
+    def _region_key(self, gender: str, location: Optional[Tuple[float, float]]) -> str:
+        if not location:
+            return f"candidates:gen:{gender}:none"
+        return self._region(gender, math.floor(location[0] / self.region_size_deg),
+                            math.floor(location[1] / self.region_size_deg))
+
+    def _region(self, gender: str, row: int, column: int) -> str:
+        # Columns wrap around the antimeridian
+        column %= round(360 / self.region_size_deg)
+        return f"candidates:gen:{gender}:{row}:{column}"
+
+    def _generation_keys(self, gender: str, location: Optional[Tuple[float, float]],
+                         radius_km: float) -> List[str]:
+        """Regions overlapping the search circle, plus users without a location"""
+        keys = [self._region_key(gender, None)]
+        if not location:
+            return keys
+
+        lat, lon = location
+        lat_span = radius_km / KM_PER_DEGREE
+        cos_lat = max(math.cos(math.radians(min(89.0, abs(lat) + lat_span))), 1e-6)
+        lon_span = min(180.0, radius_km / (KM_PER_DEGREE * cos_lat))
+
+        size = self.region_size_deg
+        for row in range(math.floor((lat - lat_span) / size), math.floor((lat + lat_span) / size) + 1):
+            for column in range(math.floor((lon - lon_span) / size), math.floor((lon + lon_span) / size) + 1):
+                keys.append(self._region(gender, row, column))
+        return keys
@@ -0,0 +1,232 @@
+# candidate_pool.py - Колоночное представление кандидатов для векторного скоринга
+
+import math
+from typing import Dict, List, Optional
+from datetime import datetime
+
+from src.user_features import STATIC_FACTORS, compute_static_factors, row_static_factors
+
+try:
+    import numpy as np
+except ImportError:  # numpy опционален, без него работает поштучный скоринг
+    np = None
+
+HAS_NUMPY = np is not None
+
+# Точка отсчета для naive datetime (разность совпадает с datetime - datetime)
+_EPOCH = datetime(1970, 1, 1)
+
+# Радиус Земли в км
+EARTH_RADIUS_KM = 6371
+
+# Порядок факторов совпадает с MatchingEngine._calculate_match_score
+FACTOR_NAMES = ('location', 'interests', 'activity') + STATIC_FACTORS
+
+
+def to_epoch(value: datetime) -> float:
+    """Перевод naive datetime в секунды от эпохи"""
+    return (value - _EPOCH).total_seconds()
+
+
+if HAS_NUMPY:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(words):
+    """Количество единичных бит в каждой строке массива uint64"""
+    if words.shape[1] == 0:
+        return np.zeros(words.shape[0], dtype=np.int64)
+    as_bytes = words.view(np.uint8).reshape(words.shape[0], -1)
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=1, dtype=np.int64)
+
+
+# Колонки пула и их типы: координаты и готовые факторы самого кандидата
+# (user_features) - float64, как в поштучном расчете; время - целые секунды эпохи
+POOL_COLUMNS = (
+    ('ids', 'int64'),
+    ('lat', 'float64'),
+    ('lon', 'float64'),
+    ('last_active', 'int64'),
+) + tuple((name, 'float64') for name in STATIC_FACTORS)
+
+
+class CandidatePool:
+    """
+    Пул кандидатов в виде колонок NumPy (struct-of-arrays)
+
+    Строится прямо из строк БД (from_rows) без промежуточных UserProfile.
+    Факторы, зависящие только от кандидата (фото, популярность, новизна,
+    ELO), хранятся готовыми - из ночного пересчета user_features; интересы
+    - битовыми масками по 64-битным словам. Пул сериализуется в dict байтов
+    для общего кэша кандидатов.
+    """
+
+    __slots__ = ('size', 'word_count', 'interest_words') + tuple(name for name, _ in POOL_COLUMNS)
+
+    def __init__(self, size: int, word_count: int, interest_words, **columns):
+        if not HAS_NUMPY:
+            raise RuntimeError("numpy is required for batch scoring")
+
+        self.size = size
+        self.word_count = word_count
+        self.interest_words = interest_words
+        for name, _ in POOL_COLUMNS:
+            setattr(self, name, columns[name])
+
+    @classmethod
+    def from_rows(cls, rows) -> 'CandidatePool':
+        """
+        Сборка пула из строк запроса подбора
+
+        Нужны колонки CANDIDATE_COLUMNS: id, lat, lon, last_active,
+        interest_ids, колонки user_features и сырые колонки для
+        пользователей, которых ночной пересчет еще не видел.
+        """
+        if not HAS_NUMPY:
+            raise RuntimeError("numpy is required for batch scoring")
+
+        n = len(rows)
+        columns = {
+            'ids': np.fromiter((row['id'] for row in rows), np.int64, n),
+            'lat': np.fromiter((np.nan if row['lat'] is None else row['lat'] for row in rows), np.float64, n),
+            'lon': np.fromiter((np.nan if row['lon'] is None else row['lon'] for row in rows), np.float64, n),
+            'last_active': np.fromiter((to_epoch(row['last_active']) for row in rows), np.int64, n),
+        }
+        static = [row_static_factors(row) for row in rows]
+        for name in STATIC_FACTORS:
+            columns[name] = np.fromiter((factors[name] for factors in static), np.float64, n)
+
+        # Биты интересов выставляются одним векторным bitwise_or.at
+        positions = [
+            (i, interest_id)
+            for i, row in enumerate(rows)
+            for interest_id in row['interest_ids'] or ()
+            if interest_id is not None
+        ]
+        word_count = (max((interest_id for _, interest_id in positions), default=-1) + 64) // 64
+        interest_words = np.zeros((n, word_count), dtype=np.uint64)
+        if positions:
+            row_index, interest_ids = (np.array(column, dtype=np.int64) for column in zip(*positions))
+            bits = np.left_shift(np.uint64(1), (interest_ids & 63).astype(np.uint64))
+            np.bitwise_or.at(interest_words, (row_index, interest_ids >> 6), bits)
+
+        return cls(n, word_count, interest_words, **columns)
+
+    @classmethod
+    def from_profiles(cls, candidates: List, interest_index) -> 'CandidatePool':
+        """Сборка пула из UserProfile с масками из InterestIndex"""
+        if not HAS_NUMPY:
+            raise RuntimeError("numpy is required for batch scoring")
+
+        n = len(candidates)
+        columns = {
+            'ids': np.fromiter((c.id for c in candidates), np.int64, n),
+            'lat': np.fromiter((c.location[0] if c.location else np.nan for c in candidates), np.float64, n),
+            'lon': np.fromiter((c.location[1] if c.location else np.nan for c in candidates), np.float64, n),
+            'last_active': np.fromiter((to_epoch(c.last_active) for c in candidates), np.int64, n),
+        }
+        static = [
+            c.static_factors or compute_static_factors(
+                c.likes_received, c.matches_count, c.photo_count,
+                c.photo_quality, c.created_at, c.elo_rating
+            )
+            for c in candidates
+        ]
+        for name in STATIC_FACTORS:
+            columns[name] = np.fromiter((factors[name] for factors in static), np.float64, n)
+
+        # Битовые маски интересов: n x words массив uint64
+        interest_masks = [interest_index.profile_mask(c) for c in candidates]
+        max_bits = max((mask.bit_length() for mask in interest_masks), default=0)
+        word_count = (max_bits + 63) // 64
+        interest_words = np.array(
+            [_mask_to_words(mask, word_count) for mask in interest_masks], dtype=np.uint64
+        ).reshape(n, word_count)
+
+        return cls(n, word_count, interest_words, **columns)
+
+    def mask_to_words(self, mask: int) -> List[int]:
+        """Разбиение маски на 64-битные слова (биты сверх пула отбрасываются)"""
+        return _mask_to_words(mask, self.word_count)
+
+    def to_dict(self) -> Dict:
+        """Колонки в виде байтов (для кэша; msgpack)"""
+        data = {name: getattr(self, name).tobytes() for name, _ in POOL_COLUMNS}
+        data.update(size=self.size, word_count=self.word_count,
+                    interest_words=self.interest_words.tobytes())
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'CandidatePool':
+        """Обратное к to_dict(); массивы читаются из байтов без копирования"""
+        size, word_count = data['size'], data['word_count']
+        columns = {name: np.frombuffer(data[name], dtype=dtype) for name, dtype in POOL_COLUMNS}
+        interest_words = np.frombuffer(data['interest_words'], dtype=np.uint64).reshape(size, word_count)
+        return cls(size, word_count, interest_words, **columns)
+
+
+def _mask_to_words(mask: int, word_count: int) -> List[int]:
+    return [(mask >> (64 * w)) & 0xFFFFFFFFFFFFFFFF for w in range(word_count)]
+
+
+def score_pool(user, pool: CandidatePool, weights: Dict[str, float],
+               now: Optional[datetime] = None) -> Dict[str, 'np.ndarray']:
+    """Векторный расчет всех факторов и итогового score за один проход"""
+
+    now_epoch = to_epoch(now or datetime.now())
+    factors = {}
+
+    # 1. Географическая близость
+    if user.location:
+        lat1, lon1 = (math.radians(v) for v in user.location)
+        lat2 = np.radians(pool.lat, dtype=np.float64)
+        lon2 = np.radians(pool.lon, dtype=np.float64)
+        a = (np.sin((lat2 - lat1) / 2) ** 2 +
+             math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+        with np.errstate(invalid='ignore'):
+            distance_km = EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(a))
+        location = np.select(
+            [distance_km <= 5, distance_km <= 15, distance_km <= 30, distance_km <= 50],
+            [1.0, 0.8, 0.6, 0.4],
+            default=0.2
+        )
+        factors['location'] = np.where(np.isnan(pool.lat), 0.5, location)
+    else:
+        factors['location'] = np.full(pool.size, 0.5)
+
+    # 2. Совпадение интересов (Jaccard + бонус за общие)
+    user_mask = user.interest_mask
+    user_words = np.array(pool.mask_to_words(user_mask), dtype=np.uint64)
+    user_count = user_mask.bit_count()
+    candidate_counts = _popcount(pool.interest_words)
+    intersection = _popcount(pool.interest_words & user_words)
+    # Биты пользователя за пределами пула не пересекаются, но входят в объединение
+    union = candidate_counts + user_count - intersection
+    with np.errstate(invalid='ignore', divide='ignore'):
+        jaccard = intersection / union
+    interests = np.minimum(1.0, jaccard + np.minimum(0.2, intersection * 0.05))
+    if not user_mask:
+        factors['interests'] = np.full(pool.size, 0.5)
+    else:
+        factors['interests'] = np.where(candidate_counts == 0, 0.5, interests)
+
+    # 3. Активность пользователя
+    hours_since_active = (now_epoch - pool.last_active) / 3600
+    factors['activity'] = np.select(
+        [hours_since_active <= 1, hours_since_active <= 24,
+         hours_since_active <= 168, hours_since_active <= 720],
+        [1.0, 0.8, 0.6, 0.4],
+        default=0.2
+    )
+
+    # 4-7. Факторы самого кандидата посчитаны заранее
+    for name in STATIC_FACTORS:
+        factors[name] = getattr(pool, name).astype(np.float64)
+
+    # Итоговый score в том же порядке суммирования, что и поштучный расчет
+    total = np.zeros(pool.size)
+    for name in FACTOR_NAMES:
+        total = total + factors[name] * weights[name]
+    factors['total'] = np.clip(total, 0.0, 1.0)
+
+    return factors
@@ -0,0 +1,218 @@
+# src/candidate_queue.py - Precomputed per-user candidate queues
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (candidate_id, score)
+QueuedCandidate = Tuple[int, float]
+CandidateSource = Callable[[int, int], Awaitable[List[QueuedCandidate]]]
+
+
+class CandidateQueue:
+    """
+    Ranked candidate queue per user, refilled ahead of time
+
+    Swipes pop from the user's deque. When it drops below low_water_mark a
+    refill is scheduled for the background worker pool, so the feed only
+    waits on the expensive candidate query when the queue is completely cold.
+    State is kept for the max_users most recently active users; the least
+    recently used user's queue is dropped and rebuilt if they come back.
+    """
+
+    def __init__(
+        self,
+        source: CandidateSource,
+        workers: int = 4,
+        low_water_mark: int = 5,
+        batch_size: int = 30,
+        served_memory: int = 500,
+        max_users: int = 50_000
+    ):
+        self.source = source
+        self.worker_count = workers
+        self.low_water_mark = low_water_mark
+        self.batch_size = batch_size
+        self.served_memory = served_memory
+        self.max_users = max_users
+
+        self.queues: Dict[int, Deque[QueuedCandidate]] = {}
+        # Recently popped ids per user, so a refill racing with the swipe
+        # write does not put the same card back into the queue
+        self.served: Dict[int, Dict[int, None]] = {}
+        # Users holding a queue or served ids, least recently used first
+        self.recent: 'OrderedDict[int, None]' = OrderedDict()
+        self.pending: Set[int] = set()
+        self.refill_requests: asyncio.Queue = asyncio.Queue()
+        self.workers: List[asyncio.Task] = []
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_errors = 0
+        self.refill_time_total = 0.0
+        self.refill_time_max = 0.0
+        self.evictions = 0
+
+    async def start(self):
+        """Start background refill workers"""
+        for i in range(self.worker_count):
+            self.workers.append(asyncio.create_task(self._worker(i)))
+        logger.info(f"Candidate queue started with {self.worker_count} workers")
+
+    async def stop(self):
+        """Stop background refill workers"""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        logger.info("Candidate queue stopped")
+
+    async def pop(self, user_id: int) -> Optional[QueuedCandidate]:
+        """Next candidate for the user; refills inline only on a cold queue"""
+        self._touch(user_id)
+        queue = self.queues.get(user_id)
+
+        if queue:
+            self.hits += 1
+        else:
+            self.misses += 1
+            await self._refill(user_id)
+            queue = self.queues.get(user_id)
+            if not queue:
+                return None
+
+        candidate = queue.popleft()
+        self._remember_served(user_id, candidate[0])
+
+        if len(queue) < self.low_water_mark:
+            self.schedule_refill(user_id)
+
+        return candidate
+
+    def peek(self, user_id: int) -> List[QueuedCandidate]:
+        """Current queue contents without consuming them"""
+        return list(self.queues.get(user_id, ()))
+
+    def schedule_refill(self, user_id: int):
+        """Ask the worker pool to refill the user's queue"""
+        if user_id in self.pending:
+            return
+        self.pending.add(user_id)
+        self.refill_requests.put_nowait(user_id)
+
+    # ===================================
+    # INVALIDATION HOOKS
+    # ===================================
+
+    def on_like(self, user_id: int, target_id: int):
+        """User liked target: never show target to them again"""
+        self._discard(user_id, target_id)
+
+    def on_skip(self, user_id: int, target_id: int):
+        """User skipped target"""
+        self._discard(user_id, target_id)
+
+    def on_match(self, user1_id: int, user2_id: int):
+        """Matched users disappear from each other's queues"""
+        self._discard(user1_id, user2_id)
+        self._discard(user2_id, user1_id)
+
+    def on_block(self, user_id: int, target_id: int):
+        """Blocked users disappear from each other's queues"""
+        self._discard(user_id, target_id)
+        self._discard(target_id, user_id)
+
+    def on_preferences_changed(self, user_id: int):
+        """Filters changed: the ranked queue is stale, rebuild it if the user is swiping"""
+        queue = self.queues.pop(user_id, None)
+        self.served.pop(user_id, None)
+        self.recent.pop(user_id, None)
+        # Users without a queue get one on their first pop
+        if queue is not None:
+            self.schedule_refill(user_id)
+
+    def metrics(self) -> Dict:
+        """Queue hit rate and refill latency"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'refills': self.refills,
+            'refill_errors': self.refill_errors,
+            'refill_latency_avg_ms': (self.refill_time_total / self.refills * 1000) if self.refills else 0.0,
+            'refill_latency_max_ms': self.refill_time_max * 1000,
+            'queued_users': len(self.queues),
+            'evictions': self.evictions,
+            'pending_refills': len(self.pending)
+        }
+
+    # ===================================
+    # PRIVATE METHODS
+    # ===================================
+
+    async def _worker(self, number: int):
+        while True:
+            user_id = await self.refill_requests.get()
+            try:
+                await self._refill(user_id)
+            except Exception as e:
+                logger.error(f"Refill worker {number} failed for user {user_id}: {e}")
+            finally:
+                self.pending.discard(user_id)
+                self.refill_requests.task_done()
+
+    async def _refill(self, user_id: int):
+        started = time.perf_counter()
+        try:
+            candidates = await self.source(user_id, self.batch_size)
+        except Exception as e:
+            self.refill_errors += 1
+            logger.error(f"Error refilling candidate queue for user {user_id}: {e}")
+            return
+
+        elapsed = time.perf_counter() - started
+        self.refills += 1
+        self.refill_time_total += elapsed
+        self.refill_time_max = max(self.refill_time_max, elapsed)
+
+        self._touch(user_id)
+        queue = self.queues.setdefault(user_id, deque())
+        served = self.served.get(user_id, {})
+        queued = {candidate_id for candidate_id, _ in queue}
+
+        for candidate_id, score in candidates:
+            if candidate_id not in queued and candidate_id not in served:
+                queue.append((candidate_id, score))
+                queued.add(candidate_id)
+
+    def _discard(self, user_id: int, target_id: int):
+        queue = self.queues.get(user_id)
+        if queue:
+            remaining = [item for item in queue if item[0] != target_id]
+            if len(remaining) != len(queue):
+                self.queues[user_id] = deque(remaining)
+        self._remember_served(user_id, target_id)
+
+    def _remember_served(self, user_id: int, candidate_id: int):
+        self._touch(user_id)
+        served = self.served.setdefault(user_id, {})
+        served[candidate_id] = None
+        if len(served) > self.served_memory:
+            del served[next(iter(served))]
+
+    def _touch(self, user_id: int):
+        """Mark the user as recently active and evict the least recently used beyond max_users"""
+        self.recent[user_id] = None
+        self.recent.move_to_end(user_id)
+        while len(self.recent) > self.max_users:
+            evicted, _ = self.recent.popitem(last=False)
+            self.queues.pop(evicted, None)
+            self.served.pop(evicted, None)
+            self.evictions += 1
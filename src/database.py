@@ -1,13 +1,16 @@
 # src/database.py - Complete database models
 
-from datetime import datetime
+import logging
+from datetime import date, datetime
 from typing import Optional, List
 from enum import Enum
 
-from sqlalchemy import String, Integer, DateTime, Boolean, Float, Text, ForeignKey, select
+from sqlalchemy import String, Integer, Date, DateTime, Boolean, Float, Text, LargeBinary, ForeignKey, Index, inspect, select, text
 from sqlalchemy.ext.asyncio import AsyncAttrs, create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
+logger = logging.getLogger(__name__)
+
 
 # Database URL
 DATABASE_URL = "sqlite+aiosqlite:///./flirtly.db"
@@ -114,6 +117,10 @@ class User(Base):
 
 class Like(Base):
     __tablename__ = "likes"
+    __table_args__ = (
+        # One like per pair: the like pipeline relies on ON CONFLICT
+        Index("uq_likes_from_to", "from_user_id", "to_user_id", unique=True),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     from_user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), index=True)
@@ -128,6 +135,9 @@ class Like(Base):
 
 class Match(Base):
     __tablename__ = "matches"
+    __table_args__ = (
+        Index("uq_matches_pair", "user1_id", "user2_id", unique=True),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user1_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), index=True)
@@ -200,11 +210,86 @@ class ProfileView(Base):
         return f"<View {self.viewer_id} -> {self.viewed_id}>"
 
 
+class UserDailyStats(Base):
+    """Per-user daily rollup of like/match/view counters (maintained by write-behind)"""
+    __tablename__ = "user_daily_stats"
+    
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    
+    likes_sent: Mapped[int] = mapped_column(Integer, default=0)
+    likes_received: Mapped[int] = mapped_column(Integer, default=0)
+    matches_count: Mapped[int] = mapped_column(Integer, default=0)
+    views_count: Mapped[int] = mapped_column(Integer, default=0)
+    
+    def __repr__(self):
+        return f"<UserDailyStats {self.user_id} {self.day}>"
+
+
+class SeenFilter(Base):
+    """Serialized bloom filter of users this user already liked, skipped or matched"""
+    __tablename__ = "seen_filters"
+    
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), primary_key=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    items: Mapped[int] = mapped_column(Integer, default=0)
+    
+    # Interactions created after this moment are re-applied on load
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<SeenFilter {self.user_id} ({self.items} items)>"
+
+
+# Duplicate pairs left by versions without the unique indexes; the newest
+# row is kept, since it holds the latest like action and match state
+_DEDUPLICATE = {
+    "likes": (
+        """DELETE FROM likes WHERE id NOT IN (
+               SELECT MAX(id) FROM likes GROUP BY from_user_id, to_user_id
+           )""",
+    ),
+    "matches": (
+        # Messages move to the kept match first
+        """UPDATE messages SET match_id = (
+               SELECT MAX(kept.id) FROM matches dup
+               JOIN matches kept ON kept.user1_id = dup.user1_id AND kept.user2_id = dup.user2_id
+               WHERE dup.id = messages.match_id
+           )
+           WHERE match_id NOT IN (SELECT MAX(id) FROM matches GROUP BY user1_id, user2_id)""",
+        """DELETE FROM matches WHERE id NOT IN (
+               SELECT MAX(id) FROM matches GROUP BY user1_id, user2_id
+           )""",
+    ),
+}
+
+
 # Database initialization
 async def init_db():
     """Initialize database - create all tables"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        
+        # create_all skips existing tables, so add the pair constraints explicitly
+        for table in (Like.__table__, Match.__table__):
+            existing = await conn.run_sync(
+                lambda sync_conn: {index["name"] for index in inspect(sync_conn).get_indexes(table.name)}
+            )
+            for index in table.indexes:
+                if not index.unique or index.name in existing:
+                    continue
+                
+                for statement in _DEDUPLICATE[table.name]:
+                    result = await conn.execute(text(statement))
+                    if statement.lstrip().startswith("DELETE") and result.rowcount:
+                        logger.warning(f"Removed {result.rowcount} duplicate rows from {table.name}")
+                try:
+                    await conn.run_sync(index.create)
+                except Exception as e:
+                    raise RuntimeError(
+                        f"Cannot create unique index {index.name} on {table.name}: {e}. "
+                        f"Remove duplicate rows from {table.name} and restart."
+                    ) from e
     print("✅ Database initialized successfully!")
 
 
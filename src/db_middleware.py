@@ -0,0 +1,47 @@
+# src/db_middleware.py - Session-per-update unit of work for aiogram handlers
+
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from src.database import async_session_maker
+from src.db_utils import UNIT_OF_WORK, commit_unit_of_work
+
+logger = logging.getLogger(__name__)
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Opens one database session per update and commits it once
+
+    Handlers receive it as the `session` argument and pass it to
+    DatabaseManager methods, which then only flush. Side effects registered
+    with after_commit (geo index, seen filters, counters) run after the
+    commit; on error the uncommitted part of the update is rolled back.
+    Handlers that send messages commit their writes first with
+    commit_unit_of_work(), so no transaction is open during Telegram calls.
+    """
+
+    def __init__(self, session_maker=async_session_maker):
+        self.session_maker = session_maker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        async with self.session_maker() as session:
+            session.info[UNIT_OF_WORK] = True
+            data["session"] = session
+
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await session.rollback()
+                raise
+
+            await commit_unit_of_work(session)
+            return result
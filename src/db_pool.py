@@ -0,0 +1,255 @@
+# src/db_pool.py - Pooled async database access shared by the services
+
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# asyncpg-style positional placeholders ($1, $2, ...)
+_PLACEHOLDER = re.compile(r'\$(\d+)')
+
+
+class SqliteConnection:
+    """
+    aiosqlite connection exposing the asyncpg query interface
+
+    Translates $N placeholders to SQLite's ?N and commits after each
+    execute() unless a transaction() block is open.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.in_transaction = False
+
+    async def fetch(self, query: str, *args) -> List[Any]:
+        async with self.conn.execute(_PLACEHOLDER.sub(r'?\1', query), args) as cursor:
+            return await cursor.fetchall()
+
+    async def fetchrow(self, query: str, *args) -> Optional[Any]:
+        async with self.conn.execute(_PLACEHOLDER.sub(r'?\1', query), args) as cursor:
+            return await cursor.fetchone()
+
+    async def fetchval(self, query: str, *args) -> Any:
+        row = await self.fetchrow(query, *args)
+        return row[0] if row is not None else None
+
+    async def cursor(self, query: str, *args, prefetch: int = 50) -> AsyncIterator[Any]:
+        """Rows fetched prefetch at a time, like asyncpg's Connection.cursor()"""
+        async with self.conn.execute(_PLACEHOLDER.sub(r'?\1', query), args) as cursor:
+            while True:
+                rows = await cursor.fetchmany(prefetch)
+                if not rows:
+                    return
+                for row in rows:
+                    yield row
+
+    async def execute(self, query: str, *args):
+        await self.conn.execute(_PLACEHOLDER.sub(r'?\1', query), args)
+        if not self.in_transaction:
+            await self.conn.commit()
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.in_transaction = True
+        try:
+            yield self
+            await self.conn.commit()
+        except BaseException:
+            await self.conn.rollback()
+            raise
+        finally:
+            self.in_transaction = False
+
+    async def close(self):
+        await self.conn.close()
+
+
+class DatabasePool:
+    """
+    Connection pool with the fetch/fetchrow/fetchval/execute interface
+
+    PostgreSQL is backed by asyncpg.create_pool; SQLite by a small pool of
+    aiosqlite connections in WAL mode (concurrent readers, one writer).
+    pool_size connections are kept open, up to max_overflow more are opened
+    under load and closed again once released.
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        pool_size: int = 10,
+        max_overflow: int = 20,
+        acquire_timeout: float = 30
+    ):
+        self.database_url = database_url
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.acquire_timeout = acquire_timeout
+
+        self.is_postgres = database_url.startswith("postgres")
+        self.pg_pool = None
+
+        # SQLite pool state
+        self.idle: List[SqliteConnection] = []
+        self.opened = 0
+        self.available = asyncio.Condition()
+        self.closed = False
+
+        # Metrics
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @property
+    def max_size(self) -> int:
+        return self.pool_size + self.max_overflow
+
+    async def open(self):
+        """Create the underlying pool"""
+        if self.is_postgres:
+            import asyncpg
+            dsn = re.sub(r'^postgresql\+asyncpg://', 'postgresql://', self.database_url)
+            self.pg_pool = await asyncpg.create_pool(
+                dsn,
+                min_size=self.pool_size,
+                max_size=self.max_size
+            )
+        elif self.database_url.startswith("sqlite"):
+            for _ in range(self.pool_size):
+                self.idle.append(await self._connect_sqlite())
+        else:
+            raise ValueError(f"Unsupported database URL: {self.database_url}")
+
+        logger.info(f"Database pool opened (size={self.pool_size}, overflow={self.max_overflow})")
+
+    async def close(self):
+        """Close all connections"""
+        self.closed = True
+        if self.pg_pool:
+            await self.pg_pool.close()
+        for conn in self.idle:
+            await conn.close()
+        self.idle = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Borrow a connection for several statements or a transaction"""
+        started = time.perf_counter()
+        try:
+            if self.pg_pool:
+                conn = await self.pg_pool.acquire(timeout=self.acquire_timeout)
+            else:
+                conn = await asyncio.wait_for(self._acquire_sqlite(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+        waited = time.perf_counter() - started
+        self.acquisitions += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+        try:
+            yield conn
+        finally:
+            self.in_use -= 1
+            if self.pg_pool:
+                await self.pg_pool.release(conn)
+            else:
+                await self._release_sqlite(conn)
+
+    async def fetch(self, query: str, *args) -> List[Any]:
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args)
+
+    async def fetchrow(self, query: str, *args) -> Optional[Any]:
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args)
+
+    async def fetchval(self, query: str, *args) -> Any:
+        async with self.acquire() as conn:
+            return await conn.fetchval(query, *args)
+
+    async def execute(self, query: str, *args):
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args)
+
+    async def stream(self, query: str, *args, prefetch: int = 50) -> AsyncIterator[Any]:
+        """
+        Rows through a server-side cursor, prefetch rows per round trip
+
+        Holds a connection (and on PostgreSQL a read transaction) until the
+        iteration finishes; close the generator when stopping early.
+        """
+        async with self.acquire() as conn:
+            if self.pg_pool:
+                async with conn.transaction():
+                    async for row in conn.cursor(query, *args, prefetch=prefetch):
+                        yield row
+            else:
+                async for row in conn.cursor(query, *args, prefetch=prefetch):
+                    yield row
+
+    def metrics(self) -> dict:
+        """Pool wait time and utilisation"""
+        return {
+            'acquisitions': self.acquisitions,
+            'timeouts': self.timeouts,
+            'in_use': self.in_use,
+            'peak_in_use': self.peak_in_use,
+            'size': self.pg_pool.get_size() if self.pg_pool else self.opened,
+            'max_size': self.max_size,
+            'wait_avg_ms': (self.wait_time_total / self.acquisitions * 1000) if self.acquisitions else 0.0,
+            'wait_max_ms': self.wait_time_max * 1000
+        }
+
+    # ===================================
+    # SQLITE POOL
+    # ===================================
+
+    async def _connect_sqlite(self) -> SqliteConnection:
+        import aiosqlite
+
+        path = re.sub(r'^sqlite(\+aiosqlite)?:///', '', self.database_url)
+        conn = await aiosqlite.connect(path)
+        conn.row_factory = aiosqlite.Row
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute("PRAGMA busy_timeout=5000")
+        self.opened += 1
+        return SqliteConnection(conn)
+
+    async def _acquire_sqlite(self) -> SqliteConnection:
+        async with self.available:
+            while not self.idle and self.opened >= self.max_size:
+                await self.available.wait()
+            if self.idle:
+                return self.idle.pop()
+            # Reserve the slot before awaiting the connect
+            self.opened += 1
+
+        try:
+            conn = await self._connect_sqlite()
+        finally:
+            self.opened -= 1
+        return conn
+
+    async def _release_sqlite(self, conn: SqliteConnection):
+        if self.closed or len(self.idle) >= self.pool_size:
+            # Overflow connection: close instead of keeping it idle
+            await conn.close()
+            self.opened -= 1
+        else:
+            self.idle.append(conn)
+
+        async with self.available:
+            self.available.notify()
@@ -1,48 +1,238 @@
 # src/db_utils.py - Database utilities and helpers
 
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy import select, func, and_, or_, exists, literal, text, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional, Dict, Set, Tuple
 
-from src.database import User, Like, Match, Referral, Skip, ProfileView, async_session_maker
+from src.database import User, Like, Match, Referral, Skip, async_session_maker
+from src.geo_index import geo_index
+from src.profile_cache import profile_cache
+from src.seen_filter import collect_unseen, seen_filters
+from src.write_behind import write_behind
+from src.user_stats import user_stats
+
+logger = logging.getLogger(__name__)
+
+# Columns behind User.daily_likes_remaining, re-read before enforcing the limit
+LIKE_LIMIT_COLUMNS = ('likes_sent', 'bonus_likes', 'last_active', 'premium_until')
+
+# Set in session.info by DbSessionMiddleware for update-scoped sessions
+UNIT_OF_WORK = "unit_of_work"
+AFTER_COMMIT = "after_commit"
+
+
+@asynccontextmanager
+async def use_session(session: Optional[AsyncSession] = None):
+    """Caller's (update-scoped) session, or a short-lived one owned by the method"""
+    if session is not None:
+        yield session
+    else:
+        async with async_session_maker() as own_session:
+            yield own_session
+
+
+async def commit(session: AsyncSession):
+    """Commit an owned session; inside a unit of work only flush, the middleware commits"""
+    if session.info.get(UNIT_OF_WORK):
+        await session.flush()
+    else:
+        await session.commit()
+
+
+def after_commit(session: AsyncSession, callback: Callable[[], None]):
+    """Run in-memory side effects (indexes, buffers) once the data is committed"""
+    if session.info.get(UNIT_OF_WORK):
+        session.info.setdefault(AFTER_COMMIT, []).append(callback)
+    else:
+        callback()
+
+
+async def commit_unit_of_work(session: AsyncSession):
+    """
+    Commit the update's unit of work now and run its after-commit callbacks
+    
+    Handlers call this once their writes are done and before talking to
+    Telegram, so locks (SQLite write lock, advisory locks) are not held
+    across HTTP calls. Later work in the same session starts a new
+    transaction, which the middleware commits at the end of the update.
+    """
+    await session.commit()
+    for callback in session.info.pop(AFTER_COMMIT, []):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Error in after-commit callback: {e}")
+
+
+def _user_columns(user: User) -> Dict:
+    """Column values of a User row, as stored in the profile cache"""
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+
+async def _attach_cached_user(session: AsyncSession, data: Dict) -> User:
+    """Persistent User built from cached columns, without a SELECT"""
+    existing = session.identity_map.get(identity_key(User, data['id']))
+    if existing is not None:
+        return existing
+    
+    user = User(**data)
+    make_transient_to_detached(user)
+    return await session.merge(user, load=False)
+
+
+class MatchPartner(NamedTuple):
+    """Partner fields shown in match lists"""
+    id: int
+    name: Optional[str]
+    age: Optional[int]
+    city: Optional[str]
+    photo: Optional[str]
+    is_premium: bool
+
+
+class MatchListCache:
+    """
+    Per-user cache of match list pages
+    
+    A user's pages are dropped whenever one of their matches changes, and
+    also when the profile of anyone shown in them changes (partners are
+    indexed to the users whose pages show them). Callers get copies.
+    """
+    
+    def __init__(self, ttl: float = 300, max_users: int = 10000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.pages: "OrderedDict[int, Dict]" = OrderedDict()  # user_id -> {(limit, before): (expires, data)}
+        self.shown_in: Dict[int, Set[int]] = {}  # partner_id -> users whose cached pages show them
+    
+    def get(self, user_id: int, limit: int, before) -> Optional[List[Dict]]:
+        entry = self.pages.get(user_id, {}).get((limit, before))
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        self.pages.move_to_end(user_id)
+        return [dict(item) for item in entry[1]]
+    
+    def set(self, user_id: int, limit: int, before, data: List[Dict]):
+        data = [dict(item) for item in data]
+        self.pages.setdefault(user_id, {})[(limit, before)] = (time.monotonic() + self.ttl, data)
+        self.pages.move_to_end(user_id)
+        for item in data:
+            self.shown_in.setdefault(item['user'].id, set()).add(user_id)
+        while len(self.pages) > self.max_users:
+            self._drop(next(iter(self.pages)))
+    
+    def invalidate(self, *user_ids: int):
+        for user_id in user_ids:
+            self._drop(user_id)
+    
+    def invalidate_partner(self, partner_id: int):
+        """The partner's profile changed: drop the pages of everyone they are shown to"""
+        for user_id in self.shown_in.pop(partner_id, ()):
+            self._drop(user_id)
+    
+    def _drop(self, user_id: int):
+        for _, data in self.pages.pop(user_id, {}).values():
+            for item in data:
+                users = self.shown_in.get(item['user'].id)
+                if users is not None:
+                    users.discard(user_id)
+                    if not users:
+                        del self.shown_in[item['user'].id]
+
+
+match_list_cache = MatchListCache()
+
+# Partners' names, photos and premium badges come from their profiles
+profile_cache.subscribe(match_list_cache.invalidate_partner)
 
 
 class DatabaseManager:
     """Centralized database operations manager"""
     
     @staticmethod
-    async def get_user_by_telegram_id(telegram_id: int) -> Optional[User]:
-        """Get user by telegram_id"""
-        async with async_session_maker() as session:
+    async def get_user_by_telegram_id(
+        telegram_id: int,
+        session: Optional[AsyncSession] = None,
+        fresh: bool = False
+    ) -> Optional[User]:
+        """
+        Get user by telegram_id
+
+        Served from the profile cache unless fresh=True; writers that do
+        read-modify-write on the row must pass fresh=True.
+        """
+        async with use_session(session) as session:
+            if not fresh:
+                data = await profile_cache.get_by_telegram_id('user', telegram_id)
+                if data is not None:
+                    return await _attach_cached_user(session, data)
+            
             result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
+                select(User)
+                .where(User.telegram_id == telegram_id)
+                .execution_options(populate_existing=fresh)
             )
-            return result.scalar_one_or_none()
+            user = result.scalar_one_or_none()
+            if user:
+                await profile_cache.set('user', user.id, _user_columns(user), telegram_id=telegram_id)
+            return user
+    
+    @staticmethod
+    async def get_user_by_id(user_id: int, session: Optional[AsyncSession] = None) -> Optional[User]:
+        """Get user by primary key (served from the profile cache)"""
+        async with use_session(session) as session:
+            data = await profile_cache.get('user', user_id)
+            if data is not None:
+                return await _attach_cached_user(session, data)
+            
+            user = await session.get(User, user_id)
+            if user:
+                await profile_cache.set('user', user.id, _user_columns(user), telegram_id=user.telegram_id)
+            return user
     
     @staticmethod
-    async def create_user(telegram_id: int, username: str = None) -> User:
+    async def create_user(
+        telegram_id: int,
+        username: str = None,
+        session: Optional[AsyncSession] = None
+    ) -> User:
         """Create new user"""
-        async with async_session_maker() as session:
+        async with use_session(session) as session:
             user = User(telegram_id=telegram_id, username=username)
             session.add(user)
-            await session.commit()
+            await commit(session)
             await session.refresh(user)
             return user
     
     @staticmethod
-    async def get_or_create_user(telegram_id: int, username: str = None) -> User:
+    async def get_or_create_user(
+        telegram_id: int,
+        username: str = None,
+        session: Optional[AsyncSession] = None
+    ) -> User:
         """Get existing user or create new one"""
-        user = await DatabaseManager.get_user_by_telegram_id(telegram_id)
+        user = await DatabaseManager.get_user_by_telegram_id(telegram_id, session)
         if not user:
-            user = await DatabaseManager.create_user(telegram_id, username)
+            user = await DatabaseManager.create_user(telegram_id, username, session)
         return user
     
     @staticmethod
-    async def update_user_profile(telegram_id: int, **kwargs) -> bool:
+    async def update_user_profile(
+        telegram_id: int,
+        session: Optional[AsyncSession] = None,
+        **kwargs
+    ) -> bool:
         """Update user profile with given data"""
-        async with async_session_maker() as session:
-            user = await DatabaseManager.get_user_by_telegram_id(telegram_id)
+        async with use_session(session) as session:
+            user = await DatabaseManager.get_user_by_telegram_id(telegram_id, session, fresh=True)
             if not user:
                 return False
             
@@ -51,13 +241,64 @@ class DatabaseManager:
                     setattr(user, key, value)
             
             user.last_active = datetime.utcnow()
-            await session.commit()
+            await commit(session)
+            after_commit(session, lambda: profile_cache.invalidate(user.id, telegram_id))
+            
+            # Keep the geo index in sync with location/gender/age edits; deactivated,
+            # banned users and cleared locations drop out of it
+            if (user.latitude is not None and user.longitude is not None
+                    and user.is_active and not user.is_banned):
+                after_commit(session, lambda: geo_index.upsert(
+                    user.id, user.latitude, user.longitude, user.gender, user.age
+                ))
+            else:
+                user_id = user.id
+                after_commit(session, lambda: geo_index.remove(user_id))
             return True
     
     @staticmethod
-    async def create_like(from_user_id: int, to_user_id: int, is_super_like: bool = False) -> Like:
+    async def delete_user(telegram_id: int, session: Optional[AsyncSession] = None) -> bool:
+        """Delete the user account (likes, matches and photos cascade)"""
+        async with use_session(session) as session:
+            user = await DatabaseManager.get_user_by_telegram_id(telegram_id, session, fresh=True)
+            if not user:
+                return False
+            
+            user_id = user.id
+            await session.delete(user)
+            await commit(session)
+            
+            def forget():
+                geo_index.remove(user_id)
+                profile_cache.invalidate(user_id, telegram_id)
+                match_list_cache.invalidate(user_id)
+            after_commit(session, forget)
+            return True
+    
+    @staticmethod
+    async def load_geo_index(session: Optional[AsyncSession] = None):
+        """Warm the in-memory geo index with active users that have a location"""
+        async with use_session(session) as session:
+            result = await session.execute(
+                select(User.id, User.latitude, User.longitude, User.gender, User.age).where(
+                    User.is_active == True,
+                    User.is_banned == False,
+                    User.latitude.isnot(None),
+                    User.longitude.isnot(None)
+                )
+            )
+            geo_index.load(result.mappings().all())
+            return len(geo_index)
+    
+    @staticmethod
+    async def create_like(
+        from_user_id: int,
+        to_user_id: int,
+        is_super_like: bool = False,
+        session: Optional[AsyncSession] = None
+    ) -> Like:
         """Create like and update statistics"""
-        async with async_session_maker() as session:
+        async with use_session(session) as session:
             # Check if already liked
             existing = await session.execute(
                 select(Like).where(
@@ -75,24 +316,32 @@ class DatabaseManager:
             )
             session.add(like)
             
-            # Update user stats
-            from_user = await session.get(User, from_user_id)
-            to_user = await session.get(User, to_user_id)
-            
-            if from_user:
-                from_user.likes_sent += 1
-                from_user.last_active = datetime.utcnow()
-            if to_user:
-                to_user.likes_received += 1
+            # likes_sent enforces the daily limit, so it is written with the like;
+            # the other counters go through the write-behind buffer
+            await session.execute(
+                update(User).where(User.id == from_user_id)
+                .values(last_active=datetime.utcnow(), likes_sent=User.likes_sent + 1)
+            )
             
-            await session.commit()
+            await commit(session)
             await session.refresh(like)
+            
+            def record():
+                seen_filters.add(from_user_id, to_user_id)
+                write_behind.increment(from_user_id, 'likes_sent')
+                write_behind.increment(to_user_id, 'likes_received')
+            
+            after_commit(session, record)
             return like
     
     @staticmethod
-    async def create_skip(from_user_id: int, to_user_id: int) -> Skip:
+    async def create_skip(
+        from_user_id: int,
+        to_user_id: int,
+        session: Optional[AsyncSession] = None
+    ) -> Skip:
         """Create skip record"""
-        async with async_session_maker() as session:
+        async with use_session(session) as session:
             skip = Skip(
                 from_user_id=from_user_id,
                 to_user_id=to_user_id
@@ -104,14 +353,19 @@ class DatabaseManager:
             if user:
                 user.last_active = datetime.utcnow()
             
-            await session.commit()
+            await commit(session)
             await session.refresh(skip)
+            after_commit(session, lambda: seen_filters.add(from_user_id, to_user_id))
             return skip
     
     @staticmethod
-    async def check_mutual_like(user1_id: int, user2_id: int) -> bool:
+    async def check_mutual_like(
+        user1_id: int,
+        user2_id: int,
+        session: Optional[AsyncSession] = None
+    ) -> bool:
         """Check if both users liked each other"""
-        async with async_session_maker() as session:
+        async with use_session(session) as session:
             result = await session.execute(
                 select(Like).where(
                     Like.from_user_id == user2_id,
@@ -121,9 +375,13 @@ class DatabaseManager:
             return result.scalar_one_or_none() is not None
     
     @staticmethod
-    async def create_match(user1_id: int, user2_id: int) -> Match:
+    async def create_match(
+        user1_id: int,
+        user2_id: int,
+        session: Optional[AsyncSession] = None
+    ) -> Match:
         """Create match between two users"""
-        async with async_session_maker() as session:
+        async with use_session(session) as session:
             # Check if match already exists
             existing = await session.execute(
                 select(Match).where(
@@ -142,23 +400,115 @@ class DatabaseManager:
             )
             session.add(match)
             
-            # Update match counts
-            user1 = await session.get(User, user1_id)
-            user2 = await session.get(User, user2_id)
+            await commit(session)
+            await session.refresh(match)
             
-            if user1:
-                user1.matches_count += 1
-            if user2:
-                user2.matches_count += 1
+            def record():
+                seen_filters.add(user1_id, user2_id)
+                seen_filters.add(user2_id, user1_id)
+                write_behind.increment(user1_id, 'matches_count')
+                write_behind.increment(user2_id, 'matches_count')
+                match_list_cache.invalidate(user1_id, user2_id)
             
-            await session.commit()
-            await session.refresh(match)
+            after_commit(session, record)
             return match
     
     @staticmethod
-    async def get_potential_matches(user_id: int, limit: int = 10) -> List[User]:
+    async def process_like(
+        from_user_id: int,
+        to_user_id: int,
+        is_super_like: bool = False,
+        session: Optional[AsyncSession] = None
+    ) -> Dict:
+        """
+        Atomic like pipeline: idempotent insert, mutual check and match creation
+        
+        Runs in one transaction with a single commit. The like insert and the
+        match insert both use ON CONFLICT DO NOTHING against the pair unique
+        indexes, and the match is only inserted when the reverse like exists.
+        likes_sent is incremented in the same transaction because the daily
+        limit reads it; the other counters go through the write-behind buffer.
+        
+        Returns {'created': bool, 'is_match': bool, 'match_id': int or None}
+        """
+        if session is None:
+            async with async_session_maker() as own_session:
+                return await DatabaseManager.process_like(
+                    from_user_id, to_user_id, is_super_like, own_session
+                )
+        
+        now = datetime.utcnow()
+        user1_id, user2_id = min(from_user_id, to_user_id), max(from_user_id, to_user_id)
+        dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+        
+        if dialect is postgresql:
+            # Serialize concurrent likes within the pair so that two mutual
+            # likes cannot both miss each other (READ COMMITTED snapshots)
+            await session.execute(
+                text("SELECT pg_advisory_xact_lock(hashtextextended(:pair, 0))"),
+                {"pair": f"like:{user1_id}:{user2_id}"}
+            )
+        
+        like_id = (await session.execute(
+            dialect.insert(Like)
+            .values(
+                from_user_id=from_user_id,
+                to_user_id=to_user_id,
+                is_super_like=is_super_like,
+                created_at=now
+            )
+            .on_conflict_do_nothing(index_elements=["from_user_id", "to_user_id"])
+            .returning(Like.id)
+        )).scalar_one_or_none()
+        
+        match_id = None
+        if like_id is not None:
+            await session.execute(
+                update(User).where(User.id == from_user_id)
+                .values(last_active=now, likes_sent=User.likes_sent + 1)
+            )
+            
+            mutual = exists().where(
+                Like.from_user_id == to_user_id,
+                Like.to_user_id == from_user_id
+            )
+            match_id = (await session.execute(
+                dialect.insert(Match)
+                .from_select(
+                    ["user1_id", "user2_id", "is_active", "created_at"],
+                    select(literal(user1_id), literal(user2_id), literal(True), literal(now)).where(mutual)
+                )
+                .on_conflict_do_nothing(index_elements=["user1_id", "user2_id"])
+                .returning(Match.id)
+            )).scalar_one_or_none()
+        
+        await commit(session)
+        
+        if like_id is None:
+            return {'created': False, 'is_match': False, 'match_id': None}
+        
+        def record():
+            seen_filters.add(from_user_id, to_user_id)
+            write_behind.increment(from_user_id, 'likes_sent')
+            write_behind.increment(to_user_id, 'likes_received')
+            
+            if match_id is not None:
+                seen_filters.add(to_user_id, from_user_id)
+                write_behind.increment(from_user_id, 'matches_count')
+                write_behind.increment(to_user_id, 'matches_count')
+                match_list_cache.invalidate(from_user_id, to_user_id)
+        
+        after_commit(session, record)
+        return {'created': True, 'is_match': match_id is not None, 'match_id': match_id}
+    
+    @staticmethod
+    async def get_potential_matches(
+        user_id: int,
+        limit: int = 10,
+        session: Optional[AsyncSession] = None
+    ) -> List[User]:
         """Get potential matches for user with smart filtering"""
-        async with async_session_maker() as session:
+        async with use_session(session) as session:
             user = await session.get(User, user_id)
             if not user:
                 return []
@@ -185,125 +535,152 @@ class DatabaseManager:
                     and_(User.age >= min_age, User.age <= max_age)
                 )
             
-            # Exclude already interacted profiles
-            liked_subquery = select(Like.to_user_id).where(Like.from_user_id == user_id)
-            skipped_subquery = select(Skip.to_user_id).where(Skip.from_user_id == user_id)
-            matched_subquery1 = select(Match.user2_id).where(Match.user1_id == user_id)
-            matched_subquery2 = select(Match.user1_id).where(Match.user2_id == user_id)
-            
-            query = query.where(
-                User.id.notin_(liked_subquery),
-                User.id.notin_(skipped_subquery),
-                User.id.notin_(matched_subquery1),
-                User.id.notin_(matched_subquery2)
+            # Exclude already interacted profiles in memory via the seen filter
+            # (pages are read most recently active first)
+            seen = await seen_filters.get(user_id, session)
+            return await collect_unseen(session, query, seen, limit)
+    
+    @staticmethod
+    async def get_user_matches(
+        user_id: int,
+        limit: int = 20,
+        before: Optional[Tuple[datetime, int]] = None,
+        session: Optional[AsyncSession] = None
+    ) -> List[Dict]:
+        """
+        Active matches with a partner projection, newest first
+        
+        One joined query (no per-match user lookups). Pages are keyset-based:
+        pass the (created_at, match_id) of the last item as `before` to get
+        the next page. Pages are cached per user until a match is created
+        or deactivated.
+        """
+        cached = match_list_cache.get(user_id, limit, before)
+        if cached is not None:
+            return cached
+        
+        def side(own_column, partner_column):
+            query = select(
+                Match.id.label("match_id"),
+                Match.created_at.label("created_at"),
+                partner_column.label("partner_id")
+            ).where(own_column == user_id, Match.is_active == True)
+            
+            if before is not None:
+                before_created_at, before_id = before
+                query = query.where(or_(
+                    Match.created_at < before_created_at,
+                    and_(Match.created_at == before_created_at, Match.id < before_id)
+                ))
+            return query
+        
+        # UNION ALL keeps each side on its own user1_id/user2_id index
+        pairs = union_all(
+            side(Match.user1_id, Match.user2_id),
+            side(Match.user2_id, Match.user1_id)
+        ).subquery()
+        
+        query = (
+            select(
+                pairs.c.match_id, pairs.c.created_at,
+                User.id, User.name, User.age, User.city, User.photos, User.premium_until
             )
-            
-            # Order by activity
-            query = query.order_by(User.last_active.desc())
-            query = query.limit(limit)
-            
-            result = await session.execute(query)
-            return list(result.scalars().all())
+            .join(User, User.id == pairs.c.partner_id)
+            .order_by(pairs.c.created_at.desc(), pairs.c.match_id.desc())
+            .limit(limit)
+        )
+        
+        async with use_session(session) as session:
+            rows = (await session.execute(query)).all()
+        
+        now = datetime.utcnow()
+        match_data = [
+            {
+                'match_id': row.match_id,
+                'user': MatchPartner(
+                    id=row.id,
+                    name=row.name,
+                    age=row.age,
+                    city=row.city,
+                    photo=row.photos.split(',')[0] if row.photos else None,
+                    is_premium=bool(row.premium_until and row.premium_until > now)
+                ),
+                'created_at': row.created_at
+            }
+            for row in rows
+        ]
+        
+        match_list_cache.set(user_id, limit, before, match_data)
+        return match_data
     
     @staticmethod
-    async def get_user_matches(user_id: int) -> List[Dict]:
-        """Get all matches for user with user info"""
-        async with async_session_maker() as session:
+    async def count_user_matches(user_id: int, session: Optional[AsyncSession] = None) -> int:
+        """Number of active matches"""
+        async with use_session(session) as session:
             result = await session.execute(
-                select(Match).where(
-                    or_(
-                        Match.user1_id == user_id,
-                        Match.user2_id == user_id
-                    ),
+                select(func.count(Match.id)).where(
+                    or_(Match.user1_id == user_id, Match.user2_id == user_id),
                     Match.is_active == True
-                ).order_by(Match.created_at.desc())
+                )
             )
-            matches = result.scalars().all()
-            
-            match_data = []
-            for match in matches:
-                matched_user_id = match.user2_id if match.user1_id == user_id else match.user1_id
-                matched_user = await session.get(User, matched_user_id)
-                
-                if matched_user:
-                    match_data.append({
-                        'match_id': match.id,
-                        'user': matched_user,
-                        'created_at': match.created_at
-                    })
-            
-            return match_data
+            return result.scalar() or 0
     
     @staticmethod
-    async def record_profile_view(viewer_id: int, viewed_id: int):
-        """Record profile view for analytics"""
-        async with async_session_maker() as session:
-            view = ProfileView(
-                viewer_id=viewer_id,
-                viewed_id=viewed_id
-            )
-            session.add(view)
+    async def deactivate_match(match_id: int, session: Optional[AsyncSession] = None) -> bool:
+        """Unmatch: hide the match from both users' lists"""
+        async with use_session(session) as session:
+            match = await session.get(Match, match_id)
+            if not match or not match.is_active:
+                return False
             
-            # Update view count
-            viewed_user = await session.get(User, viewed_id)
-            if viewed_user:
-                viewed_user.views_count += 1
+            match.is_active = False
+            await commit(session)
             
-            await session.commit()
+            user1_id, user2_id = match.user1_id, match.user2_id
+            after_commit(session, lambda: match_list_cache.invalidate(user1_id, user2_id))
+            return True
     
     @staticmethod
-    async def get_user_stats(user_id: int) -> Dict:
+    async def record_profile_view(viewer_id: int, viewed_id: int):
+        """Record profile view for analytics (buffered, flushed in batches)"""
+        write_behind.record_view(viewer_id, viewed_id)
+    
+    @staticmethod
+    async def get_user_stats(user_id: int, session: Optional[AsyncSession] = None) -> Dict:
         """Get comprehensive user statistics"""
-        async with async_session_maker() as session:
-            user = await session.get(User, user_id)
+        async with use_session(session) as session:
+            # The session may hold the user merged from the profile cache
+            # (up to its TTL old); counters and limits come from the row
+            user = await session.get(User, user_id, populate_existing=True)
             if not user:
                 return {}
             
-            # Get weekly stats
-            week_ago = datetime.utcnow() - timedelta(days=7)
-            
-            likes_week = await session.execute(
-                select(func.count(Like.id)).where(
-                    and_(
-                        Like.from_user_id == user_id,
-                        Like.created_at >= week_ago
-                    )
-                )
-            )
-            
-            matches_week = await session.execute(
-                select(func.count(Match.id)).where(
-                    and_(
-                        or_(Match.user1_id == user_id, Match.user2_id == user_id),
-                        Match.created_at >= week_ago
-                    )
-                )
-            )
-            
-            views_week = await session.execute(
-                select(func.count(ProfileView.id)).where(
-                    and_(
-                        ProfileView.viewed_id == user_id,
-                        ProfileView.created_at >= week_ago
-                    )
-                )
-            )
+            # Weekly stats from the daily rollup (at most 7 rows, TTL-cached)
+            weekly = await user_stats.weekly(user_id, session)
             
             return {
                 'user': user,
-                'likes_this_week': likes_week.scalar() or 0,
-                'matches_this_week': matches_week.scalar() or 0,
-                'views_this_week': views_week.scalar() or 0,
+                **weekly,
                 'daily_likes_remaining': user.daily_likes_remaining,
                 'is_premium': user.is_premium
             }
     
     @staticmethod
-    async def process_referral(referrer_telegram_id: int, new_user_id: int) -> Dict:
+    async def daily_likes_remaining(user: User, session: AsyncSession) -> int:
+        """Likes left today, from the row's current counters rather than a cached copy"""
+        await session.refresh(user, attribute_names=LIKE_LIMIT_COLUMNS)
+        return user.daily_likes_remaining
+    
+    @staticmethod
+    async def process_referral(
+        referrer_telegram_id: int,
+        new_user_id: int,
+        session: Optional[AsyncSession] = None
+    ) -> Dict:
         """Process referral and give bonuses"""
-        async with async_session_maker() as session:
-            referrer = await DatabaseManager.get_user_by_telegram_id(referrer_telegram_id)
-            new_user = await session.get(User, new_user_id)
+        async with use_session(session) as session:
+            referrer = await DatabaseManager.get_user_by_telegram_id(referrer_telegram_id, session, fresh=True)
+            new_user = await session.get(User, new_user_id, populate_existing=True)
             
             if not referrer or not new_user:
                 return {'success': False, 'message': 'User not found'}
@@ -329,7 +706,13 @@ class DatabaseManager:
             referrer.bonus_likes += referrer_bonus
             new_user.bonus_likes += new_user_bonus
             
-            await session.commit()
+            await commit(session)
+            
+            def invalidate():
+                profile_cache.invalidate(referrer.id, referrer_telegram_id)
+                profile_cache.invalidate(new_user_id, new_user.telegram_id)
+            
+            after_commit(session, invalidate)
             
             return {
                 'success': True,
@@ -338,9 +721,12 @@ class DatabaseManager:
             }
     
     @staticmethod
-    async def get_referral_stats(user_id: int) -> Dict:
+    async def get_referral_stats(
+        user_id: int,
+        session: Optional[AsyncSession] = None
+    ) -> Dict:
         """Get referral statistics for user"""
-        async with async_session_maker() as session:
+        async with use_session(session) as session:
             result = await session.execute(
                 select(Referral).where(Referral.referrer_id == user_id)
             )
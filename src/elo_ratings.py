@@ -0,0 +1,201 @@
+# src/elo_ratings.py - ELO desirability ratings updated from swipes in batches
+
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATING = 1200.0
+
+# Failed flushes in a row before the batch at the head of the queue is dropped
+MAX_ATTEMPTS = 3
+
+# Outcomes kept while the database is unreachable; the oldest go first
+MAX_OUTCOMES = 100_000
+
+
+def expected_score(rating: float, opponent_rating: float) -> float:
+    """Probability that a player rated `rating` beats `opponent_rating`"""
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+class EloRatingService:
+    """
+    Profile desirability ratings driven by swipe outcomes
+
+    Every like or skip is a game between the swiper and the profile shown:
+    a like is a win for the profile, a skip a loss. Only the profile's
+    rating moves; the swiper's rating is the opponent strength.
+
+    Outcomes are queued by record_swipe() and applied in batches by a
+    background task: the current ratings of everyone in the batch are read
+    in one query, the outcomes are replayed in order against that snapshot,
+    and the per-user deltas are written back with a single
+    UPDATE ... FROM (VALUES ...), which also refreshes the elo_score the
+    ranking reads from user_features. Writes are relative (elo_rating +
+    delta), so concurrent workers never overwrite each other and no row
+    locks are held between the read and the write.
+
+    Ratings are a soft signal, so a batch that fails MAX_ATTEMPTS flushes
+    in a row is logged and dropped rather than retried forever, and the
+    queue keeps at most max_outcomes swipes during an outage.
+    """
+
+    def __init__(self, db=None, k_factor: float = 32, max_pending: int = 500,
+                 flush_interval: float = 5.0, max_outcomes: int = MAX_OUTCOMES):
+        self.db = db
+        self.k_factor = k_factor
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+
+        # (swiper_id, profile_id, liked); a full deque discards the oldest on append
+        self.outcomes: Deque[Tuple[int, int, bool]] = deque(maxlen=max_outcomes)
+
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.flush_task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.flushes = 0
+        self.applied = 0
+        self.flush_errors = 0
+        self.failures = 0  # consecutive failed flushes
+        self.dropped = 0
+
+    def attach(self, db):
+        """Use db (DatabasePool) for reads and writes"""
+        self.db = db
+
+    async def start(self):
+        """Start the periodic flusher"""
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and apply everything still queued"""
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    def record_swipe(self, swiper_id: int, profile_id: int, liked: bool):
+        """Queue a like (liked=True) or skip of profile_id by swiper_id"""
+        if len(self.outcomes) == self.outcomes.maxlen:
+            self.dropped += 1
+        self.outcomes.append((swiper_id, profile_id, liked))
+        self._maybe_flush()
+
+    async def flush(self):
+        """Apply queued outcomes, at most max_pending per UPDATE"""
+        async with self.lock:
+            while self.outcomes and self.db is not None:
+                batch = [self.outcomes.popleft()
+                         for _ in range(min(self.max_pending, len(self.outcomes)))]
+                try:
+                    await self._apply(batch)
+                except Exception as e:
+                    self.flush_errors += 1
+                    self.failures += 1
+                    if self.failures < MAX_ATTEMPTS:
+                        # Put the outcomes back in order so the next flush retries them
+                        self._requeue(batch)
+                        logger.error(f"ELO flush failed: {e}")
+                    else:
+                        self.failures = 0
+                        self.dropped += len(batch)
+                        logger.error(f"ELO flush failed {MAX_ATTEMPTS} times, dropped {len(batch)} outcomes: {e}")
+                    return
+
+                self.failures = 0
+                self.flushes += 1
+                self.applied += len(batch)
+
+    def deltas(self, ratings: Dict[int, float], batch: List[Tuple[int, int, bool]]) -> Dict[int, float]:
+        """Replay outcomes in order over a ratings snapshot; rating change per user"""
+        current = dict(ratings)
+        for swiper_id, profile_id, liked in batch:
+            swiper = current.get(swiper_id, DEFAULT_RATING)
+            profile = current.get(profile_id, DEFAULT_RATING)
+            current[profile_id] = profile + self.k_factor * (liked - expected_score(profile, swiper))
+
+        return {
+            user_id: rating - ratings.get(user_id, DEFAULT_RATING)
+            for user_id, rating in current.items()
+            if rating != ratings.get(user_id, DEFAULT_RATING)
+        }
+
+    def metrics(self) -> Dict:
+        return {
+            'pending': len(self.outcomes),
+            'flushes': self.flushes,
+            'applied': self.applied,
+            'flush_errors': self.flush_errors,
+            'dropped': self.dropped
+        }
+
+    # ===================================
+    # PRIVATE METHODS
+    # ===================================
+
+    async def _apply(self, batch: List[Tuple[int, int, bool]]):
+        user_ids = list({user_id for swiper_id, profile_id, _ in batch
+                         for user_id in (swiper_id, profile_id)})
+        rows = await self.db.fetch(
+            "SELECT id, elo_rating FROM users WHERE id = ANY($1::bigint[])", user_ids
+        )
+        ratings = {row['id']: row['elo_rating'] or DEFAULT_RATING for row in rows}
+
+        deltas = self.deltas(ratings, batch)
+        if not deltas:
+            return
+
+        values = ", ".join(
+            f"(${2 * i + 1}::bigint, ${2 * i + 2}::float8)" for i in range(len(deltas))
+        )
+        args = [value for item in deltas.items() for value in item]
+        # Ranking reads elo_score from user_features, so it is refreshed in the
+        # same statement (same formula as user_features.elo_score) instead of
+        # waiting for the nightly recomputation
+        await self.db.execute(f"""
+            WITH rated AS (
+                UPDATE users u
+                SET elo_rating = COALESCE(u.elo_rating, {DEFAULT_RATING}) + v.delta
+                FROM (VALUES {values}) AS v(id, delta)
+                WHERE u.id = v.id
+                RETURNING u.id, u.elo_rating
+            )
+            UPDATE user_features f
+            SET elo_score = 1 / (1 + power(10, ({DEFAULT_RATING} - rated.elo_rating) / 400))
+            FROM rated
+            WHERE f.user_id = rated.id
+        """, *args)
+
+    def _requeue(self, batch: List[Tuple[int, int, bool]]):
+        # Swipes recorded during the failed flush may have filled the deque;
+        # keep the newest, consistent with what append() discards
+        room = self.outcomes.maxlen - len(self.outcomes)
+        if room < len(batch):
+            self.dropped += len(batch) - room
+            batch = batch[len(batch) - room:] if room else []
+        self.outcomes.extendleft(reversed(batch))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def _maybe_flush(self):
+        if len(self.outcomes) < self.max_pending:
+            return
+        if self.flush_task and not self.flush_task.done():
+            return
+        try:
+            self.flush_task = asyncio.get_running_loop().create_task(self.flush())
+        except RuntimeError:
+            pass  # No running loop: the periodic or final flush picks it up
+
+
+# Process-wide service fed by the like/skip handlers
+elo_ratings = EloRatingService()
@@ -6,6 +6,8 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database import User, Referral
+from src.profile_cache import profile_cache
+from src.user_stats import user_stats
 
 
 class ReferralSystem:
@@ -37,7 +39,9 @@ class ReferralSystem:
         try:
             # Get referrer user
             referrer_result = await session.execute(
-                select(User).where(User.telegram_id == referrer_telegram_id)
+                select(User)
+                .where(User.telegram_id == referrer_telegram_id)
+                .execution_options(populate_existing=True)
             )
             referrer = referrer_result.scalar_one_or_none()
             
@@ -50,7 +54,7 @@ class ReferralSystem:
                 }
             
             # Get new user
-            new_user = await session.get(User, new_user_id)
+            new_user = await session.get(User, new_user_id, populate_existing=True)
             if not new_user:
                 return {
                     'success': False,
@@ -87,6 +91,8 @@ class ReferralSystem:
             new_user.bonus_likes += new_user_bonus
             
             await session.commit()
+            profile_cache.invalidate(referrer.id, referrer_telegram_id)
+            profile_cache.invalidate(new_user_id, new_user.telegram_id)
             
             return {
                 'success': True,
@@ -131,55 +137,17 @@ class Analytics:
     async def get_user_stats(user_id: int, session: AsyncSession) -> Dict:
         """Get comprehensive user statistics"""
         
-        user = await session.get(User, user_id)
+        # Counters and limits from the row, not a profile-cache copy in the session
+        user = await session.get(User, user_id, populate_existing=True)
         if not user:
             return {}
         
-        # Get recent activity
-        from sqlalchemy import func, and_
-        from src.database import Like, Match, ProfileView
-        
-        # Likes sent in last 7 days
-        week_ago = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        week_ago = week_ago.replace(day=week_ago.day - 7)
-        
-        likes_week = await session.execute(
-            select(func.count(Like.id)).where(
-                and_(
-                    Like.from_user_id == user_id,
-                    Like.created_at >= week_ago
-                )
-            )
-        )
-        likes_this_week = likes_week.scalar() or 0
-        
-        # Matches this week
-        matches_week = await session.execute(
-            select(func.count(Match.id)).where(
-                and_(
-                    or_(Match.user1_id == user_id, Match.user2_id == user_id),
-                    Match.created_at >= week_ago
-                )
-            )
-        )
-        matches_this_week = matches_week.scalar() or 0
-        
-        # Profile views this week
-        views_week = await session.execute(
-            select(func.count(ProfileView.id)).where(
-                and_(
-                    ProfileView.viewed_id == user_id,
-                    ProfileView.created_at >= week_ago
-                )
-            )
-        )
-        views_this_week = views_week.scalar() or 0
+        # Weekly activity from the daily rollup (at most 7 rows, TTL-cached)
+        weekly = await user_stats.weekly(user_id, session)
         
         return {
             'user': user,
-            'likes_this_week': likes_this_week,
-            'matches_this_week': matches_this_week,
-            'views_this_week': views_this_week,
+            **weekly,
             'daily_likes_remaining': user.daily_likes_remaining,
             'is_premium': user.is_premium
         }
@@ -0,0 +1,163 @@
+# src/geo_index.py - In-memory geospatial grid index of active users
+
+import math
+from typing import Dict, List, Optional, Set, Tuple
+
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = 111.32
+
+# Default search radius used when the user has no preference stored
+DEFAULT_RADIUS_KM = 50
+
+
+class GeoEntry:
+    """Indexed user: position plus the attributes used for filtering"""
+
+    __slots__ = ('user_id', 'lat', 'lon', 'gender', 'age', 'cell')
+
+    def __init__(self, user_id: int, lat: float, lon: float,
+                 gender: Optional[str], age: Optional[int], cell: Tuple[int, int]):
+        self.user_id = user_id
+        self.lat = lat
+        self.lon = lon
+        self.gender = gender
+        self.age = age
+        self.cell = cell
+
+
+class GeoGridIndex:
+    """
+    Fixed-size lat/lon cell grid of active users
+
+    Radius queries only visit the cells overlapping the bounding box of the
+    search circle, so the cost depends on local density rather than on the
+    total number of users. Replaces ST_DWithin for deployments without PostGIS.
+    """
+
+    def __init__(self, cell_size_deg: float = 0.1):
+        self.cell_size_deg = cell_size_deg
+        self.columns = int(math.ceil(360 / cell_size_deg))
+        self.cells: Dict[Tuple[int, int], Set[int]] = {}
+        self.entries: Dict[int, GeoEntry] = {}
+        self.ready = False  # True once warmed from the database
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.entries
+
+    def cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        """Grid cell (row, column) containing the point"""
+        row = int(math.floor((lat + 90) / self.cell_size_deg))
+        column = int(math.floor((lon + 180) / self.cell_size_deg)) % self.columns
+        return row, column
+
+    def upsert(self, user_id: int, lat: float, lon: float,
+               gender: Optional[str] = None, age: Optional[int] = None):
+        """Add user or move them to a new position"""
+        entry = self.entries.get(user_id)
+        if entry:
+            gender = gender if gender is not None else entry.gender
+            age = age if age is not None else entry.age
+            self._unlink(entry)
+
+        cell = self.cell_of(lat, lon)
+        self.entries[user_id] = GeoEntry(user_id, lat, lon, gender, age, cell)
+        self.cells.setdefault(cell, set()).add(user_id)
+
+    def update_attributes(self, user_id: int, gender: Optional[str] = None,
+                          age: Optional[int] = None):
+        """Update filter attributes without moving the user"""
+        entry = self.entries.get(user_id)
+        if not entry:
+            return
+        if gender is not None:
+            entry.gender = gender
+        if age is not None:
+            entry.age = age
+
+    def remove(self, user_id: int):
+        """Drop user from the index (deactivated, banned, location cleared)"""
+        entry = self.entries.pop(user_id, None)
+        if entry:
+            self._unlink(entry)
+
+    def load(self, rows):
+        """Bulk load rows with id, latitude, longitude, gender and age"""
+        for row in rows:
+            if row['latitude'] is None or row['longitude'] is None:
+                continue
+            self.upsert(row['id'], row['latitude'], row['longitude'],
+                        row['gender'], row['age'])
+        self.ready = True
+
+    def query(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        gender: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+        exclude: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Users within radius_km of the point matching gender/age
+
+        Returns (user_id, distance_km) pairs sorted by distance.
+        """
+        lat_span = radius_km / KM_PER_DEGREE
+        cos_lat = max(math.cos(math.radians(min(89.0, abs(lat) + lat_span))), 1e-6)
+        lon_span = min(180.0, radius_km / (KM_PER_DEGREE * cos_lat))
+
+        min_row, min_col = self.cell_of(max(-90.0, lat - lat_span), lon - lon_span)
+        max_row, _ = self.cell_of(min(90.0, lat + lat_span), lon + lon_span)
+        col_count = min(self.columns, int(math.ceil(2 * lon_span / self.cell_size_deg)) + 1)
+
+        lat_rad = math.radians(lat)
+        cos_lat_rad = math.cos(lat_rad)
+        results = []
+
+        for row in range(min_row, max_row + 1):
+            for offset in range(col_count):
+                cell = self.cells.get((row, (min_col + offset) % self.columns))
+                if not cell:
+                    continue
+
+                for user_id in cell:
+                    if user_id == exclude:
+                        continue
+                    entry = self.entries[user_id]
+                    if gender and entry.gender != gender:
+                        continue
+                    if min_age is not None and (entry.age is None or entry.age < min_age):
+                        continue
+                    if max_age is not None and (entry.age is None or entry.age > max_age):
+                        continue
+
+                    # Haversine formula
+                    entry_lat_rad = math.radians(entry.lat)
+                    a = (math.sin((entry_lat_rad - lat_rad) / 2) ** 2 +
+                         cos_lat_rad * math.cos(entry_lat_rad) *
+                         math.sin(math.radians(entry.lon - lon) / 2) ** 2)
+                    distance = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+                    if distance <= radius_km:
+                        results.append((user_id, distance))
+
+        results.sort(key=lambda item: item[1])
+        return results[:limit] if limit else results
+
+    def _unlink(self, entry: GeoEntry):
+        cell = self.cells.get(entry.cell)
+        if cell is not None:
+            cell.discard(entry.user_id)
+            if not cell:
+                del self.cells[entry.cell]
+
+
+# Process-wide index shared by both matching engines
+geo_index = GeoGridIndex()
@@ -0,0 +1,97 @@
+# interest_index.py - Словарь интересов и битовые маски профилей
+
+import logging
+import time
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Не чаще раза в столько секунд словарь перечитывается из-за неизвестного названия
+RELOAD_INTERVAL = 60
+
+
+class InterestIndex:
+    """
+    Словарь интересов (name -> id из таблицы interests) и построение масок
+
+    Маски пользователей здесь не хранятся: они приходят с профилем (ID
+    интересов из строки подбора, кэш профилей, колонки CandidatePool).
+    """
+
+    def __init__(self, db_connection):
+        self.db = db_connection
+        self.ids: Dict[str, int] = {}      # name -> interest_id
+        self.loaded = False
+        self.loaded_at = 0.0
+
+    async def ensure_loaded(self):
+        """Загрузка словаря из таблицы interests (повторно - если встретилось неизвестное название)"""
+
+        if self.loaded:
+            return
+
+        try:
+            rows = await self.db.fetch("SELECT id, name FROM interests")
+            self.ids = {row['name']: row['id'] for row in rows}
+            logger.info(f"Interest dictionary loaded: {len(self.ids)} interests")
+        except Exception as e:
+            logger.error(f"Error loading interest dictionary: {e}")
+
+        self.loaded = True
+        self.loaded_at = time.monotonic()
+
+    def interest_id(self, name: str) -> Optional[int]:
+        """
+        ID интереса из словаря; None - названия в словаре нет
+
+        Своих ID не выдаем: они пересеклись бы с интересами, добавленными в
+        таблицу позже. Неизвестное название значит, что словарь устарел, -
+        он будет перечитан при следующем ensure_loaded().
+        """
+
+        interest_id = self.ids.get(name)
+        if interest_id is None and time.monotonic() - self.loaded_at >= RELOAD_INTERVAL:
+            self.loaded = False
+        return interest_id
+
+    def encode(self, names: Iterable[str]) -> int:
+        """Маска по названиям интересов (неизвестные названия пропускаются)"""
+        mask = 0
+        for name in names:
+            interest_id = self.interest_id(name)
+            if interest_id is not None:
+                mask |= 1 << interest_id
+        return mask
+
+    @staticmethod
+    def encode_ids(interest_ids: Iterable[Optional[int]]) -> int:
+        """Маска по ID интересов (без хэширования строк)"""
+        mask = 0
+        for interest_id in interest_ids:
+            if interest_id is not None:
+                mask |= 1 << interest_id
+        return mask
+
+    def profile_mask(self, profile) -> int:
+        """Маска профиля: берется из профиля или строится по названиям"""
+
+        if not profile.interest_mask and profile.interests:
+            profile.interest_mask = self.encode(profile.interests)
+        return profile.interest_mask
+
+
+def interests_score(user_mask: int, candidate_mask: int) -> float:
+    """Jaccard similarity + бонус за общие интересы через popcount"""
+
+    if not user_mask or not candidate_mask:
+        return 0.5  # Нейтральный score
+
+    common = (user_mask & candidate_mask).bit_count()
+    union = (user_mask | candidate_mask).bit_count()
+
+    jaccard = common / union
+
+    # Бонус за много общих интересов
+    common_bonus = min(0.2, common * 0.05)
+
+    return min(1.0, jaccard + common_bonus)
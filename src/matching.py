@@ -6,7 +6,11 @@ from typing import List, Optional
 from sqlalchemy import select, and_, or_, not_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database import User, Like, Skip, Match, ProfileView, Gender, LookingFor
+from src.database import User, Skip, Gender, LookingFor
+from src.db_utils import DatabaseManager
+from src.geo_index import DEFAULT_RADIUS_KM, geo_index
+from src.seen_filter import collect_unseen, seen_filters
+from src.write_behind import write_behind
 
 
 class MatchingEngine:
@@ -28,7 +32,7 @@ class MatchingEngine:
         4. Not already matched
         5. Active users only
         6. Has complete profile
-        7. Proximity (if location available)
+        7. Within DEFAULT_RADIUS_KM (if location available and geo index is warm)
         """
         
         # Base query
@@ -49,6 +53,7 @@ class MatchingEngine:
         # If BOTH, no filter
         
         # Filter by age range
+        min_age = max_age = None
         if user.age:
             min_age = max(18, user.age - 5)
             max_age = min(99, user.age + 5)
@@ -57,42 +62,29 @@ class MatchingEngine:
                 User.age <= max_age
             )
         
-        # Exclude already interacted profiles
-        # Get IDs of liked users
-        liked_subquery = select(Like.to_user_id).where(
-            Like.from_user_id == user.id
-        )
-        
-        # Get IDs of skipped users
-        skipped_subquery = select(Skip.to_user_id).where(
-            Skip.from_user_id == user.id
-        )
-        
-        # Get IDs of matched users
-        matched_subquery1 = select(Match.user2_id).where(
-            Match.user1_id == user.id,
-            Match.is_active == True
-        )
-        matched_subquery2 = select(Match.user1_id).where(
-            Match.user2_id == user.id,
-            Match.is_active == True
-        )
-        
-        query = query.where(
-            User.id.notin_(liked_subquery),
-            User.id.notin_(skipped_subquery),
-            User.id.notin_(matched_subquery1),
-            User.id.notin_(matched_subquery2)
-        )
-        
-        # Order by activity and proximity
-        query = query.order_by(User.last_active.desc())
-        
-        # Apply limit
-        query = query.limit(limit)
+        # Radius filter from the in-memory geo index (no spatial SQL needed)
+        if geo_index.ready and user.latitude is not None and user.longitude is not None:
+            gender = user.looking_for if user.looking_for in (LookingFor.MALE, LookingFor.FEMALE) else None
+            nearby = geo_index.query(
+                user.latitude, user.longitude, DEFAULT_RADIUS_KM,
+                gender=gender,
+                min_age=min_age,
+                max_age=max_age,
+                exclude=user.id,
+                limit=2000
+            )
+            query = query.where(
+                or_(
+                    User.latitude.is_(None),
+                    User.id.in_([user_id for user_id, _ in nearby])
+                )
+            )
         
-        result = await session.execute(query)
-        matches = result.scalars().all()
+        # Exclude already interacted profiles: over-fetch most recently active
+        # users first and drop the ones found in the seen filter instead of
+        # NOT IN over the swipe history
+        seen = await seen_filters.get(user.id, session)
+        matches = await collect_unseen(session, query, seen, limit)
         
         # Sort by distance if location available
         if user.latitude and user.longitude:
@@ -149,14 +141,12 @@ class MatchingEngine:
         }
         """
         
-        # Check if already liked
-        existing_like = await session.execute(
-            select(Like).where(
-                Like.from_user_id == from_user.id,
-                Like.to_user_id == to_user_id
-            )
+        # Insert, mutual check and match creation in one transaction
+        result = await DatabaseManager.process_like(
+            from_user.id, to_user_id, is_super_like, session=session
         )
-        if existing_like.scalar_one_or_none():
+        
+        if not result['created']:
             return {
                 'success': False,
                 'is_match': False,
@@ -164,53 +154,12 @@ class MatchingEngine:
                 'message': 'Already liked'
             }
         
-        # Create like
-        like = Like(
-            from_user_id=from_user.id,
-            to_user_id=to_user_id,
-            is_super_like=is_super_like
-        )
-        session.add(like)
-        
-        # Update stats
-        from_user.likes_sent += 1
-        from_user.last_active = datetime.utcnow()
-        
-        to_user = await session.get(User, to_user_id)
-        if to_user:
-            to_user.likes_received += 1
-        
-        await session.commit()
-        
-        # Check for mutual like (match)
-        mutual_like = await session.execute(
-            select(Like).where(
-                Like.from_user_id == to_user_id,
-                Like.to_user_id == from_user.id
-            )
-        )
-        
-        if mutual_like.scalar_one_or_none():
-            # Create match
-            match = Match(
-                user1_id=min(from_user.id, to_user_id),
-                user2_id=max(from_user.id, to_user_id)
-            )
-            session.add(match)
-            
-            # Update match counts
-            from_user.matches_count += 1
-            if to_user:
-                to_user.matches_count += 1
-            
-            await session.commit()
-            await session.refresh(match)
-            
+        if result['is_match']:
             return {
                 'success': True,
                 'is_match': True,
-                'match_id': match.id,
-                'matched_user': to_user,
+                'match_id': result['match_id'],
+                'matched_user': await session.get(User, to_user_id),
                 'message': 'Match created!'
             }
         
@@ -239,6 +188,7 @@ class MatchingEngine:
         from_user.last_active = datetime.utcnow()
         
         await session.commit()
+        seen_filters.add(from_user.id, to_user_id)
         
         return {
             'success': True,
@@ -251,17 +201,6 @@ class MatchingEngine:
         viewed_id: int,
         session: AsyncSession
     ):
-        """Record profile view for analytics"""
+        """Record profile view for analytics (buffered, flushed in batches)"""
         
-        view = ProfileView(
-            viewer_id=viewer.id,
-            viewed_id=viewed_id
-        )
-        session.add(view)
-        
-        # Update view count
-        viewed_user = await session.get(User, viewed_id)
-        if viewed_user:
-            viewed_user.views_count += 1
-        
-        await session.commit()
+        write_behind.record_view(viewer.id, viewed_id)
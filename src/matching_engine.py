@@ -1,15 +1,80 @@
 # matching_engine.py - Умный алгоритм подбора пар
 
 import asyncio
+import base64
+import json
 import math
 import logging
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
+from contextlib import aclosing
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from dataclasses import asdict, dataclass, replace
 from datetime import datetime, timedelta
-import json
+
+from src.candidate_cache import CandidateCache
+from src.candidate_pool import CandidatePool, FACTOR_NAMES, HAS_NUMPY, np, score_pool
+from src.elo_ratings import DEFAULT_RATING
+from src.user_features import FEATURE_COLUMNS, STATIC_FACTORS, compute_static_factors
+from src.interest_index import InterestIndex, interests_score
+from src.geo_index import DEFAULT_RADIUS_KM, geo_index as shared_geo_index
+from src.profile_cache import profile_cache
+from src.seen_filter import seen_filters
+from src.ranking_profiles import DEFAULT_PROFILE, WEIGHT_PROFILES
+
+# Сколько ближайших кандидатов из geo-индекса передается в SQL
+GEO_CANDIDATES_LIMIT = 2000
+
+# Сколько кандидатов отбирает SQL-фильтр до скоринга
+PRE_FILTER_LIMIT = 500
+
+# Потоковый подбор: строк в чанке скоринга и максимум строк на страницу
+STREAM_CHUNK_SIZE = 50
+STREAM_MAX_ROWS = 500
+
+# Порог совместимости, ниже которого кандидат не показывается
+MIN_MATCH_SCORE = 0.1
 
 logger = logging.getLogger(__name__)
 
+def encode_cursor(position: Dict) -> str:
+    """Непрозрачный токен продолжения ленты"""
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> Dict:
+    """Позиция из токена; пустой или битый токен - начало ленты"""
+    if not cursor:
+        return {}
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return {}
+
+# Колонки строки подбора: координаты числами, факторы кандидата - из ночного
+# пересчета user_features (ELO в нем обновляет EloRatingService при каждом сбросе).
+# Фото агрегируются в SQL только для тех, у кого строки user_features еще нет
+CANDIDATE_COLUMNS = """
+    u.id, u.telegram_id, u.name, u.age, u.gender, u.looking_for, u.city,
+    ST_Y(u.location::geometry) as lat, ST_X(u.location::geometry) as lon,
+    u.bio, u.matches_count, u.likes_received, u.views_count,
+    u.last_active, u.created_at, u.is_premium, u.max_distance, u.elo_rating,
+    ARRAY(
+        SELECT ui.interest_id FROM user_interests ui WHERE ui.user_id = u.id
+    ) as interest_ids,
+    ph.photo_count, ph.photo_quality,
+    f.photo_quality_score, f.popularity_score, f.freshness_score, f.elo_score
+"""
+
+CANDIDATE_FROM = """
+    users u
+    LEFT JOIN user_features f ON f.user_id = u.id
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) as photo_count,
+               AVG(COALESCE(p.quality_score, 0.5))::float8 as photo_quality
+        FROM photos p
+        WHERE f.user_id IS NULL
+        AND p.user_id = u.id AND p.moderation_status = 'approved'
+    ) ph ON true
+"""
+
 @dataclass
 class MatchScore:
     user_id: int
@@ -17,7 +82,7 @@ class MatchScore:
     factors: Dict[str, float]
     explanation: str
 
-@dataclass
+@dataclass(slots=True)
 class UserProfile:
     id: int
     telegram_id: int
@@ -36,199 +101,413 @@ class UserProfile:
     last_active: datetime
     created_at: datetime
     is_premium: bool
+    max_distance: int = DEFAULT_RADIUS_KM  # радиус поиска, км
+    interest_mask: int = 0  # битовая маска по interests.id
+    photo_count: int = 0  # одобренных фото
+    photo_quality: float = 0.0  # среднее quality_score фото
+    elo_rating: float = DEFAULT_RATING  # рейтинг желанности по свайпам
+    static_factors: Optional[Dict[str, float]] = None  # готовые факторы из user_features
 
 class MatchingEngine:
-    def __init__(self, db_connection, cache_service=None):
+    def __init__(self, db_connection, cache_service=None, batch_scoring: bool = True,
+                 geo_index=None, experiment=None):
         self.db = db_connection
         self.cache = cache_service
-        self.weights = {
-            'location': 0.25,      # географическая близость
-            'interests': 0.30,     # общие интересы
-            'activity': 0.15,      # активность пользователя
-            'photo_quality': 0.10, # качество фото
-            'popularity': 0.10,    # популярность
-            'freshness': 0.10      # новизна аккаунта
-        }
+        self.geo_index = geo_index if geo_index is not None else shared_geo_index
+        self.batch_scoring = batch_scoring and HAS_NUMPY  # векторный скоринг (нужен numpy)
+        # Общие пулы хранятся как CandidatePool - тоже только с numpy
+        self.candidate_cache = CandidateCache(cache_service) if cache_service and self.batch_scoring else None
+        self.interest_index = InterestIndex(db_connection)
+        # Веса факторов: профиль по умолчанию или профиль A/B-группы пользователя
+        self.weights = dict(WEIGHT_PROFILES[DEFAULT_PROFILE])
+        self.experiment = experiment  # RankingExperiment или None
     
     async def get_candidates(self, user_id: int, limit: int = 50) -> List[MatchScore]:
-        """Основной алгоритм подбора кандидатов"""
+        """Основной алгоритм подбора кандидатов (первая страница ленты)"""
+        
+        candidates, _ = await self.get_candidates_page(user_id, limit)
+        return candidates
+    
+    async def get_candidates_page(self, user_id: int, limit: int = 50,
+                                  cursor: Optional[str] = None) -> Tuple[List[MatchScore], Optional[str]]:
+        """
+        Страница ленты и токен следующей страницы (None - лента закончилась)
+        
+        Сначала отдается общий пул по сигнатуре фильтров, затем - потоковый
+        подбор по курсору last_active/id. Если пул обрезан лимитом SQL, поток
+        начинается после его последней строки, а не с начала ленты. Курсор
+        по пулу хранит версию пула: если пул пересобран, смещение в старом
+        рейтинге ничего не значит и лента идет по новому пулу с начала.
+        """
         
         try:
+            await self.interest_index.ensure_loaded()
+            
             # 1. Получаем профиль пользователя
             user = await self.get_user_profile(user_id)
             if not user:
                 logger.error(f"User {user_id} not found")
-                return []
-            
-            # 2. Проверяем кэш
-            cache_key = f"candidates:{user_id}:{limit}"
-            if self.cache:
-                cached_candidates = await self.cache.get(cache_key)
-                if cached_candidates:
-                    logger.info(f"Returning cached candidates for user {user_id}")
-                    return json.loads(cached_candidates)
-            
-            # 3. Быстрая предварительная фильтрация
-            candidates = await self._pre_filter_candidates(user)
-            logger.info(f"Found {len(candidates)} candidates after pre-filtering")
+                return [], None
             
-            # 4. Детальный расчет совместимости
-            scored_candidates = []
-            for candidate in candidates[:200]:  # Ограничиваем для производительности
-                try:
-                    score = await self._calculate_match_score(user, candidate)
-                    if score.score > 0.1:  # Минимальный порог
-                        scored_candidates.append(score)
-                except Exception as e:
-                    logger.error(f"Error calculating score for candidate {candidate.id}: {e}")
-                    continue
+            position = decode_cursor(cursor)
+            after = position.get('after')
             
-            # 5. Сортировка по убыванию score
-            scored_candidates.sort(key=lambda x: x.score, reverse=True)
-            
-            # 6. Ограничиваем результат
-            result = scored_candidates[:limit]
+            # 2. Общий пул по сигнатуре фильтров (без учета лимита и свайпов)
+            if self.candidate_cache and 'after' not in position:
+                result, offset, boundary, version = await self._get_shared_candidates(
+                    user, limit, position.get('offset', 0), position.get('pool')
+                )
+                if len(result) >= limit or boundary is None:
+                    logger.info(f"Returning {len(result)} candidates from shared pool for user {user_id}")
+                    return result, encode_cursor({'offset': offset, 'pool': version}) if result else None
+                if result:
+                    # Пул исчерпан: дальше - поток после последней строки пула
+                    logger.info(f"Returning {len(result)} last candidates from shared pool for user {user_id}")
+                    return result, encode_cursor({'after': boundary})
+                after = boundary
             
-            # 7. Кэшируем результат
-            if self.cache:
-                await self.cache.set(cache_key, json.dumps([
-                    {
-                        'user_id': r.user_id,
-                        'score': r.score,
-                        'factors': r.factors,
-                        'explanation': r.explanation
-                    } for r in result
-                ]), ttl=300)  # 5 минут
+            # 3-6. Потоковая фильтрация и расчет совместимости чанками
+            result, after = await self._collect_streamed(user, limit, after)
             
             logger.info(f"Returning {len(result)} scored candidates for user {user_id}")
-            return result
+            return result, encode_cursor({'after': after}) if after else None
             
         except Exception as e:
             logger.error(f"Error in get_candidates for user {user_id}: {e}")
-            return []
+            return [], None
     
-    async def _pre_filter_candidates(self, user: UserProfile) -> List[UserProfile]:
-        """Быстрая предварительная фильтрация кандидатов"""
-        
-        query = """
-            SELECT 
-                u.id, u.telegram_id, u.name, u.age, u.gender, u.looking_for,
-                u.city, u.location, u.bio, u.matches_count, u.likes_received,
-                u.views_count, u.last_active, u.created_at, u.is_premium,
-                ARRAY_AGG(i.name) as interests,
-                ARRAY_AGG(
-                    json_build_object(
-                        'url', p.medium_url,
-                        'quality_score', p.quality_score
-                    )
-                ) as photos
-            FROM users u
-            LEFT JOIN user_interests ui ON u.id = ui.user_id
-            LEFT JOIN interests i ON ui.interest_id = i.id
-            LEFT JOIN photos p ON u.id = p.user_id AND p.moderation_status = 'approved'
-            WHERE u.id != $1  -- не сам пользователь
-            AND u.is_active = true
-            AND u.gender = $2  -- соответствует предпочтениям по полу
-            AND u.age BETWEEN $3 AND $4  -- возраст в диапазоне
-            AND NOT EXISTS (  -- не было взаимодействий
-                SELECT 1 FROM likes l 
-                WHERE l.from_user_id = $1 AND l.to_user_id = u.id
-            )
-            AND (
-                u.location IS NULL OR  -- если нет геолокации
-                ST_DWithin(
-                    u.location::geography,
-                    $5::geography,
-                    $6
-                )
+    async def stream_candidates(self, user: UserProfile, after: Optional[List] = None,
+                                chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[Tuple[List, Optional[MatchScore]]]:
+        """
+        Кандидаты по мере чтения серверного курсора
+        
+        Строки идут в порядке last_active DESC, id DESC и скорятся чанками по
+        chunk_size. Для каждой строки отдается ([last_active, id], MatchScore
+        или None, если кандидат ниже порога) - ключ продолжения ленты.
+        """
+        
+        where, args = self._candidate_filters(user)
+        keyset = ""
+        if after:
+            keyset = f"AND (u.last_active, u.id) < (${len(args) + 1}, ${len(args) + 2})"
+            args = (*args, datetime.fromisoformat(after[0]), after[1])
+        
+        query = f"""
+            SELECT {CANDIDATE_COLUMNS}
+            FROM {CANDIDATE_FROM}
+            WHERE {where}
+            {keyset}
+            ORDER BY u.last_active DESC, u.id DESC  -- idx_users_feed
+        """
+        
+        chunk = []
+        async with aclosing(self._stream_rows(query, *args)) as rows:
+            async for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    for item in await self._score_chunk(user, chunk):
+                        yield item
+                    chunk = []
+        
+        if chunk:
+            for item in await self._score_chunk(user, chunk):
+                yield item
+    
+    async def _collect_streamed(self, user: UserProfile, limit: int,
+                                after: Optional[List]) -> Tuple[List[MatchScore], Optional[List]]:
+        """Читает поток, пока не наберется limit кандидатов выше порога"""
+        
+        result = []
+        last_key = None
+        scanned = 0
+        
+        async with aclosing(self.stream_candidates(user, after)) as candidates:
+            async for key, score in candidates:
+                last_key = key
+                scanned += 1
+                if score is not None:
+                    result.append(score)
+                if len(result) >= limit or scanned >= STREAM_MAX_ROWS:
+                    break
+            else:
+                last_key = None  # поток исчерпан
+        
+        # Внутри страницы - по убыванию score (как list.sort)
+        result.sort(key=lambda x: x.score, reverse=True)
+        return result, last_key
+    
+    async def _score_chunk(self, user: UserProfile, rows) -> List[Tuple[List, Optional[MatchScore]]]:
+        """Скоринг чанка строк с сохранением порядка потока"""
+        
+        scores = {score.user_id: score for score in await self._score_rows(user, rows)}
+        return [
+            ([row['last_active'].isoformat(), row['id']], scores.get(row['id']))
+            for row in rows
+        ]
+    
+    async def _stream_rows(self, query: str, *args):
+        """Строки через серверный курсор (DatabasePool.stream), иначе обычный fetch"""
+        
+        if hasattr(self.db, 'stream'):
+            async for row in self.db.stream(query, *args, prefetch=STREAM_CHUNK_SIZE):
+                yield row
+        else:
+            for row in await self.db.fetch(f"{query} LIMIT {STREAM_MAX_ROWS}", *args):
+                yield row
+    
+    async def _score_rows(self, user: UserProfile, rows,
+                          limit: Optional[int] = None) -> List[MatchScore]:
+        """Скоринг строк подбора: векторно через CandidatePool, без numpy - поштучно"""
+        
+        if self.batch_scoring:
+            try:
+                return self._rank_pool(user, CandidatePool.from_rows(rows), limit)
+            except Exception as e:
+                logger.error(f"Batch scoring failed, falling back to per-candidate scoring: {e}")
+        
+        candidates = [self._profile_from_row(row) for row in rows]
+        return await self._score_candidates(user, candidates, limit)
+    
+    async def _get_shared_candidates(self, user: UserProfile, limit: int, offset: int = 0,
+                                     version: Optional[int] = None
+                                     ) -> Tuple[List[MatchScore], int, Optional[List], int]:
+        """
+        Кандидаты из общего пула пользователей с теми же фильтрами
+        
+        Пул (CandidatePool) отбирается от центра geo-ячейки пользователя и
+        не содержит персональных исключений; скоринг - точно по профилю
+        пользователя, уже просмотренные отсекаются при чтении.
+        offset - позиция в рейтинге пула версии version; для другой версии
+        чтение начинается с начала. Возвращает кандидатов, позицию для
+        следующей страницы, ключ потока после последней строки пула (None -
+        пул полный, за ним кандидатов нет) и версию пула.
+        """
+        
+        age_range = self._get_age_range(user.age)
+        max_distance = user.max_distance or DEFAULT_RADIUS_KM
+        center = self.candidate_cache.cell_center(user.location)
+        signature = self.candidate_cache.signature(
+            user.looking_for, age_range, user.location, max_distance
+        )
+        
+        entry, boundary, current, generations = await self.candidate_cache.get(
+            signature, user.looking_for, center, max_distance
+        )
+        
+        if entry is not None:
+            pool = CandidatePool.from_dict(entry)
+        else:
+            # Фильтр от "обезличенного" профиля: центр ячейки вместо точки
+            probe = replace(user, id=0, location=center)
+            rows = await self._pre_filter_rows(probe, personal=False)
+            pool = CandidatePool.from_rows(rows)
+            # Пул неполный, если уперлись в лимит SQL-фильтра
+            boundary = None
+            if len(rows) >= PRE_FILTER_LIMIT:
+                boundary = [rows[-1]['last_active'].isoformat(), rows[-1]['id']]
+            current = await self.candidate_cache.set(signature, pool.to_dict(), boundary, generations)
+        
+        if version != current:
+            offset = 0  # Пул пересобран - смещение относится к другому рейтингу
+        
+        remaining = self._rank_pool(user, pool)[offset:]
+        seen = await self._get_seen_filter(user.id)
+        result = []
+        for score in remaining:
+            if len(result) >= limit:
+                break
+            offset += 1
+            if score.user_id != user.id and score.user_id not in seen:
+                result.append(score)
+        
+        return result, offset, boundary, current
+    
+    async def _get_seen_filter(self, user_id: int):
+        """
+        Фильтр тех, кого пользователь уже лайкнул или пропустил (bloom-фильтр)
+        
+        Строится из likes один раз и дальше пополняется обработчиками свайпов,
+        так что чтение общего пула не ходит в likes.
+        """
+        
+        async def load_ids():
+            rows = await self.db.fetch(
+                "SELECT to_user_id FROM likes WHERE from_user_id = $1", user_id
             )
-            GROUP BY u.id, u.telegram_id, u.name, u.age, u.gender, u.looking_for,
-                     u.city, u.location, u.bio, u.matches_count, u.likes_received,
-                     u.views_count, u.last_active, u.created_at, u.is_premium
-            ORDER BY u.last_active DESC
-            LIMIT 500
+            return [row['to_user_id'] for row in rows]
+        
+        return await seen_filters.get_or_build(user_id, load_ids)
+    
+    async def on_profile_changed(self, gender: Optional[str], location: Optional[Tuple[float, float]],
+                                 old_gender: Optional[str] = None,
+                                 old_location: Optional[Tuple[float, float]] = None):
+        """Профиль пользователя изменился: сбрасываем общие пулы, где он был или может быть"""
+        
+        if not self.candidate_cache:
+            return
+        
+        if old_gender and (old_gender, old_location) != (gender, location):
+            await self.candidate_cache.invalidate(old_gender, old_location)
+        await self.candidate_cache.invalidate(gender, location)
+    
+    def _candidate_filters(self, user: UserProfile, personal: bool = True) -> Tuple[str, tuple]:
+        """
+        Условия WHERE подбора и их параметры ($1, $2, ... по порядку)
+        
+        personal=False - пул для общего кэша: без исключения самого
+        пользователя и тех, кого он уже лайкнул.
         """
         
+        args = []
+        
+        def param(value) -> str:
+            args.append(value)
+            return f"${len(args)}"
+        
         # Определяем возрастной диапазон
         age_range = self._get_age_range(user.age)
         
         # Определяем максимальное расстояние
-        max_distance = user.max_distance or 50
+        max_distance = user.max_distance or DEFAULT_RADIUS_KM
+        
+        conditions = [
+            "u.is_active = true",
+            f"u.gender = {param(user.looking_for)}",  # соответствует предпочтениям по полу
+            f"u.age BETWEEN {param(age_range['min'])} AND {param(age_range['max'])}",  # возраст в диапазоне
+        ]
+        
+        if personal:
+            user_param = param(user.id)
+            conditions.append(f"u.id != {user_param}")  # не сам пользователь
+            conditions.append(f"""NOT EXISTS (  -- не было взаимодействий
+                SELECT 1 FROM likes l 
+                WHERE l.from_user_id = {user_param} AND l.to_user_id = u.id
+            )""")
+        
+        if user.location and self.geo_index.ready:
+            # Радиус считаем по in-memory сетке, в SQL передаем только ID
+            nearby = self.geo_index.query(
+                user.location[0], user.location[1], max_distance,
+                gender=user.looking_for,
+                min_age=age_range['min'],
+                max_age=age_range['max'],
+                exclude=user.id if personal else None,
+                limit=GEO_CANDIDATES_LIMIT
+            )
+            location_filter = f"u.id = ANY({param([user_id for user_id, _ in nearby])}::bigint[])"
+        else:
+            # Параметры для геолокации (PostGIS)
+            location_params = None
+            if user.location:
+                location_params = f"POINT({user.location[1]} {user.location[0]})"
+            location_filter = (
+                f"ST_DWithin(u.location::geography, {param(location_params)}::geography, "
+                f"{param(max_distance * 1000)})"  # конвертируем в метры
+            )
+        
+        conditions.append(f"""(
+                u.location IS NULL OR  -- если нет геолокации
+                {location_filter}
+            )""")
+        
+        return "\n            AND ".join(conditions), tuple(args)
+    
+    async def _pre_filter_rows(self, user: UserProfile, personal: bool = True) -> List:
+        """Быстрая предварительная фильтрация кандидатов (целиком, для общего пула)"""
+        
+        where, args = self._candidate_filters(user, personal)
         
-        # Параметры для геолокации
-        location_params = None
-        if user.location:
-            location_params = f"POINT({user.location[1]} {user.location[0]})"
+        query = f"""
+            SELECT {CANDIDATE_COLUMNS}
+            FROM {CANDIDATE_FROM}
+            WHERE {where}
+            ORDER BY u.last_active DESC, u.id DESC  -- как в потоке: последняя строка - ключ его продолжения
+            LIMIT {PRE_FILTER_LIMIT}
+        """
         
         try:
-            rows = await self.db.fetch(
-                query,
-                user.id,
-                user.looking_for,
-                age_range['min'],
-                age_range['max'],
-                location_params,
-                max_distance * 1000  # конвертируем в метры
-            )
-            
-            candidates = []
-            for row in rows:
-                candidate = UserProfile(
-                    id=row['id'],
-                    telegram_id=row['telegram_id'],
-                    name=row['name'],
-                    age=row['age'],
-                    gender=row['gender'],
-                    looking_for=row['looking_for'],
-                    city=row['city'],
-                    location=self._parse_location(row['location']),
-                    bio=row['bio'] or '',
-                    interests=[i for i in row['interests'] if i],
-                    photos=[p for p in row['photos'] if p['url']],
-                    matches_count=row['matches_count'],
-                    likes_received=row['likes_received'],
-                    views_count=row['views_count'],
-                    last_active=row['last_active'],
-                    created_at=row['created_at'],
-                    is_premium=row['is_premium']
-                )
-                candidates.append(candidate)
-            
-            return candidates
+            return await self.db.fetch(query, *args)
             
         except Exception as e:
             logger.error(f"Error in pre_filter_candidates: {e}")
             return []
     
+    async def _score_candidates(self, user: UserProfile, candidates: List[UserProfile],
+                                limit: int) -> List[MatchScore]:
+        """Поштучный расчет совместимости (эталонная реализация)"""
+        
+        # Без отсечения по количеству: объем задают вызывающие (чанк потока или
+        # пул), как и в векторном _rank_pool
+        scored_candidates = []
+        for candidate in candidates:
+            try:
+                score = await self._calculate_match_score(user, candidate)
+                if score.score > MIN_MATCH_SCORE:  # Минимальный порог
+                    scored_candidates.append(score)
+            except Exception as e:
+                logger.error(f"Error calculating score for candidate {candidate.id}: {e}")
+                continue
+        
+        # Сортировка по убыванию score
+        scored_candidates.sort(key=lambda x: x.score, reverse=True)
+        
+        return scored_candidates[:limit]
+    
+    def _rank_pool(self, user: UserProfile, pool: CandidatePool,
+                   limit: Optional[int] = None) -> List[MatchScore]:
+        """Векторный расчет совместимости для всего пула за один проход"""
+        
+        self.interest_index.profile_mask(user)
+        factors = score_pool(user, pool, self.weights_for(user.id))
+        
+        # Порог и стабильная сортировка по убыванию score (как list.sort)
+        totals = factors['total']
+        passed = np.flatnonzero(totals > MIN_MATCH_SCORE)  # Минимальный порог
+        order = passed[np.argsort(-totals[passed], kind='stable')][:limit]
+        
+        result = []
+        for i in order:
+            candidate_factors = {name: float(factors[name][i]) for name in FACTOR_NAMES}
+            result.append(MatchScore(
+                user_id=int(pool.ids[i]),
+                score=float(totals[i]),
+                factors=candidate_factors,
+                explanation=self._generate_explanation(candidate_factors, user)
+            ))
+        
+        return result
+    
+    def weights_for(self, user_id: int) -> Dict[str, float]:
+        """Веса факторов для пользователя (с учетом A/B-эксперимента)"""
+        
+        if self.experiment is None:
+            return self.weights
+        return self.experiment.weights_for(user_id)
+    
     async def _calculate_match_score(self, user: UserProfile, candidate: UserProfile) -> MatchScore:
         """Детальный расчет совместимости"""
         
         factors = {}
         total_score = 0.0
+        weights = self.weights_for(user.id)
         
         # 1. Географическая близость
         factors['location'] = self._calculate_location_score(user, candidate)
-        total_score += factors['location'] * self.weights['location']
+        total_score += factors['location'] * weights['location']
         
         # 2. Совпадение интересов
         factors['interests'] = self._calculate_interests_score(user, candidate)
-        total_score += factors['interests'] * self.weights['interests']
+        total_score += factors['interests'] * weights['interests']
         
         # 3. Активность пользователя
         factors['activity'] = self._calculate_activity_score(candidate)
-        total_score += factors['activity'] * self.weights['activity']
+        total_score += factors['activity'] * weights['activity']
         
-        # 4. Качество фото
-        factors['photo_quality'] = self._calculate_photo_quality_score(candidate)
-        total_score += factors['photo_quality'] * self.weights['photo_quality']
-        
-        # 5. Популярность
-        factors['popularity'] = self._calculate_popularity_score(candidate)
-        total_score += factors['popularity'] * self.weights['popularity']
-        
-        # 6. Новизна аккаунта
-        factors['freshness'] = self._calculate_freshness_score(candidate)
-        total_score += factors['freshness'] * self.weights['freshness']
+        # 4-7. Факторы самого кандидата: из user_features или на лету
+        static = self._static_factors(candidate)
+        for name in STATIC_FACTORS:
+            factors[name] = static[name]
+            total_score += factors[name] * weights[name]
         
         # Генерируем объяснение
         explanation = self._generate_explanation(factors, user, candidate)
@@ -261,27 +540,12 @@ class MatchingEngine:
             return 0.2  # Очень далеко
     
     def _calculate_interests_score(self, user: UserProfile, candidate: UserProfile) -> float:
-        """Расчет совместимости интересов (Jaccard similarity)"""
-        
-        if not user.interests or not candidate.interests:
-            return 0.5  # Нейтральный score
-        
-        user_interests = set(user.interests)
-        candidate_interests = set(candidate.interests)
-        
-        # Jaccard similarity
-        intersection = user_interests.intersection(candidate_interests)
-        union = user_interests.union(candidate_interests)
-        
-        if not union:
-            return 0.5
-        
-        jaccard = len(intersection) / len(union)
-        
-        # Бонус за много общих интересов
-        common_bonus = min(0.2, len(intersection) * 0.05)
+        """Расчет совместимости интересов (Jaccard similarity по битовым маскам)"""
         
-        return min(1.0, jaccard + common_bonus)
+        return interests_score(
+            self.interest_index.profile_mask(user),
+            self.interest_index.profile_mask(candidate)
+        )
     
     def _calculate_activity_score(self, candidate: UserProfile) -> float:
         """Расчет активности пользователя"""
@@ -300,53 +564,20 @@ class MatchingEngine:
         else:
             return 0.2  # Неактивен
     
-    def _calculate_photo_quality_score(self, candidate: UserProfile) -> float:
-        """Расчет качества фото"""
-        
-        if not candidate.photos:
-            return 0.3  # Низкий score без фото
-        
-        # Средний score качества фото
-        quality_scores = [p.get('quality_score', 0.5) for p in candidate.photos]
-        avg_quality = sum(quality_scores) / len(quality_scores)
-        
-        # Бонус за количество фото
-        photo_bonus = min(0.2, len(candidate.photos) * 0.05)
-        
-        return min(1.0, avg_quality + photo_bonus)
-    
-    def _calculate_popularity_score(self, candidate: UserProfile) -> float:
-        """Расчет популярности (нормализованный)"""
-        
-        if candidate.likes_received == 0:
-            return 0.5  # Нейтральный score
-        
-        # Коэффициент матчей (сколько матчей из лайков)
-        match_ratio = candidate.matches_count / candidate.likes_received
+    def _static_factors(self, candidate: UserProfile) -> Dict[str, float]:
+        """Качество фото, популярность, новизна и ELO - зависят только от кандидата"""
         
-        # Нормализуем (хороший коэффициент ~0.1-0.2)
-        popularity = min(1.0, match_ratio * 5)
+        if candidate.static_factors:
+            return candidate.static_factors
         
-        return popularity
-    
-    def _calculate_freshness_score(self, candidate: UserProfile) -> float:
-        """Расчет новизны аккаунта"""
-        
-        days_since_joined = (datetime.now() - candidate.created_at).days
-        
-        # Новые пользователи получают приоритет
-        if days_since_joined <= 1:
-            return 1.0  # Только что зарегистрировался
-        elif days_since_joined <= 7:
-            return 0.8  # Неделя
-        elif days_since_joined <= 30:
-            return 0.6  # Месяц
-        elif days_since_joined <= 90:
-            return 0.4  # 3 месяца
-        else:
-            return 0.2  # Старый аккаунт
+        # Пользователь появился после ночного пересчета
+        return compute_static_factors(
+            candidate.likes_received, candidate.matches_count, candidate.photo_count,
+            candidate.photo_quality, candidate.created_at, candidate.elo_rating
+        )
     
-    def _generate_explanation(self, factors: Dict[str, float], user: UserProfile, candidate: UserProfile) -> str:
+    def _generate_explanation(self, factors: Dict[str, float], user: UserProfile,
+                              candidate: Optional[UserProfile] = None) -> str:
         """Генерация объяснения совпадения"""
         
         explanations = []
@@ -381,6 +612,10 @@ class MatchingEngine:
         if factors['freshness'] > 0.8:
             explanations.append("Новый пользователь")
         
+        # Рейтинг по свайпам
+        if factors['elo'] > 0.75:
+            explanations.append("Профиль часто лайкают")
+        
         if explanations:
             return ", ".join(explanations)
         else:
@@ -430,105 +665,101 @@ class MatchingEngine:
         
         return R * c
     
-    def _parse_location(self, location_data) -> Optional[Tuple[float, float]]:
-        """Парсинг данных геолокации из PostgreSQL"""
-        
-        if not location_data:
-            return None
-        
-        try:
-            # Предполагаем формат POINT(lon lat)
-            if hasattr(location_data, 'x') and hasattr(location_data, 'y'):
-                return (location_data.y, location_data.x)  # (lat, lon)
-            else:
-                return None
-        except:
-            return None
-    
     async def get_user_profile(self, user_id: int) -> Optional[UserProfile]:
         """Получение профиля пользователя"""
         
-        query = """
-            SELECT 
-                u.id, u.telegram_id, u.name, u.age, u.gender, u.looking_for,
-                u.city, u.location, u.bio, u.matches_count, u.likes_received,
-                u.views_count, u.last_active, u.created_at, u.is_premium,
-                u.max_distance,
-                ARRAY_AGG(i.name) as interests,
-                ARRAY_AGG(
-                    json_build_object(
+        query = f"""
+            SELECT {CANDIDATE_COLUMNS},
+                ARRAY(
+                    SELECT i.name FROM user_interests ui
+                    JOIN interests i ON ui.interest_id = i.id
+                    WHERE ui.user_id = u.id
+                ) as interests,
+                (
+                    SELECT json_agg(json_build_object(
                         'url', p.medium_url,
                         'quality_score', p.quality_score
-                    )
+                    ) ORDER BY p.position)
+                    FROM photos p
+                    WHERE p.user_id = u.id AND p.moderation_status = 'approved'
                 ) as photos
-            FROM users u
-            LEFT JOIN user_interests ui ON u.id = ui.user_id
-            LEFT JOIN interests i ON ui.interest_id = i.id
-            LEFT JOIN photos p ON u.id = p.user_id AND p.moderation_status = 'approved'
+            FROM {CANDIDATE_FROM}
             WHERE u.id = $1 AND u.is_active = true
-            GROUP BY u.id, u.telegram_id, u.name, u.age, u.gender, u.looking_for,
-                     u.city, u.location, u.bio, u.matches_count, u.likes_received,
-                     u.views_count, u.last_active, u.created_at, u.is_premium, u.max_distance
         """
         
+        # Профиль из двухуровневого кэша (L1 в процессе + Redis)
+        cached = await profile_cache.get('engine', user_id)
+        if cached is not None:
+            return self._profile_from_cache(cached)
+        
         try:
             row = await self.db.fetchrow(query, user_id)
             if not row:
                 return None
             
-            return UserProfile(
-                id=row['id'],
-                telegram_id=row['telegram_id'],
-                name=row['name'],
-                age=row['age'],
-                gender=row['gender'],
-                looking_for=row['looking_for'],
-                city=row['city'],
-                location=self._parse_location(row['location']),
-                bio=row['bio'] or '',
-                interests=[i for i in row['interests'] if i],
-                photos=[p for p in row['photos'] if p['url']],
-                matches_count=row['matches_count'],
-                likes_received=row['likes_received'],
-                views_count=row['views_count'],
-                last_active=row['last_active'],
-                created_at=row['created_at'],
-                is_premium=row['is_premium']
-            )
+            profile = self._profile_from_row(row)
+            profile.interests = [i for i in row['interests'] if i]
+            profile.photos = json.loads(row['photos']) if row['photos'] else []
             
         except Exception as e:
             logger.error(f"Error getting user profile {user_id}: {e}")
             return None
-
-# ELO Rating System для дополнительного ранжирования
-class EloRatingSystem:
-    """ELO система для ранжирования привлекательности профилей"""
-    
-    def __init__(self, k_factor: float = 32):
-        self.k_factor = k_factor
-    
-    def calculate_new_ratings(self, winner_rating: float, loser_rating: float):
-        """Расчет новых ELO рейтингов после свайпа"""
-        
-        expected_winner = 1 / (1 + 10 ** ((loser_rating - winner_rating) / 400))
-        expected_loser = 1 / (1 + 10 ** ((winner_rating - loser_rating) / 400))
         
-        new_winner_rating = winner_rating + self.k_factor * (1 - expected_winner)
-        new_loser_rating = loser_rating + self.k_factor * (0 - expected_loser)
+        # Маска (большое int) не сериализуется — в кэш кладем ID интересов
+        data = asdict(profile)
+        del data['interest_mask']
+        data['interest_ids'] = [i for i in row['interest_ids'] if i is not None]
+        await profile_cache.set('engine', user_id, data, telegram_id=profile.telegram_id)
         
-        return new_winner_rating, new_loser_rating
+        return profile
     
-    async def update_ratings_on_like(self, db, liker_id: int, liked_id: int):
-        """Обновление ELO при получении лайка"""
+    def _profile_from_cache(self, data: Dict) -> UserProfile:
+        """Сборка UserProfile из записи кэша профилей"""
         
-        # Получаем текущие рейтинги
-        liker_elo = await db.fetchval("SELECT elo_rating FROM users WHERE id = $1", liker_id) or 1200
-        liked_elo = await db.fetchval("SELECT elo_rating FROM users WHERE id = $1", liked_id) or 1200
+        fields = dict(data)
+        interest_mask = self.interest_index.encode_ids(fields.pop('interest_ids', []))
         
-        # Рассчитываем новые рейтинги (лайкнутый "выигрывает")
-        new_liked_elo, _ = self.calculate_new_ratings(liked_elo, liker_elo)
+        if fields['location'] is not None:
+            fields['location'] = tuple(fields['location'])
+        
+        return UserProfile(**fields, interest_mask=interest_mask)
+    
+    def _profile_from_row(self, row) -> UserProfile:
+        """
+        Сборка UserProfile из строки запроса (колонки CANDIDATE_COLUMNS)
         
-        # Обновляем рейтинг лайкнутого пользователя
-        await db.execute("UPDATE users SET elo_rating = $1 WHERE id = $2", new_liked_elo, liked_id)
+        Названия интересов и список фото в строке подбора не выбираются -
+        для скоринга нужны маска интересов и агрегаты фото.
+        """
         
-        return new_liked_elo
+        # Маска строится по ID интересов и живет в самом профиле
+        interest_mask = self.interest_index.encode_ids(row['interest_ids'])
+        
+        return UserProfile(
+            id=row['id'],
+            telegram_id=row['telegram_id'],
+            name=row['name'],
+            age=row['age'],
+            gender=row['gender'],
+            looking_for=row['looking_for'],
+            city=row['city'],
+            location=(row['lat'], row['lon']) if row['lat'] is not None else None,
+            bio=row['bio'] or '',
+            interests=[],
+            photos=[],
+            matches_count=row['matches_count'],
+            likes_received=row['likes_received'],
+            views_count=row['views_count'],
+            last_active=row['last_active'],
+            created_at=row['created_at'],
+            is_premium=row['is_premium'],
+            max_distance=row['max_distance'],
+            interest_mask=interest_mask,
+            photo_count=row['photo_count'] or 0,
+            photo_quality=row['photo_quality'] or 0.0,
+            elo_rating=row['elo_rating'] or DEFAULT_RATING,
+            static_factors=(
+                {name: row[column] for name, column in zip(STATIC_FACTORS, FEATURE_COLUMNS)}
+                if row['popularity_score'] is not None else None
+            )
+        )
@@ -10,6 +10,9 @@ import uuid
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 
+from src.notification_preferences import notification_preferences
+from src.profile_cache import profile_cache
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -34,11 +37,14 @@ class ChatSession:
     is_active: bool = True
 
 class MessagingService:
-    def __init__(self, bot, db_connection, cache_service=None, websocket_service=None):
+    def __init__(self, bot, db_connection, cache_service=None, websocket_service=None,
+                 outbox=None, notification_service=None):
         self.bot = bot
         self.db = db_connection
         self.cache = cache_service
         self.websocket = websocket_service
+        self.outbox = outbox  # NotificationOutbox: отправка в фоне с учетом лимитов Telegram
+        self.notifications = notification_service  # NotificationService: уведомления о сообщениях со сводками
         self.active_chats = {}  # In-memory cache для активных чатов
     
     async def send_message(self, from_user: int, to_user: int, content: str, 
@@ -239,7 +245,7 @@ class MessagingService:
         
         # Отправляем уведомление пользователю
         try:
-            await self.bot.send_message(
+            await self._send_message(
                 chat_id=user_id,
                 text=f"💬 <b>Чат с {match_info['partner_name']}</b>\n\n"
                      f"Теперь ты можешь писать сообщения прямо здесь!\n"
@@ -259,6 +265,14 @@ class MessagingService:
     # PRIVATE METHODS
     # ===================================
     
+    async def _send_message(self, **kwargs):
+        """Отправка через outbox (не ждет Telegram), без него - напрямую"""
+        
+        if self.outbox is not None:
+            await self.outbox.enqueue(**kwargs)
+        else:
+            await self.bot.send_message(**kwargs)
+    
     async def _get_or_create_match(self, user1_id: int, user2_id: int) -> Optional[Dict]:
         """Найти или создать матч между пользователями"""
         
@@ -375,11 +389,23 @@ class MessagingService:
                                         content: str, match_id: int):
         """Отправка уведомления через Telegram"""
         
+        if self.notifications is not None:
+            # Настройки, антиспам и сводки - в NotificationService
+            await self.notifications.send_message_notification(user_id, sender_id, content, match_id)
+            return
+        
         try:
-            # Получаем информацию об отправителе
-            sender_info = await self.db.fetchrow(
-                "SELECT name, age FROM users WHERE id = $1", sender_id
-            )
+            if not await notification_preferences.is_enabled(user_id, 'messages'):
+                return
+            
+            # Получаем информацию об отправителе (через кэш профилей)
+            async def load_sender():
+                row = await self.db.fetchrow(
+                    "SELECT name, age FROM users WHERE id = $1", sender_id
+                )
+                return {'name': row['name'], 'age': row['age']} if row else None
+            
+            sender_info = await profile_cache.get_or_load('sender', sender_id, load_sender)
             
             if not sender_info:
                 return
@@ -396,7 +422,7 @@ class MessagingService:
                 [InlineKeyboardButton("✍️ Ответить здесь", callback_data=f"reply_{match_id}")]
             ]
             
-            await self.bot.send_message(
+            await self._send_message(
                 chat_id=user_id,
                 text=f"💬 <b>Новое сообщение от {sender_name}, {sender_age}</b>\n\n{preview}",
                 parse_mode='HTML',
@@ -0,0 +1,273 @@
+# src/notification_campaigns.py - Bulk notification campaigns with resumable progress
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.notification_outbox import GLOBAL_RATE, TokenBucket
+from src.notification_preferences import ALL_ENABLED, notification_preferences, type_enabled
+
+try:
+    from telegram.error import BadRequest, Forbidden, RetryAfter
+except ImportError:
+    BadRequest = Forbidden = RetryAfter = None
+
+logger = logging.getLogger(__name__)
+
+# Users per keyset page (and per checkpoint)
+PAGE_SIZE = 1000
+
+# Concurrent send_message calls in flight
+SENDERS = 8
+
+# Attempts per message when Telegram answers 429
+MAX_ATTEMPTS = 3
+
+
+@dataclass
+class Campaign:
+    """
+    One periodic bulk notification
+
+    `where` is an SQL condition on `users u` in which $1 is the run's start
+    time; active, non-banned users are implied. variant(row, started_at)
+    picks the template for a user (None skips them) and render(variant)
+    returns the send_message keyword arguments - it is called once per
+    variant per run. Users who switched off the `setting` notification
+    type, or who have any of `skip_keys` in the cache, are skipped;
+    `mark_key` is set for every user the message went to.
+    """
+    name: str
+    where: str
+    render: Callable[[str], Optional[Dict[str, Any]]]
+    interval: timedelta
+    variant: Callable[[Any, datetime], Optional[str]] = lambda row, started_at: 'default'
+    setting: Optional[str] = None
+    skip_keys: Tuple[str, ...] = ()
+    mark_key: Optional[str] = None
+    mark_ttl: Optional[int] = None
+
+
+class CampaignRunner:
+    """
+    Pages through a campaign's audience and sends with a bounded sender pool
+
+    Eligible users are read in keyset pages (id > last id) together with the
+    columns templates need; notification settings for the whole page are
+    loaded into the preferences store with one query and cache-held
+    cooldowns with one round trip. Messages go straight to the bot from
+    SENDERS workers under a token bucket - the outbox's global bucket when
+    one is given, so campaigns and transactional notifications share
+    Telegram's limit, and at most SENDERS campaign messages are ever ahead
+    of a transactional one.
+
+    Progress is checkpointed per page in notification_campaign_runs; a run
+    interrupted by stop() or a crash resumes after the last finished page
+    with the same start time, so at most the page in flight during a crash
+    is sent again.
+    """
+
+    def __init__(self, bot, db, cache=None, outbox=None, preferences=notification_preferences,
+                 page_size: int = PAGE_SIZE, senders: int = SENDERS, rate: float = GLOBAL_RATE):
+        self.bot = bot
+        self.db = db
+        self.cache = cache
+        self.preferences = preferences
+        self.page_size = page_size
+        self.senders = senders
+        self.bucket = outbox.global_bucket if outbox is not None else TokenBucket(rate, rate)
+        self.stopping = False
+
+        # Metrics
+        self.runs = 0
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+
+    async def ensure_table(self):
+        await self.db.execute("""
+            CREATE TABLE IF NOT EXISTS notification_campaign_runs (
+                campaign VARCHAR(50) PRIMARY KEY,
+                started_at TIMESTAMP NOT NULL,
+                last_user_id BIGINT NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                finished_at TIMESTAMP
+            )
+        """)
+
+    async def seconds_until_due(self, campaign: Campaign) -> float:
+        """0 if the campaign has an unfinished run or its interval has passed"""
+        row = await self._checkpoint(campaign)
+        if row is None or row['finished_at'] is None:
+            return 0.0
+        due = _as_datetime(row['started_at']) + campaign.interval
+        return max(0.0, (due - datetime.now()).total_seconds())
+
+    async def run(self, campaign: Campaign) -> Dict[str, int]:
+        """Run (or resume) the campaign to the end; returns this run's totals"""
+        row = await self._checkpoint(campaign)
+        if row is not None and row['finished_at'] is None:
+            started_at = _as_datetime(row['started_at'])
+            last_id, sent, skipped = row['last_user_id'], row['sent'], row['skipped']
+            logger.info(f"Campaign {campaign.name}: resuming after user {last_id}")
+        else:
+            started_at, last_id, sent, skipped = datetime.now(), 0, 0, 0
+            await self.db.execute("""
+                INSERT INTO notification_campaign_runs (campaign, started_at, last_user_id, sent, skipped)
+                VALUES ($1, $2, 0, 0, 0)
+                ON CONFLICT (campaign) DO UPDATE SET
+                    started_at = EXCLUDED.started_at, last_user_id = 0,
+                    sent = 0, skipped = 0, finished_at = NULL
+            """, campaign.name, started_at)
+
+        query = f"""
+            SELECT u.id, u.telegram_id, u.last_active
+            FROM users u
+            WHERE u.is_active = true AND u.is_banned = false
+            AND u.id > $2 AND ({campaign.where})
+            ORDER BY u.id
+            LIMIT $3
+        """
+        messages: Dict[str, Optional[Dict[str, Any]]] = {}
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.senders * 2)
+        workers = [asyncio.create_task(self._sender(queue)) for _ in range(self.senders)]
+
+        try:
+            while not self.stopping:
+                rows = await self.db.fetch(query, started_at, last_id, self.page_size)
+                if not rows:
+                    break
+
+                recipients = await self._recipients(campaign, rows, started_at, messages)
+                skipped += len(rows) - len(recipients)
+                delivered: List[int] = []
+                for user_id, chat_id, message in recipients:
+                    await queue.put((user_id, chat_id, message, delivered))
+                await queue.join()
+                sent += len(delivered)
+
+                if campaign.mark_key and self.cache and delivered:
+                    await self.cache.set_many(
+                        {campaign.mark_key.format(user_id=user_id): '1' for user_id in delivered},
+                        ttl=campaign.mark_ttl
+                    )
+
+                last_id = rows[-1]['id']
+                await self.db.execute("""
+                    UPDATE notification_campaign_runs
+                    SET last_user_id = $2, sent = $3, skipped = $4
+                    WHERE campaign = $1
+                """, campaign.name, last_id, sent, skipped)
+                self.sent += len(delivered)
+                self.skipped += len(rows) - len(recipients)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        if self.stopping:
+            logger.info(f"Campaign {campaign.name}: stopped after user {last_id}, will resume")
+        else:
+            await self.db.execute(
+                "UPDATE notification_campaign_runs SET finished_at = $2 WHERE campaign = $1",
+                campaign.name, datetime.now()
+            )
+            self.runs += 1
+            logger.info(f"Campaign {campaign.name}: finished, {sent} sent, {skipped} skipped")
+        return {'sent': sent, 'skipped': skipped}
+
+    def start(self):
+        """Allow run() to send again after a stop()"""
+        self.stopping = False
+
+    def stop(self):
+        """Finish the current page, checkpoint it and return from run(); in effect until start()"""
+        self.stopping = True
+
+    def metrics(self) -> Dict:
+        return {
+            'runs': self.runs,
+            'sent': self.sent,
+            'skipped': self.skipped,
+            'failed': self.failed
+        }
+
+    # ===================================
+    # PRIVATE METHODS
+    # ===================================
+
+    async def _checkpoint(self, campaign: Campaign):
+        return await self.db.fetchrow(
+            "SELECT started_at, last_user_id, sent, skipped, finished_at "
+            "FROM notification_campaign_runs WHERE campaign = $1",
+            campaign.name
+        )
+
+    async def _recipients(self, campaign: Campaign, rows, started_at: datetime,
+                          messages: Dict[str, Optional[Dict[str, Any]]]) -> List[Tuple[int, int, Dict]]:
+        """(user_id, chat_id, send kwargs) for the page's users who should get the message"""
+        masks: Dict[int, int] = {}
+        if campaign.setting:
+            masks = await self.preferences.load(row['id'] for row in rows)
+
+        cached: Dict[str, Any] = {}
+        if self.cache and campaign.skip_keys:
+            cached = await self.cache.get_many(
+                key.format(user_id=row['id']) for row in rows for key in campaign.skip_keys
+            )
+
+        recipients = []
+        for row in rows:
+            user_id = row['id']
+            if campaign.setting and not type_enabled(masks.get(user_id, ALL_ENABLED), campaign.setting):
+                continue
+            if any(key.format(user_id=user_id) in cached for key in campaign.skip_keys):
+                continue
+
+            variant = campaign.variant(row, started_at)
+            if variant is None:
+                continue
+            if variant not in messages:
+                messages[variant] = campaign.render(variant)
+            if messages[variant] is None:
+                continue
+            recipients.append((user_id, row['telegram_id'], messages[variant]))
+        return recipients
+
+    async def _sender(self, queue: asyncio.Queue):
+        while True:
+            user_id, chat_id, message, delivered = await queue.get()
+            try:
+                if await self._send(chat_id, message):
+                    delivered.append(user_id)
+            finally:
+                queue.task_done()
+
+    async def _send(self, chat_id: int, message: Dict[str, Any]) -> bool:
+        for _ in range(MAX_ATTEMPTS):
+            await asyncio.sleep(self.bucket.reserve())
+            try:
+                await self.bot.send_message(chat_id=chat_id, **message)
+                return True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if RetryAfter is not None and isinstance(e, RetryAfter):
+                    retry_after = e.retry_after
+                    if isinstance(retry_after, timedelta):
+                        retry_after = retry_after.total_seconds()
+                    self.bucket.pause(retry_after)
+                    continue
+                if Forbidden is None or not isinstance(e, (Forbidden, BadRequest)):
+                    logger.warning(f"Campaign send to {chat_id} failed: {e}")
+                break
+        self.failed += 1
+        return False
+
+
+def _as_datetime(value) -> datetime:
+    # SQLite hands timestamps back as ISO strings
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
@@ -0,0 +1,114 @@
+# src/notification_digest.py - Per-recipient coalescing of like/message notifications
+
+import asyncio
+import heapq
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds events are held per recipient before one digest goes out
+DIGEST_WINDOW = 300
+
+
+@dataclass
+class DigestEvent:
+    kind: str                  # 'like' | 'message'
+    actor_id: int
+    actor_name: str
+    message: Dict[str, Any]    # send_message kwargs of the instant notification
+
+
+Deliver = Callable[[int, List[DigestEvent]], Awaitable[None]]
+
+
+class NotificationCoalescer:
+    """
+    Buffers notification events per recipient for a window, then delivers them together
+
+    The first event for a recipient is not held: add() returns True and
+    the caller sends it as usual, which opens a window of `window`
+    seconds. Everything that arrives for them until it closes is handed
+    to the attached deliver(user_id, events) callback in one call, which
+    sends a single digest (or the plain notification when only one event
+    came); a window with nothing buffered closes silently. Buffers live
+    in memory: stop() delivers whatever is pending.
+    """
+
+    def __init__(self, window: float = DIGEST_WINDOW, tick: float = 1.0):
+        self.window = window
+        self.tick = tick
+        self.deliver: Optional[Deliver] = None
+
+        self.pending: Dict[int, List[DigestEvent]] = {}
+        self.deadlines: List[Tuple[float, int]] = []  # heap of (due, user_id)
+        self.task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.events = 0
+        self.deliveries = 0
+
+    def attach(self, deliver: Deliver):
+        self.deliver = deliver
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    def add(self, user_id: int, event: DigestEvent) -> bool:
+        """Buffer the event; True if no window was open and the caller should send it now"""
+        self.events += 1
+        events = self.pending.get(user_id)
+        if events is None:
+            self.pending[user_id] = []
+            heapq.heappush(self.deadlines, (time.monotonic() + self.window, user_id))
+            self.deliveries += 1
+            return True
+        events.append(event)
+        return False
+
+    async def flush(self):
+        """Deliver every pending buffer now"""
+        self.deadlines = []
+        pending, self.pending = self.pending, {}
+        for user_id, events in pending.items():
+            if events:
+                await self._deliver(user_id, events)
+
+    def metrics(self) -> Dict:
+        return {
+            'events': self.events,
+            'deliveries': self.deliveries,
+            'messages_saved': self.events - self.deliveries - sum(len(e) for e in self.pending.values()),
+            'recipients_pending': len(self.pending)
+        }
+
+    # ===================================
+    # PRIVATE METHODS
+    # ===================================
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            now = time.monotonic()
+            while self.deadlines and self.deadlines[0][0] <= now:
+                _, user_id = heapq.heappop(self.deadlines)
+                events = self.pending.pop(user_id, None)
+                if events:
+                    await self._deliver(user_id, events)
+
+    async def _deliver(self, user_id: int, events: List[DigestEvent]):
+        self.deliveries += 1
+        try:
+            await self.deliver(user_id, events)
+        except Exception as e:
+            logger.error(f"Error delivering digest to {user_id}: {e}")
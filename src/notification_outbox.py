@@ -0,0 +1,266 @@
+# src/notification_outbox.py - Persistent outbox for Telegram notifications
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+try:
+    from telegram import InlineKeyboardMarkup
+    from telegram.error import BadRequest, Forbidden, RetryAfter
+except ImportError:  # outbox still queues and persists; sending needs python-telegram-bot
+    InlineKeyboardMarkup = None
+    BadRequest = Forbidden = RetryAfter = None
+
+logger = logging.getLogger(__name__)
+
+# Telegram Bot API limits
+GLOBAL_RATE = 30.0    # messages per second across all chats
+PER_CHAT_RATE = 1.0   # messages per second to one chat
+
+# Per-chat buckets kept before idle (full) ones are dropped
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Token bucket where reserve() takes a token now and returns how long to wait for it"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """Refuse tokens for the next `seconds`"""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def idle(self) -> bool:
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+@dataclass
+class OutboxItem:
+    id: int
+    chat_id: int
+    payload: Dict[str, Any]  # send_message keyword arguments except chat_id
+    attempts: int = 0
+    chat_slot: bool = False  # per-chat token already reserved, the item waited for it on a timer
+
+
+class NotificationOutbox:
+    """
+    Queue of outgoing bot messages with a pool of sender workers
+
+    enqueue() writes the message to the notification_outbox table and
+    returns; workers send it within Telegram's global and per-chat rate
+    limits (token buckets) and delete the row once Telegram accepts it;
+    a message to a chat over its limit waits on a timer, not in a worker.
+    On 429 the whole pool pauses for retry_after; network errors are
+    retried with exponential backoff up to max_attempts; chats that
+    blocked the bot and malformed messages are dropped. Rows left over
+    from a previous run are re-queued by start().
+    """
+
+    def __init__(self, bot, db, workers: int = 4, max_attempts: int = 5,
+                 global_rate: float = GLOBAL_RATE, per_chat_rate: float = PER_CHAT_RATE):
+        self.bot = bot
+        self.db = db
+        self.worker_count = workers
+        self.max_attempts = max_attempts
+        self.per_chat_rate = per_chat_rate
+
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.workers: List[asyncio.Task] = []
+        self.retry_handles: List[asyncio.TimerHandle] = []
+
+        # Metrics
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self.rate_limited = 0
+
+    async def start(self):
+        """Create the table if needed, re-queue unsent rows and start the workers"""
+        await self.ensure_table()
+
+        rows = await self.db.fetch(
+            "SELECT id, chat_id, payload, attempts, next_attempt_at FROM notification_outbox ORDER BY id"
+        )
+        now = datetime.utcnow()
+        for row in rows:
+            item = OutboxItem(row['id'], row['chat_id'], json.loads(row['payload']), row['attempts'])
+            next_attempt_at = row['next_attempt_at']
+            if isinstance(next_attempt_at, str):
+                next_attempt_at = datetime.fromisoformat(next_attempt_at)
+            self._schedule(item, (next_attempt_at - now).total_seconds())
+        if rows:
+            logger.info(f"Notification outbox: {len(rows)} unsent messages re-queued")
+
+        for i in range(self.worker_count):
+            self.workers.append(asyncio.create_task(self._worker(i)))
+
+    async def stop(self):
+        """Stop the workers; unsent messages stay in the table for the next start"""
+        for handle in self.retry_handles:
+            handle.cancel()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def ensure_table(self):
+        id_column = "BIGSERIAL PRIMARY KEY" if self.db.is_postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
+        await self.db.execute(f"""
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id {id_column},
+                chat_id BIGINT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP NOT NULL,
+                created_at TIMESTAMP NOT NULL
+            )
+        """)
+
+    async def enqueue(self, chat_id: int, text: str, **kwargs) -> int:
+        """Persist a send_message(chat_id, text, **kwargs) call and queue it; returns the outbox id"""
+        reply_markup = kwargs.get('reply_markup')
+        if reply_markup is not None and hasattr(reply_markup, 'to_dict'):
+            kwargs['reply_markup'] = reply_markup.to_dict()
+        payload = {'text': text, **kwargs}
+
+        now = datetime.utcnow()
+        outbox_id = await self.db.fetchval(
+            "INSERT INTO notification_outbox (chat_id, payload, attempts, next_attempt_at, created_at) "
+            "VALUES ($1, $2, 0, $3, $3) RETURNING id",
+            chat_id, json.dumps(payload), now
+        )
+        self.queue.put_nowait(OutboxItem(outbox_id, chat_id, payload))
+        self.enqueued += 1
+        return outbox_id
+
+    def metrics(self) -> Dict:
+        return {
+            'queued': self.queue.qsize(),
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'retried': self.retried,
+            'dropped': self.dropped,
+            'rate_limited': self.rate_limited
+        }
+
+    # ===================================
+    # PRIVATE METHODS
+    # ===================================
+
+    async def _worker(self, number: int):
+        while True:
+            item = await self.queue.get()
+            try:
+                await self._deliver(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker {number}: error delivering {item.id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, item: OutboxItem):
+        # Per-chat limit first, then the global one, so a busy chat does not burn global tokens.
+        # A chat over its limit does not hold the worker: the item reserves the chat's next
+        # slot (reservations keep the chat's messages in order) and comes back on a timer
+        if item.chat_slot:
+            item.chat_slot = False
+        else:
+            wait = self._chat_bucket(item.chat_id).reserve()
+            if wait > 0:
+                item.chat_slot = True
+                self._schedule(item, wait)
+                return
+        await asyncio.sleep(self.global_bucket.reserve())
+
+        try:
+            await self.bot.send_message(chat_id=item.chat_id, **self._send_kwargs(item.payload))
+        except Exception as e:
+            await self._on_error(item, e)
+            return
+
+        self.sent += 1
+        await self.db.execute("DELETE FROM notification_outbox WHERE id = $1", item.id)
+
+    async def _on_error(self, item: OutboxItem, error: Exception):
+        if RetryAfter is not None and isinstance(error, RetryAfter):
+            retry_after = error.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            # Flood control applies to the bot, so hold every worker
+            self.rate_limited += 1
+            self.global_bucket.pause(retry_after)
+            await self._retry(item, retry_after)
+            return
+
+        if Forbidden is not None and isinstance(error, (Forbidden, BadRequest)):
+            logger.warning(f"Outbox: dropping message {item.id} to {item.chat_id}: {error}")
+            await self._drop(item)
+            return
+
+        item.attempts += 1
+        if item.attempts >= self.max_attempts:
+            logger.error(f"Outbox: giving up on message {item.id} after {item.attempts} attempts: {error}")
+            await self._drop(item)
+            return
+
+        logger.warning(f"Outbox: message {item.id} failed ({error}), retrying")
+        await self._retry(item, 2 ** item.attempts)
+
+    async def _retry(self, item: OutboxItem, delay: float):
+        self.retried += 1
+        await self.db.execute(
+            "UPDATE notification_outbox SET attempts = $1, next_attempt_at = $2 WHERE id = $3",
+            item.attempts, datetime.utcnow() + timedelta(seconds=delay), item.id
+        )
+        self._schedule(item, delay)
+
+    async def _drop(self, item: OutboxItem):
+        self.dropped += 1
+        await self.db.execute("DELETE FROM notification_outbox WHERE id = $1", item.id)
+
+    def _schedule(self, item: OutboxItem, delay: float):
+        if delay <= 0:
+            self.queue.put_nowait(item)
+            return
+        loop = asyncio.get_running_loop()
+        self.retry_handles = [handle for handle in self.retry_handles if handle.when() > loop.time()]
+        self.retry_handles.append(loop.call_later(delay, self.queue.put_nowait, item))
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                self.chat_buckets = {key: b for key, b in self.chat_buckets.items() if not b.idle}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, 1)
+        return bucket
+
+    def _send_kwargs(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs = dict(payload)
+        if isinstance(kwargs.get('reply_markup'), dict) and InlineKeyboardMarkup is not None:
+            kwargs['reply_markup'] = InlineKeyboardMarkup.de_json(kwargs['reply_markup'], self.bot)
+        return kwargs
@@ -0,0 +1,219 @@
+# src/notification_preferences.py - Per-user notification switches as in-process bitmasks
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "notification_settings:invalidate"
+
+# Keys of users.notification_settings; the position is the bit in the mask.
+# Missing keys mean "enabled". 'digest' is the delivery mode of likes and
+# messages: on - the first event is pushed and the rest of the window is
+# coalesced into a digest, off - one push per event.
+NOTIFICATION_TYPES = ('matches', 'likes', 'messages', 'premium', 'reminders', 'digest')
+
+_BITS = {name: 1 << i for i, name in enumerate(NOTIFICATION_TYPES)}
+
+ALL_ENABLED = (1 << len(NOTIFICATION_TYPES)) - 1
+
+# Ids per load query
+LOAD_BATCH = 1000
+
+
+def mask_from_settings(settings: Any) -> int:
+    """Bitmask of enabled types from a notification_settings value (dict, JSON text or NULL)"""
+    if isinstance(settings, (str, bytes)):
+        try:
+            settings = json.loads(settings)
+        except ValueError:
+            settings = None
+    if not isinstance(settings, dict):
+        return ALL_ENABLED
+
+    mask = ALL_ENABLED
+    for name, bit in _BITS.items():
+        if not settings.get(name, True):
+            mask &= ~bit
+    return mask
+
+
+def type_enabled(mask: int, notification_type: str) -> bool:
+    return bool(mask & _BITS.get(notification_type, ALL_ENABLED))
+
+
+def settings_from_mask(mask: int) -> Dict[str, bool]:
+    return {name: bool(mask & bit) for name, bit in _BITS.items()}
+
+
+class NotificationPreferences:
+    """
+    Bounded LRU of user_id -> enabled-types bitmask
+
+    load() fills the cache for many users with one query per LOAD_BATCH
+    ids, after which enabled() is a dict lookup and a bit test - cheap
+    enough to call for every recipient of a fan-out. Entries expire after
+    `ttl` seconds so changes made by other processes are picked up even
+    without Redis; writers call invalidate(), which is also broadcast to
+    other workers over the cache's pub/sub.
+    """
+
+    def __init__(self, db=None, cache_service=None, max_users: int = 200_000, ttl: float = 600):
+        self.db = db
+        self.cache = cache_service
+        self.max_users = max_users
+        self.ttl = ttl
+
+        self.masks: 'OrderedDict[int, tuple]' = OrderedDict()  # user_id -> (expires, mask)
+        self.listener: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+
+    def attach(self, db, cache_service=None):
+        self.db = db
+        self.cache = cache_service
+
+    async def start(self):
+        """Subscribe to invalidations published by other workers"""
+        if self.cache is not None:
+            self.listener = asyncio.create_task(
+                self.cache.listen(INVALIDATION_CHANNEL, self._on_invalidation)
+            )
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+            await asyncio.gather(self.listener, return_exceptions=True)
+            self.listener = None
+
+    async def load(self, user_ids: Iterable[int]) -> Dict[int, int]:
+        """Masks of user_ids, querying only the ones not cached"""
+        now = time.monotonic()
+        masks: Dict[int, int] = {}
+        missing = []
+        for user_id in user_ids:
+            entry = self.masks.get(user_id)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                masks[user_id] = entry[1]
+            else:
+                self.misses += 1
+                missing.append(user_id)
+
+        for start in range(0, len(missing), LOAD_BATCH):
+            batch = missing[start:start + LOAD_BATCH]
+            try:
+                rows = await self.db.fetch(
+                    "SELECT id, notification_settings FROM users WHERE id = ANY($1::bigint[])",
+                    batch
+                )
+                self.queries += 1
+            except Exception as e:
+                # Same fallback as before: notifications stay enabled, nothing cached
+                logger.error(f"Error loading notification settings: {e}")
+                masks.update((user_id, ALL_ENABLED) for user_id in missing[start:])
+                return masks
+
+            found = {row['id']: mask_from_settings(row['notification_settings']) for row in rows}
+            for user_id in batch:
+                masks[user_id] = found.get(user_id, ALL_ENABLED)
+                self._set(user_id, masks[user_id])
+        return masks
+
+    def enabled(self, user_id: int, notification_type: str) -> bool:
+        """Cached switch for the user; users not loaded (or unknown types) count as enabled"""
+        entry = self.masks.get(user_id)
+        if entry is None:
+            return True
+        self.masks.move_to_end(user_id)
+        return type_enabled(entry[1], notification_type)
+
+    async def is_enabled(self, user_id: int, notification_type: str) -> bool:
+        masks = await self.load((user_id,))
+        return type_enabled(masks[user_id], notification_type)
+
+    async def filter(self, user_ids: Iterable[int], notification_type: str) -> List[int]:
+        """user_ids (in order) that have notification_type switched on"""
+        user_ids = list(user_ids)
+        masks = await self.load(user_ids)
+        return [user_id for user_id in user_ids if type_enabled(masks[user_id], notification_type)]
+
+    async def set(self, user_id: int, notification_type: str, enabled: bool):
+        """Persist one switch and drop the cached mask"""
+        if notification_type not in _BITS:
+            raise ValueError(f"Unknown notification type: {notification_type}")
+
+        row = await self.db.fetchrow(
+            "SELECT notification_settings FROM users WHERE id = $1", user_id
+        )
+        settings = settings_from_mask(mask_from_settings(row['notification_settings'] if row else None))
+        settings[notification_type] = enabled
+        await self.db.execute(
+            "UPDATE users SET notification_settings = $2 WHERE id = $1",
+            user_id, json.dumps(settings)
+        )
+        self.invalidate(user_id)
+
+    def invalidate(self, user_id: int):
+        """
+        Drop the cached mask after the user's settings were written
+
+        Synchronous so sync handlers can call it; the broadcast to other
+        workers is scheduled on the running loop, without one other
+        processes catch up when their entry expires.
+        """
+        self.masks.pop(user_id, None)
+
+        if self.cache is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.create_task(self._publish_invalidation(user_id))
+
+    async def invalidate_everywhere(self, user_id: int):
+        """invalidate() that waits for the broadcast - for sync callers driving their own loop"""
+        self.masks.pop(user_id, None)
+        if self.cache is not None:
+            await self._publish_invalidation(user_id)
+
+    def metrics(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'queries': self.queries,
+            'users': len(self.masks)
+        }
+
+    # ===================================
+    # PRIVATE METHODS
+    # ===================================
+
+    def _set(self, user_id: int, mask: int):
+        self.masks[user_id] = (time.monotonic() + self.ttl, mask)
+        self.masks.move_to_end(user_id)
+        while len(self.masks) > self.max_users:
+            self.masks.popitem(last=False)
+
+    async def _publish_invalidation(self, user_id: int):
+        try:
+            await self.cache.publish(INVALIDATION_CHANNEL, {'user_id': user_id})
+        except Exception as e:
+            logger.error(f"Error publishing notification settings invalidation for {user_id}: {e}")
+
+    async def _on_invalidation(self, message: Dict[str, Any]):
+        self.masks.pop(message.get('user_id'), None)
+
+
+# Process-wide store shared by the notification services and the campaign runner
+notification_preferences = NotificationPreferences()
@@ -2,18 +2,28 @@
 
 import asyncio
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 
+from src.notification_campaigns import Campaign, CampaignRunner
+from src.notification_digest import DigestEvent
+from src.notification_preferences import notification_preferences
+from src.profile_cache import profile_cache
+
 logger = logging.getLogger(__name__)
 
 class NotificationService:
-    def __init__(self, bot, db_connection, cache_service=None):
+    def __init__(self, bot, db_connection, cache_service=None, outbox=None, digest=None):
         self.bot = bot
         self.db = db_connection
         self.cache = cache_service
+        self.outbox = outbox  # NotificationOutbox: отправка в фоне с учетом лимитов Telegram
+        self.digest = digest  # NotificationCoalescer: после первого лайка/сообщения - сводкой раз в окно
         self.webapp_url = "https://vlamay.github.io/flirtly-webapp"
+        
+        if self.digest is not None:
+            self.digest.attach(self._deliver_digest)
     
     async def send_match_notification(self, user_id: int, match_user_id: int):
         """Уведомление о новом матче"""
@@ -47,12 +57,12 @@ class NotificationService:
 
 <b>{partner['name']}, {partner['age']}</b> тоже лайкнул(а) тебя!
 
-{b'⭐' if partner['is_premium'] else ''} {partner['city']} • {partner['bio'][:100] if partner['bio'] else 'Нет описания'}...
+{'⭐' if partner['is_premium'] else ''} {partner['city']} • {partner['bio'][:100] if partner['bio'] else 'Нет описания'}...
 
 <b>Это взаимная симпатия! Начните общаться!</b>
             """.strip()
             
-            await self.bot.send_message(
+            await self._send_message(
                 chat_id=user_id,
                 text=message_text,
                 parse_mode='HTML',
@@ -98,17 +108,23 @@ class NotificationService:
 
 <b>{liker_info['name']}, {liker_info['age']}</b> из {liker_info['city']} понравился твой профиль!
 
-{b'⭐' if liker_info['is_premium'] else ''} {liker_info['bio'][:100] if liker_info['bio'] else 'Нет описания'}...
+{'⭐' if liker_info['is_premium'] else ''} {liker_info['bio'][:100] if liker_info['bio'] else 'Нет описания'}...
 
 <b>Лайкни в ответ и получи матч! 💕</b>
             """.strip()
             
-            await self.bot.send_message(
-                chat_id=user_id,
-                text=message_text,
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+            message = {
+                'text': message_text,
+                'parse_mode': 'HTML',
+                'reply_markup': InlineKeyboardMarkup(keyboard)
+            }
+            
+            send_now = True
+            if await self._is_digest_mode(user_id):
+                # Первое событие окна уходит сразу, следующие копятся до сводки
+                send_now = self.digest.add(user_id, DigestEvent('like', liker_id, liker_info['name'], message))
+            if send_now:
+                await self._send_message(chat_id=user_id, **message)
             
             # Сохраняем в кэш для предотвращения спама
             await self._mark_notification_sent(user_id, 'like', liker_id)
@@ -134,8 +150,9 @@ class NotificationService:
                 logger.info(f"Message notifications disabled for user {user_id}")
                 return
             
-            # Проверяем не спамит ли пользователь
-            if await self._is_spam_notification(user_id, 'message', sender_id):
+            # Проверяем не спамит ли пользователь (в режиме сводки частоту ограничивает сама сводка)
+            digest_mode = await self._is_digest_mode(user_id)
+            if not digest_mode and await self._is_spam_notification(user_id, 'message', sender_id):
                 logger.info(f"Spam prevention: skipping message notification from {sender_id} to {user_id}")
                 return
             
@@ -155,12 +172,17 @@ class NotificationService:
 <b>Отвечай быстро для лучшего общения! ⚡</b>
             """.strip()
             
-            await self.bot.send_message(
-                chat_id=user_id,
-                text=message_text,
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+            message = {
+                'text': message_text,
+                'parse_mode': 'HTML',
+                'reply_markup': InlineKeyboardMarkup(keyboard)
+            }
+            
+            send_now = True
+            if digest_mode:
+                send_now = self.digest.add(user_id, DigestEvent('message', sender_id, sender_info['name'], message))
+            if send_now:
+                await self._send_message(chat_id=user_id, **message)
             
             # Сохраняем в кэш для предотвращения спама
             await self._mark_notification_sent(user_id, 'message', sender_id)
@@ -184,8 +206,60 @@ class NotificationService:
                 logger.info(f"Recent premium offer notification for user {user_id}")
                 return
             
-            if offer_type == 'weekly':
-                message_text = """
+            await self._send_message(chat_id=user_id, **self.premium_offer_message(offer_type))
+            
+            # Сохраняем в кэш
+            await self._mark_notification_sent(user_id, 'premium_offer', 'system')
+            
+            logger.info(f"Premium offer notification sent to user {user_id}")
+            
+        except Exception as e:
+            logger.error(f"Error sending premium offer notification to {user_id}: {e}")
+    
+    async def send_activity_reminder(self, user_id: int):
+        """Напоминание о активности"""
+        
+        try:
+            # Проверяем когда пользователь был активен последний раз
+            last_active = await self._get_user_last_active(user_id)
+            if not last_active:
+                return
+            
+            days_inactive = (datetime.now() - last_active).days
+            
+            # Разные сообщения в зависимости от времени неактивности
+            message = self.activity_reminder_message(days_inactive)
+            if not message:
+                return  # Не отправляем для других периодов
+            
+            await self._send_message(chat_id=user_id, **message)
+            
+            logger.info(f"Activity reminder sent to user {user_id} (inactive {days_inactive} days)")
+            
+        except Exception as e:
+            logger.error(f"Error sending activity reminder to {user_id}: {e}")
+    
+    async def send_boost_notification(self, user_id: int):
+        """Уведомление о доступном бусте"""
+        
+        try:
+            # Проверяем есть ли у пользователя буст
+            has_boost = await self._has_active_boost(user_id)
+            if has_boost:
+                return
+            
+            await self._send_message(chat_id=user_id, **self.boost_message())
+            
+            logger.info(f"Boost notification sent to user {user_id}")
+            
+        except Exception as e:
+            logger.error(f"Error sending boost notification to {user_id}: {e}")
+    
+    def premium_offer_message(self, offer_type: str = 'weekly') -> Dict[str, Any]:
+        """Текст и клавиатура Premium предложения (аргументы send_message)"""
+        
+        if offer_type == 'weekly':
+            message_text = """
 ⭐ <b>Специальное предложение!</b>
 
 <b>Первая неделя Premium - БЕСПЛАТНО! 🎁</b>
@@ -197,9 +271,9 @@ class NotificationService:
 • Приоритет в показе 📊
 
 <b>Ограниченное время! Активируй сейчас!</b>
-                """
-            else:
-                message_text = """
+            """
+        else:
+            message_text = """
 ⭐ <b>Premium подписка</b>
 
 <b>Получи больше матчей с Premium!</b>
@@ -210,52 +284,34 @@ class NotificationService:
 • Видеть кто лайкнул 👀
 
 <b>Попробуй бесплатно!</b>
-                """
-            
-            keyboard = [
-                [InlineKeyboardButton("⭐ Попробовать бесплатно", callback_data="free_trial")],
-                [InlineKeyboardButton("💎 Купить Premium", 
-                                   web_app=WebAppInfo(url=f"{self.webapp_url}/premium"))],
-                [InlineKeyboardButton("❌ Не показывать", callback_data="disable_premium_notifications")]
-            ]
-            
-            await self.bot.send_message(
-                chat_id=user_id,
-                text=message_text,
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            
-            # Сохраняем в кэш
-            await self._mark_notification_sent(user_id, 'premium_offer', 'system')
-            
-            logger.info(f"Premium offer notification sent to user {user_id}")
-            
-        except Exception as e:
-            logger.error(f"Error sending premium offer notification to {user_id}: {e}")
+            """
+        
+        keyboard = [
+            [InlineKeyboardButton("⭐ Попробовать бесплатно", callback_data="free_trial")],
+            [InlineKeyboardButton("💎 Купить Premium", 
+                               web_app=WebAppInfo(url=f"{self.webapp_url}/premium"))],
+            [InlineKeyboardButton("❌ Не показывать", callback_data="disable_premium_notifications")]
+        ]
+        
+        return {
+            'text': message_text,
+            'parse_mode': 'HTML',
+            'reply_markup': InlineKeyboardMarkup(keyboard)
+        }
     
-    async def send_activity_reminder(self, user_id: int):
-        """Напоминание о активности"""
+    def activity_reminder_message(self, days_inactive: int) -> Optional[Dict[str, Any]]:
+        """Напоминание для N дней неактивности; None - для этого периода не шлем"""
         
-        try:
-            # Проверяем когда пользователь был активен последний раз
-            last_active = await self._get_user_last_active(user_id)
-            if not last_active:
-                return
-            
-            days_inactive = (datetime.now() - last_active).days
-            
-            # Разные сообщения в зависимости от времени неактивности
-            if days_inactive == 1:
-                message_text = """
+        if days_inactive == 1:
+            message_text = """
 💔 <b>Мы скучаем!</b>
 
 Ты не заходил в Flirtly целый день. 
 
 Возможно, кто-то уже лайкнул твой профиль! Проверь прямо сейчас! ⚡
-                """
-            elif days_inactive == 3:
-                message_text = """
+            """
+        elif days_inactive == 3:
+            message_text = """
 🔥 <b>Не упусти возможности!</b>
 
 За 3 дня без тебя в Flirtly произошло много интересного:
@@ -264,9 +320,9 @@ class NotificationService:
 • Лайки накапливаются...
 
 <b>Вернись и найди свою любовь! 💕</b>
-                """
-            elif days_inactive == 7:
-                message_text = """
+            """
+        elif days_inactive == 7:
+            message_text = """
 💌 <b>Долго не виделись!</b>
 
 Прошла целая неделя без тебя в Flirtly.
@@ -277,39 +333,27 @@ class NotificationService:
 • {likes_count} лайков на твой профиль
 
 <b>Не упускай шанс найти любовь! ❤️</b>
-                """
-            else:
-                return  # Не отправляем для других периодов
-            
-            keyboard = [
-                [InlineKeyboardButton("⚡ Открыть Flirtly", 
-                                   web_app=WebAppInfo(url=self.webapp_url))],
-                [InlineKeyboardButton("👀 Проверить лайки", 
-                                   web_app=WebAppInfo(url=f"{self.webapp_url}/likes"))]
-            ]
-            
-            await self.bot.send_message(
-                chat_id=user_id,
-                text=message_text,
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            
-            logger.info(f"Activity reminder sent to user {user_id} (inactive {days_inactive} days)")
-            
-        except Exception as e:
-            logger.error(f"Error sending activity reminder to {user_id}: {e}")
+            """
+        else:
+            return None  # Не отправляем для других периодов
+        
+        keyboard = [
+            [InlineKeyboardButton("⚡ Открыть Flirtly", 
+                               web_app=WebAppInfo(url=self.webapp_url))],
+            [InlineKeyboardButton("👀 Проверить лайки", 
+                               web_app=WebAppInfo(url=f"{self.webapp_url}/likes"))]
+        ]
+        
+        return {
+            'text': message_text,
+            'parse_mode': 'HTML',
+            'reply_markup': InlineKeyboardMarkup(keyboard)
+        }
     
-    async def send_boost_notification(self, user_id: int):
-        """Уведомление о доступном бусте"""
+    def boost_message(self) -> Dict[str, Any]:
+        """Текст и клавиатура уведомления о бусте"""
         
-        try:
-            # Проверяем есть ли у пользователя буст
-            has_boost = await self._has_active_boost(user_id)
-            if has_boost:
-                return
-            
-            message_text = """
+        message_text = """
 🚀 <b>Буст профиля доступен!</b>
 
 <b>Получи в 10 раз больше просмотров на 30 минут!</b>
@@ -319,30 +363,75 @@ class NotificationService:
 • Приоритет в рекомендациях
 
 <b>Используй буст и найди больше матчей! 💕</b>
-            """
-            
-            keyboard = [
-                [InlineKeyboardButton("🚀 Активировать буст", callback_data="activate_boost")],
-                [InlineKeyboardButton("⚡ Открыть Flirtly", 
-                                   web_app=WebAppInfo(url=self.webapp_url))]
-            ]
-            
-            await self.bot.send_message(
-                chat_id=user_id,
-                text=message_text,
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            
-            logger.info(f"Boost notification sent to user {user_id}")
-            
-        except Exception as e:
-            logger.error(f"Error sending boost notification to {user_id}: {e}")
+        """
+        
+        keyboard = [
+            [InlineKeyboardButton("🚀 Активировать буст", callback_data="activate_boost")],
+            [InlineKeyboardButton("⚡ Открыть Flirtly", 
+                               web_app=WebAppInfo(url=self.webapp_url))]
+        ]
+        
+        return {
+            'text': message_text,
+            'parse_mode': 'HTML',
+            'reply_markup': InlineKeyboardMarkup(keyboard)
+        }
+    
+    def digest_message(self, events) -> Dict[str, Any]:
+        """Сводка накопленных лайков и сообщений одним сообщением"""
+        
+        likes = [event for event in events if event.kind == 'like']
+        messages = [event for event in events if event.kind == 'message']
+        
+        lines = []
+        if likes:
+            lines.append(f"❤️ Новых лайков: <b>{len(likes)}</b> ({_actor_names(likes)})")
+        if messages:
+            lines.append(f"💬 Новых сообщений: <b>{len(messages)}</b> от {_actor_names(messages)}")
+        
+        message_text = "🔔 <b>Пока тебя не было</b>\n\n" + "\n".join(lines)
+        
+        keyboard = [
+            [InlineKeyboardButton("⚡ Открыть Flirtly", 
+                               web_app=WebAppInfo(url=self.webapp_url))]
+        ]
+        if likes:
+            keyboard.append([InlineKeyboardButton("👀 Проверить лайки", 
+                                               web_app=WebAppInfo(url=f"{self.webapp_url}/likes"))])
+        
+        return {
+            'text': message_text,
+            'parse_mode': 'HTML',
+            'reply_markup': InlineKeyboardMarkup(keyboard)
+        }
     
     # ===================================
     # PRIVATE METHODS
     # ===================================
     
+    async def _is_digest_mode(self, user_id: int) -> bool:
+        """Режим сводки (по умолчанию); 'digest' выключен - мгновенные уведомления"""
+        
+        return self.digest is not None and await notification_preferences.is_enabled(user_id, 'digest')
+    
+    async def _deliver_digest(self, user_id: int, events):
+        """Отправка накопленного окна: одно событие - обычным уведомлением, иначе сводкой"""
+        
+        if len(events) == 1:
+            await self._send_message(chat_id=user_id, **events[0].message)
+        else:
+            await self._send_message(chat_id=user_id, **self.digest_message(events))
+        
+        logger.info(f"Digest of {len(events)} notifications sent to user {user_id}")
+    
+    async def _send_message(self, **kwargs):
+        """Отправка через outbox (не ждет Telegram), без него - напрямую"""
+        
+        if self.outbox is not None:
+            await self.outbox.enqueue(**kwargs)
+        else:
+            await self.bot.send_message(**kwargs)
+    
     async def _get_match_info(self, user_id: int, match_user_id: int) -> Optional[Dict]:
         """Получение информации о матче"""
         
@@ -388,7 +477,7 @@ class NotificationService:
             WHERE id = $1 AND is_active = true
         """
         
-        try:
+        async def load():
             row = await self.db.fetchrow(query, user_id)
             if row:
                 return {
@@ -400,34 +489,17 @@ class NotificationService:
                     'is_premium': row['is_premium']
                 }
             return None
+        
+        try:
+            return await profile_cache.get_or_load('info', user_id, load)
         except Exception as e:
             logger.error(f"Error getting user info: {e}")
             return None
     
     async def _is_notification_enabled(self, user_id: int, notification_type: str) -> bool:
-        """Проверка включены ли уведомления"""
-        
-        if self.cache:
-            setting = await self.cache.get(f"notification_settings:{user_id}:{notification_type}")
-            if setting is not None:
-                return setting == 'true'
+        """Проверка включены ли уведомления (маска настроек в памяти процесса)"""
         
-        # Проверяем в базе данных
-        query = """
-            SELECT notification_settings
-            FROM users
-            WHERE id = $1
-        """
-        
-        try:
-            row = await self.db.fetchrow(query, user_id)
-            if row and row['notification_settings']:
-                settings = row['notification_settings']
-                return settings.get(notification_type, True)  # По умолчанию включено
-            return True
-        except Exception as e:
-            logger.error(f"Error checking notification settings: {e}")
-            return True
+        return await notification_preferences.is_enabled(user_id, notification_type)
     
     async def _is_spam_notification(self, user_id: int, notification_type: str, sender_id: str) -> bool:
         """Проверка на спам уведомлений"""
@@ -493,132 +565,113 @@ class NotificationService:
 
 # Scheduler для автоматических уведомлений
 class NotificationScheduler:
-    def __init__(self, notification_service):
+    def __init__(self, notification_service, runner: Optional[CampaignRunner] = None):
         self.notification_service = notification_service
+        self.runner = runner or CampaignRunner(
+            notification_service.bot,
+            notification_service.db,
+            cache=notification_service.cache,
+            outbox=notification_service.outbox
+        )
+        self.campaigns = self._campaigns()
         self.running = False
+        self.stopped = asyncio.Event()
     
     async def start(self):
         """Запуск планировщика уведомлений"""
         self.running = True
+        self.stopped.clear()
+        self.runner.start()
+        await self.runner.ensure_table()
         logger.info("Notification scheduler started")
         
-        # Запускаем задачи
-        tasks = [
-            self._daily_activity_reminders(),
-            self._weekly_premium_offers(),
-            self._boost_availability_checks()
-        ]
-        
-        await asyncio.gather(*tasks)
+        # Каждая кампания по своему расписанию; прерванный запуск продолжается с checkpoint
+        await asyncio.gather(*(self._run_periodically(campaign) for campaign in self.campaigns))
     
     async def stop(self):
         """Остановка планировщика"""
         self.running = False
+        self.runner.stop()
+        self.stopped.set()
         logger.info("Notification scheduler stopped")
     
-    async def _daily_activity_reminders(self):
-        """Ежедневные напоминания об активности"""
-        while self.running:
-            try:
-                # Получаем пользователей неактивных более 1 дня
-                inactive_users = await self._get_inactive_users(days=1)
-                
-                for user_id in inactive_users:
-                    await self.notification_service.send_activity_reminder(user_id)
-                    await asyncio.sleep(1)  # Не спамим
-                
-                # Ждем до следующего дня
-                await asyncio.sleep(24 * 3600)  # 24 часа
-                
-            except Exception as e:
-                logger.error(f"Error in daily activity reminders: {e}")
-                await asyncio.sleep(3600)  # Ждем час при ошибке
+    def metrics(self) -> Dict:
+        return self.runner.metrics()
     
-    async def _weekly_premium_offers(self):
-        """Еженедельные предложения Premium"""
-        while self.running:
-            try:
-                # Получаем пользователей без Premium
-                free_users = await self._get_free_users()
-                
-                for user_id in free_users:
-                    await self.notification_service.send_premium_offer_notification(user_id, 'weekly')
-                    await asyncio.sleep(2)  # Не спамим
-                
-                # Ждем неделю
-                await asyncio.sleep(7 * 24 * 3600)  # 7 дней
-                
-            except Exception as e:
-                logger.error(f"Error in weekly premium offers: {e}")
-                await asyncio.sleep(3600)  # Ждем час при ошибке
+    def _campaigns(self) -> List[Campaign]:
+        """Кампании вместо прежних циклов по 100/50/30 пользователям"""
+        service = self.notification_service
+        
+        return [
+            # Ежедневные напоминания об активности (1, 3 и 7 дней неактивности)
+            Campaign(
+                name='activity_reminder',
+                where="""
+                    u.is_premium = false
+                    AND u.last_active < $1 - INTERVAL '1 day'
+                    AND u.last_active >= $1 - INTERVAL '8 days'
+                """,
+                variant=_days_inactive_variant,
+                render=lambda variant: service.activity_reminder_message(int(variant)),
+                interval=timedelta(days=1),
+                setting='reminders'
+            ),
+            # Еженедельные предложения Premium
+            Campaign(
+                name='premium_offer',
+                where="u.is_premium = false OR u.premium_until < $1",
+                render=lambda variant: service.premium_offer_message('weekly'),
+                interval=timedelta(days=7),
+                setting='premium',
+                skip_keys=("recent_notification:{user_id}:premium_offer",),
+                mark_key="notification_sent:{user_id}:premium_offer:system",
+                mark_ttl=3600
+            ),
+            # Проверки доступности бустов
+            Campaign(
+                name='boost_available',
+                where="""
+                    u.last_active > $1 - INTERVAL '1 day'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM user_boosts
+                        WHERE user_id = u.id AND expires_at > $1
+                    )
+                """,
+                render=lambda variant: service.boost_message(),
+                interval=timedelta(hours=6),
+                setting='reminders',
+                skip_keys=("boost_active:{user_id}",)
+            )
+        ]
     
-    async def _boost_availability_checks(self):
-        """Проверки доступности бустов"""
+    async def _run_periodically(self, campaign: Campaign):
         while self.running:
             try:
-                # Получаем активных пользователей без буста
-                active_users = await self._get_active_users_without_boost()
-                
-                for user_id in active_users:
-                    await self.notification_service.send_boost_notification(user_id)
-                    await asyncio.sleep(1)  # Не спамим
+                delay = await self.runner.seconds_until_due(campaign)
+                if delay > 0:
+                    await self._sleep(delay)
+                    continue
                 
-                # Ждем 6 часов
-                await asyncio.sleep(6 * 3600)  # 6 часов
+                await self.runner.run(campaign)
                 
             except Exception as e:
-                logger.error(f"Error in boost availability checks: {e}")
-                await asyncio.sleep(3600)  # Ждем час при ошибке
+                logger.error(f"Error in campaign {campaign.name}: {e}")
+                await self._sleep(3600)  # Ждем час при ошибке
     
-    async def _get_inactive_users(self, days: int) -> List[int]:
-        """Получение неактивных пользователей"""
-        query = """
-            SELECT id FROM users
-            WHERE is_active = true
-            AND last_active < NOW() - INTERVAL '%s days'
-            AND is_premium = false
-            LIMIT 100
-        """ % days
-        
+    async def _sleep(self, seconds: float):
+        """Пауза, которую прерывает stop()"""
         try:
-            rows = await self.notification_service.db.fetch(query)
-            return [row['id'] for row in rows]
-        except Exception as e:
-            logger.error(f"Error getting inactive users: {e}")
-            return []
-    
-    async def _get_free_users(self) -> List[int]:
-        """Получение пользователей без Premium"""
-        query = """
-            SELECT id FROM users
-            WHERE is_active = true
-            AND (is_premium = false OR premium_until < NOW())
-            LIMIT 50
-        """
-        
-        try:
-            rows = await self.notification_service.db.fetch(query)
-            return [row['id'] for row in rows]
-        except Exception as e:
-            logger.error(f"Error getting free users: {e}")
-            return []
-    
-    async def _get_active_users_without_boost(self) -> List[int]:
-        """Получение активных пользователей без буста"""
-        query = """
-            SELECT id FROM users
-            WHERE is_active = true
-            AND last_active > NOW() - INTERVAL '1 day'
-            AND NOT EXISTS (
-                SELECT 1 FROM user_boosts
-                WHERE user_id = users.id AND expires_at > NOW()
-            )
-            LIMIT 30
-        """
-        
-        try:
-            rows = await self.notification_service.db.fetch(query)
-            return [row['id'] for row in rows]
-        except Exception as e:
-            logger.error(f"Error getting active users without boost: {e}")
-            return []
+            await asyncio.wait_for(self.stopped.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _actor_names(events, limit: int = 3) -> str:
+    """'Анна, Олег, Катя…' - уникальные имена в порядке событий"""
+    names = list(dict.fromkeys(event.actor_name for event in events))
+    return ", ".join(names[:limit]) + ("…" if len(names) > limit else "")
+
+
+def _days_inactive_variant(row, started_at: datetime) -> Optional[str]:
+    days_inactive = (started_at - row['last_active']).days
+    return str(days_inactive) if days_inactive in (1, 3, 7) else None
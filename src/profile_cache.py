@@ -0,0 +1,273 @@
+# src/profile_cache.py - Two-tier (in-process L1 + Redis L2) user profile cache
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "profile:invalidate"
+
+# Views of a user row cached by the services; L2 entries of all kinds are
+# deleted on invalidation even if this worker never cached them
+PROFILE_KINDS = ('engine', 'info', 'sender', 'user')
+
+ProfileLoader = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class ProfileCache:
+    """
+    Cache of user profile records keyed by user id, with telegram id aliases
+
+    Several views of the same user row are cached under different kinds
+    ('engine', 'info', 'user', ...); all of them are dropped together when
+    the user's profile is written. L1 is a bounded per-process LRU with a
+    short TTL, L2 the shared CacheService (Redis). Invalidations are
+    published over pub/sub so every worker drops its L1 entries.
+
+    Telegram id aliases live only as long as the user's L1 entry. Every
+    invalidation bumps a generation counter; a record read from L2 or a
+    loader is not written back if the user was invalidated while it was
+    being fetched.
+    """
+
+    def __init__(self, cache_service=None, l1_size: int = 5000,
+                 l1_ttl: float = 60, l2_ttl: int = 300):
+        self.cache = cache_service
+        self.l1_size = l1_size
+        self.l1_ttl = l1_ttl
+        self.l2_ttl = l2_ttl
+
+        self.l1: 'OrderedDict[int, Dict[str, tuple]]' = OrderedDict()  # user_id -> {kind: (expires, data)}
+        self.telegram_ids: Dict[int, int] = {}  # telegram_id -> user_id, for users in L1
+        self.aliases: Dict[int, int] = {}       # user_id -> telegram_id, to evict with L1
+        self.generation = 0  # bumped by every invalidation
+        # Generation of each user's latest invalidation, at most l1_size users;
+        # older ones are summarized by invalidated_floor
+        self.invalidated: 'OrderedDict[int, int]' = OrderedDict()
+        self.invalidated_floor = 0
+        self.invalidating: Dict[int, int] = {}  # user_id -> L2 deletes in flight
+        self.listener: Optional[asyncio.Task] = None
+        # Callbacks run with the user id on every invalidation, local or broadcast
+        self.subscribers: List[Callable[[int], None]] = []
+
+        # Metrics
+        self.l1_hits = 0
+        self.l1_misses = 0
+        self.l2_hits = 0
+        self.l2_misses = 0
+
+    def attach(self, cache_service):
+        """Use cache_service as the shared L2 tier"""
+        self.cache = cache_service
+
+    async def start(self):
+        """Subscribe to invalidations published by other workers"""
+        if self.cache is not None:
+            self.listener = asyncio.create_task(
+                self.cache.listen(INVALIDATION_CHANNEL, self._on_invalidation)
+            )
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+            await asyncio.gather(self.listener, return_exceptions=True)
+            self.listener = None
+
+    async def get(self, kind: str, user_id: int) -> Optional[Dict[str, Any]]:
+        data = self._l1_get(kind, user_id)
+        if data is not None:
+            self.l1_hits += 1
+            return data
+        self.l1_misses += 1
+
+        # L2 may still hold the old record until the scheduled delete runs
+        if self.cache is None or user_id in self.invalidating:
+            return None
+
+        generation = self.generation
+        data = await self.cache.get(self._l2_key(kind, user_id))
+        if data is None:
+            self.l2_misses += 1
+            return None
+
+        self.l2_hits += 1
+        if not self._invalidated_since(user_id, generation):
+            self._l1_set(kind, user_id, data)
+        return data
+
+    async def get_by_telegram_id(self, kind: str, telegram_id: int) -> Optional[Dict[str, Any]]:
+        user_id = self.telegram_ids.get(telegram_id)
+        if user_id is not None:
+            return await self.get(kind, user_id)
+
+        if self.cache is None:
+            self.l1_misses += 1
+            return None
+
+        generation = self.generation
+        user_id = await self.cache.get(f"profile:tg:{telegram_id}")
+        if user_id is None:
+            self.l1_misses += 1
+            return None
+
+        data = await self.get(kind, user_id)
+        if data is not None and not self._invalidated_since(user_id, generation):
+            self._alias(telegram_id, user_id)
+        return data
+
+    async def set(self, kind: str, user_id: int, data: Dict[str, Any],
+                  telegram_id: Optional[int] = None):
+        self._l1_set(kind, user_id, data)
+        if telegram_id is not None:
+            self._alias(telegram_id, user_id)
+
+        if self.cache is not None:
+            mapping = {self._l2_key(kind, user_id): data}
+            if telegram_id is not None:
+                mapping[f"profile:tg:{telegram_id}"] = user_id
+            await self.cache.set_many(mapping, ttl=self.l2_ttl)
+
+    async def get_or_load(self, kind: str, user_id: int, loader: ProfileLoader) -> Optional[Dict[str, Any]]:
+        """Cached record, or load it with loader() and cache it"""
+        data = await self.get(kind, user_id)
+        if data is None:
+            generation = self.generation
+            data = await loader()
+            # A write that invalidated the user during the load may postdate the record
+            if data is not None and not self._invalidated_since(user_id, generation):
+                await self.set(kind, user_id, data)
+        return data
+
+    def subscribe(self, callback: Callable[[int], None]):
+        """Call callback(user_id) whenever a user's profile is invalidated in any worker"""
+        self.subscribers.append(callback)
+
+    def invalidate(self, user_id: int, telegram_id: Optional[int] = None):
+        """
+        Drop every cached view of the user after a profile write
+
+        Synchronous so it can run from after-commit hooks; the L2 delete and
+        the broadcast to other workers are scheduled on the running loop.
+        """
+        self._drop_local(user_id, telegram_id)
+        self._notify(user_id)
+
+        if self.cache is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # No running loop: L2 entries expire by TTL
+
+        self.invalidating[user_id] = self.invalidating.get(user_id, 0) + 1
+        loop.create_task(self._invalidate_shared(user_id, telegram_id))
+
+    def metrics(self) -> Dict[str, Any]:
+        l1_total = self.l1_hits + self.l1_misses
+        l2_total = self.l2_hits + self.l2_misses
+        return {
+            'l1_hits': self.l1_hits,
+            'l1_misses': self.l1_misses,
+            'l1_hit_rate': self.l1_hits / l1_total if l1_total else 0.0,
+            'l2_hits': self.l2_hits,
+            'l2_misses': self.l2_misses,
+            'l2_hit_rate': self.l2_hits / l2_total if l2_total else 0.0,
+            'l1_users': len(self.l1),
+            'telegram_aliases': len(self.telegram_ids)
+        }
+
+    # ===================================
+    # PRIVATE METHODS
+    # ===================================
+
+    @staticmethod
+    def _l2_key(kind: str, user_id: int) -> str:
+        return f"profile:{kind}:{user_id}"
+
+    def _l1_get(self, kind: str, user_id: int) -> Optional[Dict[str, Any]]:
+        entry = self.l1.get(user_id, {}).get(kind)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self.l1[user_id][kind]
+            return None
+        self.l1.move_to_end(user_id)
+        return entry[1]
+
+    def _l1_set(self, kind: str, user_id: int, data: Dict[str, Any]):
+        self.l1.setdefault(user_id, {})[kind] = (time.monotonic() + self.l1_ttl, data)
+        self.l1.move_to_end(user_id)
+        while len(self.l1) > self.l1_size:
+            evicted, _ = self.l1.popitem(last=False)
+            telegram_id = self.aliases.pop(evicted, None)
+            if telegram_id is not None:
+                self.telegram_ids.pop(telegram_id, None)
+
+    def _alias(self, telegram_id: int, user_id: int):
+        # Only users held in L1, so the map is bounded and evicted with it
+        if user_id not in self.l1:
+            return
+        previous = self.aliases.get(user_id)
+        if previous is not None and previous != telegram_id:
+            self.telegram_ids.pop(previous, None)
+        self.telegram_ids[telegram_id] = user_id
+        self.aliases[user_id] = telegram_id
+
+    def _drop_local(self, user_id: Optional[int], telegram_id: Optional[int]):
+        self.generation += 1
+        if user_id is not None:
+            self.l1.pop(user_id, None)
+            alias = self.aliases.pop(user_id, None)
+            if alias is not None:
+                self.telegram_ids.pop(alias, None)
+
+            self.invalidated[user_id] = self.generation
+            self.invalidated.move_to_end(user_id)
+            while len(self.invalidated) > self.l1_size:
+                _, self.invalidated_floor = self.invalidated.popitem(last=False)
+        if telegram_id is not None:
+            user = self.telegram_ids.pop(telegram_id, None)
+            if user is not None:
+                self.aliases.pop(user, None)
+
+    def _invalidated_since(self, user_id: int, generation: int) -> bool:
+        """True if the user may have been invalidated after `generation` was read"""
+        invalidated = self.invalidated.get(user_id)
+        if invalidated is None:
+            # Forgotten entries are all older than the floor
+            return self.invalidated_floor > generation
+        return invalidated > generation
+
+    async def _invalidate_shared(self, user_id: int, telegram_id: Optional[int]):
+        try:
+            # Every kind: other workers may have cached views this one never did
+            keys = [self._l2_key(kind, user_id) for kind in PROFILE_KINDS]
+            if telegram_id is not None:
+                keys.append(f"profile:tg:{telegram_id}")
+            await self.cache.delete(*keys)
+            await self.cache.publish(INVALIDATION_CHANNEL, {'user_id': user_id, 'telegram_id': telegram_id})
+        except Exception as e:
+            logger.error(f"Error invalidating profile {user_id}: {e}")
+        finally:
+            self.invalidating[user_id] -= 1
+            if not self.invalidating[user_id]:
+                del self.invalidating[user_id]
+
+    async def _on_invalidation(self, message: Dict[str, Any]):
+        self._drop_local(message.get('user_id'), message.get('telegram_id'))
+        if message.get('user_id') is not None:
+            self._notify(message['user_id'])
+
+    def _notify(self, user_id: int):
+        for callback in self.subscribers:
+            try:
+                callback(user_id)
+            except Exception as e:
+                logger.error(f"Error in profile invalidation callback: {e}")
+
+
+# Process-wide cache shared by the matching engine, services and bots
+profile_cache = ProfileCache()
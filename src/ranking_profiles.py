@@ -0,0 +1,124 @@
+# src/ranking_profiles.py - Named ranking weight profiles and A/B bucket assignment
+
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+from src.candidate_pool import FACTOR_NAMES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = 'default'
+
+# Buckets per experiment; allocation shares are rounded to whole buckets
+BUCKET_COUNT = 1000
+
+WEIGHT_PROFILES: Dict[str, Dict[str, float]] = {
+    DEFAULT_PROFILE: {
+        'location': 0.25,       # geographic proximity
+        'interests': 0.30,      # shared interests
+        'activity': 0.15,       # recent activity
+        'photo_quality': 0.10,  # photo quality
+        'popularity': 0.05,     # likes -> matches ratio
+        'freshness': 0.05,      # account age
+        'elo': 0.10             # swipe ELO rating
+    },
+    'nearby': {
+        'location': 0.40,
+        'interests': 0.20,
+        'activity': 0.15,
+        'photo_quality': 0.10,
+        'popularity': 0.05,
+        'freshness': 0.05,
+        'elo': 0.05
+    },
+    'desirability': {
+        'location': 0.20,
+        'interests': 0.25,
+        'activity': 0.10,
+        'photo_quality': 0.15,
+        'popularity': 0.05,
+        'freshness': 0.05,
+        'elo': 0.20
+    },
+}
+
+
+def validate_weights(name: str, weights: Dict[str, float]):
+    """A profile must weight every factor and sum to 1 (scores stay in 0..1)"""
+    missing = set(FACTOR_NAMES) - set(weights)
+    unknown = set(weights) - set(FACTOR_NAMES)
+    if missing or unknown:
+        raise ValueError(f"Weight profile {name!r}: missing {sorted(missing)}, unknown {sorted(unknown)}")
+    total = sum(weights.values())
+    if abs(total - 1.0) > 1e-6:
+        raise ValueError(f"Weight profile {name!r}: weights sum to {total}, expected 1.0")
+
+
+class RankingExperiment:
+    """
+    Deterministic assignment of users to weight profiles
+
+    A user's bucket is a hash of the experiment name and user id, so the
+    assignment is stable across workers and restarts without storing
+    anything, and renaming the experiment reshuffles everyone. Buckets are
+    handed to profiles in allocation order; unallocated buckets get the
+    default profile.
+    """
+
+    def __init__(self, name: str, allocation: Dict[str, float],
+                 profiles: Optional[Dict[str, Dict[str, float]]] = None):
+        self.name = name
+        self.profiles = {**WEIGHT_PROFILES, **(profiles or {})}
+        for profile_name, weights in self.profiles.items():
+            validate_weights(profile_name, weights)
+
+        unknown = set(allocation) - set(self.profiles)
+        if unknown:
+            raise ValueError(f"Experiment {name!r}: unknown profiles {sorted(unknown)}")
+        if sum(allocation.values()) > 1.0 + 1e-6:
+            raise ValueError(f"Experiment {name!r}: allocation exceeds 100%")
+
+        # Upper bucket bound (exclusive) per profile
+        self.ranges = []
+        upper = 0
+        for profile_name, share in allocation.items():
+            upper += round(share * BUCKET_COUNT)
+            self.ranges.append((upper, profile_name))
+
+    @classmethod
+    def from_file(cls, path: str) -> 'RankingExperiment':
+        """
+        Load {"name": ..., "allocation": {profile: share}, "profiles": {...}}
+
+        "profiles" is optional and adds to or overrides WEIGHT_PROFILES.
+        """
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config['name'], config['allocation'], config.get('profiles'))
+
+    @classmethod
+    def from_env(cls) -> Optional['RankingExperiment']:
+        """Experiment from the file in $RANKING_EXPERIMENT_FILE, if set"""
+        path = os.getenv("RANKING_EXPERIMENT_FILE")
+        if not path:
+            return None
+        experiment = cls.from_file(path)
+        logger.info(f"Ranking experiment {experiment.name!r}: {experiment.ranges}")
+        return experiment
+
+    def bucket(self, user_id: int) -> int:
+        digest = hashlib.sha256(f"{self.name}:{user_id}".encode()).digest()
+        return int.from_bytes(digest[:8], 'big') % BUCKET_COUNT
+
+    def profile_for(self, user_id: int) -> str:
+        bucket = self.bucket(user_id)
+        for upper, profile_name in self.ranges:
+            if bucket < upper:
+                return profile_name
+        return DEFAULT_PROFILE
+
+    def weights_for(self, user_id: int) -> Dict[str, float]:
+        return self.profiles[self.profile_for(user_id)]
@@ -0,0 +1,180 @@
+# src/ranking_replay.py - Offline replay of historical feeds under weight profiles
+
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Set, Tuple
+
+from src.matching_engine import CANDIDATE_COLUMNS, CANDIDATE_FROM, MatchingEngine
+from src.ranking_profiles import WEIGHT_PROFILES, RankingExperiment, validate_weights
+
+# Candidate query columns for the SQLite schema (src/database.py); columns
+# it does not have are NULL, so scoring falls back to neutral values
+_SQLITE_USERS = """
+    SELECT id, telegram_id, name, age, gender, looking_for, city,
+           latitude AS lat, longitude AS lon, bio, matches_count, likes_received,
+           0 AS views_count, last_active, created_at, 0 AS is_premium, 50 AS max_distance,
+           NULL AS elo_rating, NULL AS interest_ids, NULL AS photo_count, NULL AS photo_quality,
+           NULL AS photo_quality_score, NULL AS popularity_score,
+           NULL AS freshness_score, NULL AS elo_score
+    FROM users
+"""
+
+
+@dataclass
+class Snapshot:
+    users: Dict[int, Dict] = field(default_factory=dict)  # candidate query rows by id
+    likes: Dict[int, Set[int]] = field(default_factory=lambda: defaultdict(set))
+    skips: Dict[int, Set[int]] = field(default_factory=lambda: defaultdict(set))
+    matches: Set[Tuple[int, int]] = field(default_factory=set)  # (min id, max id)
+
+    def feed(self, viewer_id: int) -> List[int]:
+        """Profiles the viewer was shown and swiped, in id order"""
+        swiped = self.likes.get(viewer_id, set()) | self.skips.get(viewer_id, set())
+        return sorted(user_id for user_id in swiped if user_id in self.users)
+
+    def matched(self, a: int, b: int) -> bool:
+        return (min(a, b), max(a, b)) in self.matches
+
+
+async def load_snapshot(db) -> Snapshot:
+    """Users, swipes and matches from a DatabasePool (PostgreSQL or SQLite)"""
+    snapshot = Snapshot()
+
+    if db.is_postgres:
+        users = await db.fetch(f"SELECT {CANDIDATE_COLUMNS} FROM {CANDIDATE_FROM}")
+        for row in await db.fetch("SELECT from_user_id, to_user_id, action FROM likes"):
+            swipes = snapshot.skips if row['action'] == 'dislike' else snapshot.likes
+            swipes[row['from_user_id']].add(row['to_user_id'])
+    else:
+        users = await db.fetch(_SQLITE_USERS)
+        for row in await db.fetch("SELECT from_user_id, to_user_id FROM likes"):
+            snapshot.likes[row['from_user_id']].add(row['to_user_id'])
+        tables = {row[0] for row in await db.fetch("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'skips' in tables:
+            for row in await db.fetch("SELECT from_user_id, to_user_id FROM skips"):
+                snapshot.skips[row['from_user_id']].add(row['to_user_id'])
+
+    for row in users:
+        snapshot.users[row['id']] = _normalize(dict(row))
+    for row in await db.fetch("SELECT user1_id, user2_id FROM matches"):
+        a, b = row['user1_id'], row['user2_id']
+        snapshot.matches.add((min(a, b), max(a, b)))
+
+    return snapshot
+
+
+async def replay(snapshot: Snapshot, profiles: Dict[str, Dict[str, float]], k: int = 10,
+                 batch_scoring: bool = True) -> Dict[str, Dict]:
+    """
+    Re-rank every viewer's historical feed under each profile
+
+    A feed is the set of profiles the viewer swiped; feeds of k or fewer
+    profiles are skipped since any order has the same top k. like_rate and
+    match_rate are the shares of liked and matched profiles in the top k,
+    averaged over viewers. Time-based factors are computed as of now, not
+    as of the swipe, so the numbers are proxies for comparing profiles,
+    not predictions.
+    """
+    engine = MatchingEngine(None, batch_scoring=batch_scoring)
+    viewers = [
+        viewer_id for viewer_id in snapshot.likes
+        if viewer_id in snapshot.users and len(snapshot.feed(viewer_id)) > k
+    ]
+
+    results = {}
+    for name, weights in profiles.items():
+        validate_weights(name, weights)
+        engine.weights = weights
+
+        like_rate = match_rate = 0.0
+        scored = 0
+        elapsed = 0.0
+        for viewer_id in viewers:
+            user = engine._profile_from_row(snapshot.users[viewer_id])
+            feed = snapshot.feed(viewer_id)
+            rows = [snapshot.users[user_id] for user_id in feed]
+
+            started = time.perf_counter()
+            ranked = [score.user_id for score in await engine._score_rows(user, rows)]
+            elapsed += time.perf_counter() - started
+            scored += len(rows)
+
+            # Below-threshold candidates are dropped by scoring; they rank last
+            ranked_ids = set(ranked)
+            ranked += [user_id for user_id in feed if user_id not in ranked_ids]
+            top = ranked[:k]
+
+            liked = snapshot.likes[viewer_id]
+            like_rate += sum(user_id in liked for user_id in top) / len(top)
+            match_rate += sum(snapshot.matched(viewer_id, user_id) for user_id in top) / len(top)
+
+        results[name] = {
+            'viewers': len(viewers),
+            'like_rate': like_rate / len(viewers) if viewers else 0.0,
+            'match_rate': match_rate / len(viewers) if viewers else 0.0,
+            'candidates_scored': scored,
+            'candidates_per_sec': scored / elapsed if elapsed else 0.0
+        }
+    return results
+
+
+def _normalize(row: Dict) -> Dict:
+    """SQLite returns timestamps as text and lacks some columns"""
+    for column in ('last_active', 'created_at'):
+        if isinstance(row[column], str):
+            row[column] = datetime.fromisoformat(row[column])
+        elif row[column] is None:
+            row[column] = datetime.now()
+    row['interest_ids'] = row['interest_ids'] or []
+    row['likes_received'] = row['likes_received'] or 0
+    row['matches_count'] = row['matches_count'] or 0
+    row['views_count'] = row['views_count'] or 0
+    return row
+
+
+async def main():
+    from src.db_pool import DatabasePool
+
+    parser = argparse.ArgumentParser(description="Replay historical feeds under ranking weight profiles")
+    # No default: opening a SQLite file through DatabasePool switches it to WAL,
+    # so the replay must never touch the working database by accident
+    parser.add_argument("--database-url", required=True,
+                        help="database to replay, e.g. a copy of the production snapshot")
+    parser.add_argument("--experiment", help="experiment JSON; replays its profiles instead of the built-in ones")
+    parser.add_argument("--profiles", help="comma-separated profile names to replay (default: all)")
+    parser.add_argument("--k", type=int, default=10, help="top-k cut for the rate proxies")
+    parser.add_argument("--no-batch", action="store_true", help="per-candidate scoring instead of numpy")
+    args = parser.parse_args()
+
+    profiles = RankingExperiment.from_file(args.experiment).profiles if args.experiment else dict(WEIGHT_PROFILES)
+    if args.profiles:
+        names = args.profiles.split(",")
+        unknown = set(names) - set(profiles)
+        if unknown:
+            parser.error(f"unknown profiles: {', '.join(sorted(unknown))}")
+        profiles = {name: profiles[name] for name in names}
+
+    db = DatabasePool(args.database_url, pool_size=1, max_overflow=0)
+    await db.open()
+    try:
+        snapshot = await load_snapshot(db)
+    finally:
+        await db.close()
+
+    print(f"Snapshot: {len(snapshot.users)} users, "
+          f"{sum(len(v) for v in snapshot.likes.values())} likes, "
+          f"{sum(len(v) for v in snapshot.skips.values())} skips, {len(snapshot.matches)} matches")
+
+    results = await replay(snapshot, profiles, args.k, batch_scoring=not args.no_batch)
+    print(f"{'profile':<16}{'viewers':>8}{'like@' + str(args.k):>10}{'match@' + str(args.k):>10}{'cand/s':>12}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['viewers']:>8}{result['like_rate']:>10.3f}"
+              f"{result['match_rate']:>10.3f}{result['candidates_per_sec']:>12.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
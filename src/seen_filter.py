@@ -0,0 +1,286 @@
+# src/seen_filter.py - Per-user "already interacted" bloom filters
+
+import asyncio
+import hashlib
+import logging
+import math
+import struct
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+from sqlalchemy import and_, or_, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import Like, Match, SeenFilter, Skip, User, async_session_maker
+
+logger = logging.getLogger(__name__)
+
+# Candidates in the first page per requested profile; later pages double in
+# size (up to MAX_PAGE_SIZE) until the limit is filled or the rows run out
+OVERFETCH_FACTOR = 3
+MAX_PAGE_SIZE = 2000
+
+# Events committed this long before the snapshot are re-applied on load
+SNAPSHOT_MARGIN = timedelta(minutes=5)
+
+
+class BloomFilter:
+    """Fixed-capacity bloom filter over integer ids"""
+
+    __slots__ = ('capacity', 'hash_count', 'size', 'count', 'bits')
+
+    def __init__(self, capacity: int, error_rate: float, bits: Optional[bytearray] = None,
+                 hash_count: Optional[int] = None, count: int = 0):
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = hash_count or max(1, int(round(self.size / capacity * math.log(2))))
+        self.count = count
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: int):
+        digest = hashlib.blake2b(item.to_bytes(8, 'little', signed=True), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        # Enhanced double hashing (Kirsch-Mitzenmacher with a cubic term)
+        for i in range(self.hash_count):
+            yield (h1 + i * h2 + (i * i * i - i) // 6) % self.size
+
+    def add(self, item: int):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: int) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+
+class ScalableBloomFilter:
+    """
+    Bloom filter that grows by adding stages
+
+    Each stage has twice the capacity of the previous one and a tighter
+    error rate, so the compound false positive rate stays below error_rate
+    no matter how many swipes a user accumulates.
+    """
+
+    MAGIC = b'SBF1'
+    GROWTH = 2
+    TIGHTENING = 0.5
+
+    def __init__(self, initial_capacity: int = 1000, error_rate: float = 0.001):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.stages: List[BloomFilter] = []
+
+    def __contains__(self, item: int) -> bool:
+        return any(item in stage for stage in self.stages)
+
+    def __len__(self) -> int:
+        return sum(stage.count for stage in self.stages)
+
+    def add(self, item: int):
+        if item in self:
+            return
+        if not self.stages or self.stages[-1].count >= self.stages[-1].capacity:
+            n = len(self.stages)
+            self.stages.append(BloomFilter(
+                self.initial_capacity * self.GROWTH ** n,
+                self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** n
+            ))
+        self.stages[-1].add(item)
+
+    def to_bytes(self) -> bytes:
+        parts = [self.MAGIC, struct.pack('<dIH', self.error_rate, self.initial_capacity, len(self.stages))]
+        for stage in self.stages:
+            parts.append(struct.pack('<IBII', stage.capacity, stage.hash_count, stage.count, len(stage.bits)))
+            parts.append(bytes(stage.bits))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'ScalableBloomFilter':
+        if data[:4] != cls.MAGIC:
+            raise ValueError("Not a scalable bloom filter blob")
+
+        error_rate, initial_capacity, stage_count = struct.unpack_from('<dIH', data, 4)
+        bloom = cls(initial_capacity, error_rate)
+        offset = 4 + struct.calcsize('<dIH')
+
+        for n in range(stage_count):
+            capacity, hash_count, count, length = struct.unpack_from('<IBII', data, offset)
+            offset += struct.calcsize('<IBII')
+            bits = bytearray(data[offset:offset + length])
+            offset += length
+            stage_error = error_rate * (1 - cls.TIGHTENING) * cls.TIGHTENING ** n
+            bloom.stages.append(BloomFilter(capacity, stage_error, bits, hash_count, count))
+
+        return bloom
+
+
+class SeenFilterStore:
+    """
+    In-process cache of per-user seen filters backed by the seen_filters table
+
+    Likes, skips and matches remain the source of truth: a persisted blob
+    is stamped with the time it was loaded, and on the next load every
+    interaction since that stamp is re-applied. Persistence can therefore
+    be lazy (periodic flush) without ever losing an interaction.
+    """
+
+    def __init__(self, max_cached: int = 10000):
+        self.max_cached = max_cached
+        self.filters: 'OrderedDict[int, ScalableBloomFilter]' = OrderedDict()
+        self.snapshots = {}   # user_id -> time the filter was loaded from the DB
+        self.dirty = set()
+
+    async def get(self, user_id: int, session: AsyncSession) -> ScalableBloomFilter:
+        """Seen filter for user, loading or rebuilding it on a cache miss"""
+        bloom = self.filters.get(user_id)
+        if bloom is not None:
+            self.filters.move_to_end(user_id)
+            return bloom
+
+        snapshot = datetime.utcnow()
+        stored = await session.get(SeenFilter, user_id)
+
+        if stored:
+            bloom = ScalableBloomFilter.from_bytes(stored.data)
+            since = stored.updated_at - SNAPSHOT_MARGIN
+        else:
+            bloom = ScalableBloomFilter()
+            since = None
+
+        for target_id in await self._interacted_ids(user_id, session, since):
+            bloom.add(target_id)
+
+        self._cache(user_id, bloom, snapshot)
+        if not stored:
+            self.dirty.add(user_id)
+        return bloom
+
+    async def get_or_build(self, user_id: int,
+                           load_ids: Callable[[], Awaitable[Iterable[int]]]) -> ScalableBloomFilter:
+        """
+        Seen filter for user, built from load_ids() on a cache miss
+
+        For callers outside the ORM (raw DatabasePool queries): the filter is
+        kept in memory only and rebuilt from load_ids() after eviction.
+        """
+        bloom = self.filters.get(user_id)
+        if bloom is not None:
+            self.filters.move_to_end(user_id)
+            return bloom
+
+        snapshot = datetime.utcnow()
+        bloom = ScalableBloomFilter()
+        for target_id in await load_ids():
+            bloom.add(target_id)
+
+        self._cache(user_id, bloom, snapshot)
+        return bloom
+
+    def add(self, user_id: int, target_id: int):
+        """Record an interaction; filters not in memory pick it up on load"""
+        bloom = self.filters.get(user_id)
+        if bloom is not None:
+            bloom.add(target_id)
+            self.dirty.add(user_id)
+
+    async def flush(self):
+        """Persist filters changed since the last flush"""
+        if not self.dirty:
+            return
+
+        dirty, self.dirty = self.dirty, set()
+        async with async_session_maker() as session:
+            for user_id in dirty:
+                bloom = self.filters.get(user_id)
+                if bloom is None:
+                    continue
+                await session.merge(SeenFilter(
+                    user_id=user_id,
+                    data=bloom.to_bytes(),
+                    items=len(bloom),
+                    updated_at=self.snapshots[user_id]
+                ))
+            await session.commit()
+
+        logger.info(f"Persisted {len(dirty)} seen filters")
+
+    async def run_flusher(self, interval: float = 30):
+        """Background task: flush dirty filters periodically"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing seen filters: {e}")
+
+    def _cache(self, user_id: int, bloom: ScalableBloomFilter, snapshot: datetime):
+        self.filters[user_id] = bloom
+        self.snapshots[user_id] = snapshot
+        while len(self.filters) > self.max_cached:
+            evicted, _ = self.filters.popitem(last=False)
+            self.snapshots.pop(evicted, None)
+            # Unflushed changes are recovered from the event tables on reload
+            self.dirty.discard(evicted)
+
+    @staticmethod
+    async def _interacted_ids(user_id: int, session: AsyncSession,
+                              since: Optional[datetime]) -> List[int]:
+        liked = select(Like.to_user_id).where(Like.from_user_id == user_id)
+        skipped = select(Skip.to_user_id).where(Skip.from_user_id == user_id)
+        matched1 = select(Match.user2_id).where(Match.user1_id == user_id)
+        matched2 = select(Match.user1_id).where(Match.user2_id == user_id)
+
+        if since is not None:
+            liked = liked.where(Like.created_at >= since)
+            skipped = skipped.where(Skip.created_at >= since)
+            matched1 = matched1.where(Match.created_at >= since)
+            matched2 = matched2.where(Match.created_at >= since)
+
+        result = await session.execute(union_all(liked, skipped, matched1, matched2))
+        return [row[0] for row in result]
+
+
+async def collect_unseen(session: AsyncSession, query, seen: ScalableBloomFilter, limit: int) -> list:
+    """
+    Over-fetch candidates page by page and drop already seen users in memory
+
+    Replaces NOT IN subqueries over likes/skips/matches, whose cost grows
+    with the user's swipe history. `query` selects User rows and must not be
+    ordered: pages are read by keyset in (last_active DESC, id DESC) order,
+    so a heavy swiper whose first pages are all seen costs a few more
+    index range scans instead of ever deeper OFFSETs, and the feed is only
+    short when the candidates really run out.
+    """
+    query = query.order_by(User.last_active.desc(), User.id.desc())
+    page_size = max(limit * OVERFETCH_FACTOR, 30)
+    unseen = []
+    last = None
+
+    while True:
+        page = query if last is None else query.where(_after(last))
+        result = await session.execute(page.limit(page_size))
+        rows = result.scalars().all()
+        unseen.extend(user for user in rows if user.id not in seen)
+
+        if len(unseen) >= limit or len(rows) < page_size:
+            break
+        last = rows[-1].last_active, rows[-1].id
+        page_size = min(page_size * 2, MAX_PAGE_SIZE)
+
+    return unseen[:limit]
+
+
+def _after(key):
+    """Rows after (last_active, id) in (last_active DESC, id DESC) order"""
+    last_active, user_id = key
+    return or_(
+        User.last_active < last_active,
+        and_(User.last_active == last_active, User.id < user_id)
+    )
+
+
+# Process-wide store shared by DatabaseManager and matching
+seen_filters = SeenFilterStore()
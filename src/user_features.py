@@ -0,0 +1,221 @@
+# src/user_features.py - Nightly precomputation of per-user ranking features
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from src.elo_ratings import DEFAULT_RATING, expected_score
+
+logger = logging.getLogger(__name__)
+
+# Factors that depend only on the candidate, in MatchingEngine summation order.
+# Each is stored in user_features as <name>_score.
+STATIC_FACTORS = ('photo_quality', 'popularity', 'freshness', 'elo')
+
+FEATURE_COLUMNS = tuple(f"{name}_score" for name in STATIC_FACTORS)
+
+# Users per keyset page and per upsert statement
+BATCH_SIZE = 1000
+
+# Local hour at which run_nightly() recomputes the table
+NIGHTLY_HOUR = 3
+
+_SOURCE_QUERY = """
+    SELECT u.id, u.likes_received, u.matches_count, u.created_at, u.elo_rating,
+           ph.photo_count, ph.photo_quality
+    FROM users u
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) as photo_count,
+               AVG(COALESCE(p.quality_score, 0.5))::float8 as photo_quality
+        FROM photos p
+        WHERE p.user_id = u.id AND p.moderation_status = 'approved'
+    ) ph ON true
+    WHERE u.is_active = true AND u.id > $1
+    ORDER BY u.id
+    LIMIT $2
+"""
+
+
+def photo_quality_score(photo_count: int, photo_quality: float) -> float:
+    if not photo_count:
+        return 0.3  # No photos
+    # Mean photo quality plus a bonus for the number of photos
+    return min(1.0, photo_quality + min(0.2, photo_count * 0.05))
+
+
+def popularity_score(likes_received: int, matches_count: int) -> float:
+    if not likes_received:
+        return 0.5  # Neutral
+    # Share of likes that turned into matches; ~0.1-0.2 is a good ratio
+    return min(1.0, matches_count / likes_received * 5)
+
+
+def freshness_score(created_at: datetime, now: Optional[datetime] = None) -> float:
+    days_since_joined = ((now or datetime.now()) - created_at).days
+    if days_since_joined <= 1:
+        return 1.0
+    elif days_since_joined <= 7:
+        return 0.8
+    elif days_since_joined <= 30:
+        return 0.6
+    elif days_since_joined <= 90:
+        return 0.4
+    return 0.2
+
+
+def elo_score(elo_rating: float) -> float:
+    """Expected result against an average-rated profile"""
+    return expected_score(elo_rating, DEFAULT_RATING)
+
+
+def compute_static_factors(likes_received: int, matches_count: int, photo_count: int,
+                           photo_quality: float, created_at: datetime, elo_rating: float,
+                           now: Optional[datetime] = None) -> Dict[str, float]:
+    return {
+        'photo_quality': photo_quality_score(photo_count, photo_quality),
+        'popularity': popularity_score(likes_received, matches_count),
+        'freshness': freshness_score(created_at, now),
+        'elo': elo_score(elo_rating),
+    }
+
+
+def row_static_factors(row, now: Optional[datetime] = None) -> Dict[str, float]:
+    """
+    Static factors for a candidate query row
+
+    Uses the precomputed user_features columns when the user has been
+    through the nightly job, and computes them from the raw columns
+    otherwise (users registered since the last run).
+    """
+    if row['popularity_score'] is not None:
+        return {name: row[column] for name, column in zip(STATIC_FACTORS, FEATURE_COLUMNS)}
+    return compute_static_factors(
+        row['likes_received'] or 0, row['matches_count'] or 0,
+        row['photo_count'] or 0, row['photo_quality'] or 0.0,
+        row['created_at'], row['elo_rating'] or DEFAULT_RATING, now
+    )
+
+
+class FeaturePrecomputer:
+    """
+    Writes the candidate-only ranking factors to user_features
+
+    Walks active users in id order, keyset-paged, computes the static
+    factors with the same functions online scoring falls back to, and
+    upserts each page in one statement. Freshness is a day-granular
+    bucket, so recomputing once a night keeps it exact to within a day.
+    """
+
+    def __init__(self, db, batch_size: int = BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+
+        self.last_run: Optional[datetime] = None
+        self.last_count = 0
+
+    async def run(self) -> int:
+        """Recompute features for every active user; returns the number of users"""
+        started = datetime.now()
+        last_id = 0
+        count = 0
+
+        while True:
+            rows = await self.db.fetch(_SOURCE_QUERY, last_id, self.batch_size)
+            if not rows:
+                break
+
+            await self._upsert([
+                (row['id'], compute_static_factors(
+                    row['likes_received'] or 0, row['matches_count'] or 0,
+                    row['photo_count'] or 0, row['photo_quality'] or 0.0,
+                    row['created_at'], row['elo_rating'] or DEFAULT_RATING, started
+                ))
+                for row in rows
+            ])
+            count += len(rows)
+            last_id = rows[-1]['id']
+
+        self.last_run = started
+        self.last_count = count
+        logger.info(f"User features computed for {count} users in "
+                    f"{(datetime.now() - started).total_seconds():.1f}s")
+        return count
+
+    async def run_nightly(self, hour: int = NIGHTLY_HOUR):
+        """Recompute every night at `hour` local time (background task)"""
+        while True:
+            now = datetime.now()
+            next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+            if next_run <= now:
+                next_run += timedelta(days=1)
+            await asyncio.sleep((next_run - now).total_seconds())
+
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error(f"User features precomputation failed: {e}")
+
+    async def get(self, user_id: int) -> Optional[Dict]:
+        """Stored features of one user, for inspection"""
+        row = await self.db.fetchrow(
+            f"SELECT {', '.join(FEATURE_COLUMNS)}, computed_at FROM user_features WHERE user_id = $1",
+            user_id
+        )
+        return dict(row) if row else None
+
+    # ===================================
+    # PRIVATE METHODS
+    # ===================================
+
+    async def _upsert(self, features: List[tuple]):
+        width = len(FEATURE_COLUMNS) + 1
+        values = ", ".join(
+            "(" + ", ".join(f"${i * width + j + 1}" for j in range(width)) + ", NOW())"
+            for i in range(len(features))
+        )
+        args = [
+            value
+            for user_id, factors in features
+            for value in (user_id, *(factors[name] for name in STATIC_FACTORS))
+        ]
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in FEATURE_COLUMNS)
+
+        await self.db.execute(f"""
+            INSERT INTO user_features (user_id, {', '.join(FEATURE_COLUMNS)}, computed_at)
+            VALUES {values}
+            ON CONFLICT (user_id) DO UPDATE SET {updates}, computed_at = EXCLUDED.computed_at
+        """, *args)
+
+
+async def main():
+    from src.db_pool import DatabasePool
+
+    parser = argparse.ArgumentParser(description="Precompute per-user ranking features")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                        help="PostgreSQL URL (default: $DATABASE_URL)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--show", type=int, metavar="USER_ID",
+                        help="print the stored features of a user instead of recomputing")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+
+    logging.basicConfig(level=logging.INFO)
+    db = DatabasePool(args.database_url, pool_size=1, max_overflow=0)
+    await db.open()
+    try:
+        precomputer = FeaturePrecomputer(db, args.batch_size)
+        if args.show is not None:
+            print(await precomputer.get(args.show))
+        else:
+            await precomputer.run()
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+# src/user_stats.py - Weekly user stats from the user_daily_stats rollup
+
+import logging
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import Like, Match, ProfileView, UserDailyStats, async_session_maker
+from src.write_behind import COUNTERS
+
+logger = logging.getLogger(__name__)
+
+WINDOW_DAYS = 7
+
+
+class UserStatsService:
+    """
+    Weekly activity numbers for the /start and profile screens
+
+    Sums at most WINDOW_DAYS rollup rows in one query instead of counting
+    likes/matches/profile_views, with a short in-process TTL cache in front.
+    Rollup rows are maintained by the write-behind buffer, so numbers may
+    lag by one flush interval plus the TTL.
+    """
+
+    def __init__(self, ttl: float = 60, max_users: int = 10000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.cache: 'OrderedDict[int, tuple]' = OrderedDict()  # user_id -> (expires, stats)
+
+    async def weekly(self, user_id: int, session: AsyncSession) -> Dict[str, int]:
+        """Likes sent, matches and views received over the last WINDOW_DAYS days"""
+        entry = self.cache.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            self.cache.move_to_end(user_id)
+            return entry[1]
+
+        since = datetime.utcnow().date() - timedelta(days=WINDOW_DAYS - 1)
+        row = (await session.execute(
+            select(
+                func.coalesce(func.sum(UserDailyStats.likes_sent), 0),
+                func.coalesce(func.sum(UserDailyStats.matches_count), 0),
+                func.coalesce(func.sum(UserDailyStats.views_count), 0)
+            ).where(
+                UserDailyStats.user_id == user_id,
+                UserDailyStats.day >= since
+            )
+        )).one()
+
+        stats = {
+            'likes_this_week': row[0],
+            'matches_this_week': row[1],
+            'views_this_week': row[2]
+        }
+
+        self.cache[user_id] = (time.monotonic() + self.ttl, stats)
+        self.cache.move_to_end(user_id)
+        while len(self.cache) > self.max_users:
+            self.cache.popitem(last=False)
+        return stats
+
+    def invalidate(self, user_id: int):
+        self.cache.pop(user_id, None)
+
+    async def backfill(self, days: int = WINDOW_DAYS) -> int:
+        """
+        Build rollup rows from the raw event tables if the rollup is empty
+
+        One-time migration for existing databases; afterwards the rollup is
+        maintained incrementally. Run at startup, before any increments are
+        buffered, or those events would be counted twice.
+        """
+        async with async_session_maker() as session:
+            existing = await session.execute(select(UserDailyStats.user_id).limit(1))
+            if existing.first():
+                return 0
+
+            since = datetime.utcnow().date() - timedelta(days=days - 1)
+            since_dt = datetime.combine(since, datetime.min.time())
+            rows: Dict[tuple, Dict[str, int]] = {}
+
+            sources = (
+                ('likes_sent', Like.from_user_id, Like.created_at),
+                ('likes_received', Like.to_user_id, Like.created_at),
+                ('matches_count', Match.user1_id, Match.created_at),
+                ('matches_count', Match.user2_id, Match.created_at),
+                ('views_count', ProfileView.viewed_id, ProfileView.created_at),
+            )
+            for counter, user_column, created_column in sources:
+                day = func.date(created_column)
+                result = await session.execute(
+                    select(user_column, day, func.count())
+                    .where(created_column >= since_dt)
+                    .group_by(user_column, day)
+                )
+                for user_id, day_value, count in result:
+                    if isinstance(day_value, str):
+                        day_value = date.fromisoformat(day_value)
+                    values = rows.setdefault((user_id, day_value), dict.fromkeys(COUNTERS, 0))
+                    values[counter] += count
+
+            for (user_id, day_value), values in rows.items():
+                session.add(UserDailyStats(user_id=user_id, day=day_value, **values))
+            await session.commit()
+
+        logger.info(f"Backfilled {len(rows)} daily stats rows")
+        return len(rows)
+
+
+# Process-wide service shared by DatabaseManager and Analytics
+user_stats = UserStatsService()
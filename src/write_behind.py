@@ -0,0 +1,241 @@
+# src/write_behind.py - Write-behind buffer for profile views and user counters
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src.database import ProfileView, User, UserDailyStats, async_session_maker
+
+logger = logging.getLogger(__name__)
+
+# users columns whose increments are buffered
+COUNTERS = ('views_count', 'likes_received', 'matches_count')
+
+# user_daily_stats columns; likes_sent enforces the daily like limit, so the
+# users column is incremented in the like transaction and only its rollup is buffered
+DAILY_COUNTERS = COUNTERS + ('likes_sent',)
+
+# Failed flushes in a row before the batch is retried row by row
+MAX_ATTEMPTS = 3
+
+_users = User.__table__
+
+# One executemany statement applies every coalesced increment atomically
+_INCREMENT_COUNTERS = (
+    update(_users)
+    .where(_users.c.id == bindparam('b_user_id'))
+    .values({name: _users.c[name] + bindparam(f'b_{name}') for name in COUNTERS})
+)
+
+
+def _zero_counters() -> Dict[str, int]:
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def _zero_daily() -> Dict[str, int]:
+    return dict.fromkeys(DAILY_COUNTERS, 0)
+
+
+def _upsert_daily_stats(session):
+    """INSERT ... ON CONFLICT (user_id, day) DO UPDATE SET x = x + excluded.x"""
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(UserDailyStats)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "day"],
+        set_={name: getattr(UserDailyStats, name) + stmt.excluded[name] for name in DAILY_COUNTERS}
+    )
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces high-volume writes and flushes them in one transaction
+
+    Profile views become a bulk INSERT and counter increments are summed
+    per user into UPDATE ... SET x = x + n; the same increments are upserted
+    into today's user_daily_stats rollup row. Flushes happen when
+    max_pending writes are buffered or every flush_interval seconds, and
+    once more on stop(). Counters read from the users table may lag by up
+    to one flush interval.
+    """
+
+    def __init__(self, max_pending: int = 500, flush_interval: float = 5.0):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+
+        self.views: List[Dict] = []
+        self.counters: Dict[int, Dict[str, int]] = defaultdict(_zero_counters)
+        self.daily: Dict[Tuple[int, date], Dict[str, int]] = defaultdict(_zero_daily)
+        self.pending = 0
+
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.flush_task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.flushes = 0
+        self.flushed_writes = 0
+        self.flush_errors = 0
+        self.failures = 0  # consecutive failed flushes
+        self.dead_lettered = 0
+
+    async def start(self):
+        """Start the periodic flusher"""
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write out everything still buffered"""
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    def record_view(self, viewer_id: int, viewed_id: int):
+        """Buffer a profile view and its views_count increment"""
+        self.views.append({
+            'viewer_id': viewer_id,
+            'viewed_id': viewed_id,
+            'created_at': datetime.utcnow()
+        })
+        self.increment(viewed_id, 'views_count')
+
+    def increment(self, user_id: int, counter: str, n: int = 1):
+        """Buffer users.<counter> += n and today's rollup (for likes_sent only the rollup)"""
+        if counter not in DAILY_COUNTERS:
+            raise ValueError(f"Unknown counter: {counter}")
+
+        if counter in COUNTERS:
+            self.counters[user_id][counter] += n
+        self.daily[(user_id, datetime.utcnow().date())][counter] += n
+        self.pending += 1
+        self._maybe_flush()
+
+    async def flush(self):
+        """Write buffered views and counters in a single transaction"""
+        async with self.lock:
+            if not self.pending:
+                return
+
+            views, self.views = self.views, []
+            counters, self.counters = self.counters, defaultdict(_zero_counters)
+            daily, self.daily = self.daily, defaultdict(_zero_daily)
+            pending, self.pending = self.pending, 0
+
+            try:
+                await self._write(views, counters, daily)
+            except Exception as e:
+                self.flush_errors += 1
+                self.failures += 1
+                if self.failures < MAX_ATTEMPTS:
+                    # Put the writes back so the next flush retries them
+                    self._requeue(views, counters, daily, pending)
+                    logger.error(f"Write-behind flush failed: {e}")
+                    return
+
+                # The same batch keeps failing: isolate the rows that cause it
+                logger.error(f"Write-behind flush failed {self.failures} times, retrying row by row: {e}")
+                if not await self._write_rows(views, counters, daily, pending):
+                    return
+
+            self.failures = 0
+            self.flushes += 1
+            self.flushed_writes += pending
+
+    def metrics(self) -> Dict:
+        return {
+            'pending': self.pending,
+            'flushes': self.flushes,
+            'flushed_writes': self.flushed_writes,
+            'flush_errors': self.flush_errors,
+            'dead_lettered': self.dead_lettered
+        }
+
+    # ===================================
+    # PRIVATE METHODS
+    # ===================================
+
+    async def _write(self, views: List[Dict], counters: Dict[int, Dict[str, int]],
+                     daily: Dict[Tuple[int, date], Dict[str, int]]):
+        async with async_session_maker() as session:
+            if views:
+                await session.execute(insert(ProfileView), views)
+            if counters:
+                await session.execute(_INCREMENT_COUNTERS, [
+                    {'b_user_id': user_id, **{f'b_{name}': n for name, n in values.items()}}
+                    for user_id, values in counters.items()
+                ])
+            if daily:
+                await session.execute(_upsert_daily_stats(session), [
+                    {'user_id': user_id, 'day': day, **values}
+                    for (user_id, day), values in daily.items()
+                ])
+            await session.commit()
+
+    async def _write_rows(self, views: List[Dict], counters: Dict[int, Dict[str, int]],
+                          daily: Dict[Tuple[int, date], Dict[str, int]], pending: int) -> bool:
+        """
+        Write each row in its own transaction and dead-letter the ones that fail
+
+        If every row fails the database itself is the problem (not a poison
+        row): nothing is dropped, the batch is put back and False returned.
+        """
+        rows = (
+            [('view', view, lambda view=view: self._write([view], {}, {})) for view in views] +
+            [('counters', (user_id, values), lambda user_id=user_id, values=values:
+                self._write([], {user_id: values}, {})) for user_id, values in counters.items()] +
+            [('daily', (key, values), lambda key=key, values=values:
+                self._write([], {}, {key: values})) for key, values in daily.items()]
+        )
+
+        failed = []
+        for kind, row, write in rows:
+            try:
+                await write()
+            except Exception as e:
+                failed.append((kind, row, e))
+
+        if rows and len(failed) == len(rows):
+            self._requeue(views, counters, daily, pending)
+            self.failures = 0
+            return False
+
+        for kind, row, e in failed:
+            # Dead letter: the row is logged with its values and dropped
+            logger.error(f"Write-behind dropped {kind} row {row}: {e}")
+        self.dead_lettered += len(failed)
+        return True
+
+    def _requeue(self, views: List[Dict], counters: Dict[int, Dict[str, int]],
+                 daily: Dict[Tuple[int, date], Dict[str, int]], pending: int):
+        self.views = views + self.views
+        for user_id, values in counters.items():
+            for name, n in values.items():
+                self.counters[user_id][name] += n
+        for key, values in daily.items():
+            for name, n in values.items():
+                self.daily[key][name] += n
+        self.pending += pending
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def _maybe_flush(self):
+        if self.pending < self.max_pending:
+            return
+        if self.flush_task and not self.flush_task.done():
+            return
+        try:
+            self.flush_task = asyncio.get_running_loop().create_task(self.flush())
+        except RuntimeError:
+            pass  # No running loop: the periodic or final flush picks it up
+
+
+# Process-wide buffer shared by DatabaseManager and matching
+write_behind = WriteBehindBuffer()
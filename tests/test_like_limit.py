@@ -0,0 +1,45 @@
+# tests/test_like_limit.py - Дневной лимит лайков при буферизованных счетчиках
+
+import asyncio
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.database import Base, User
+from src.db_utils import DatabaseManager
+from src.write_behind import WriteBehindBuffer
+
+DAILY_LIMIT = 10
+
+
+async def like_until_rejected(likes: int) -> int:
+    """Принятые лайки из `likes` попыток, без единого сброса write-behind буфера"""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    try:
+        async with session_maker() as session:
+            users = [User(telegram_id=100 + i, name=f"user{i}") for i in range(likes + 1)]
+            session.add_all(users)
+            await session.commit()
+
+            liker, targets = users[0], users[1:]
+            accepted = 0
+            for target in targets:
+                if await DatabaseManager.daily_likes_remaining(liker, session) <= 0:
+                    continue
+                result = await DatabaseManager.process_like(liker.id, target.id, False, session)
+                accepted += result['created']
+            return accepted
+    finally:
+        await engine.dispose()
+
+
+def test_likes_over_the_limit_are_rejected_within_one_flush_interval(monkeypatch):
+    # Буфер, который сам никогда не сбрасывается: счетчики в нем "застряли" до flush
+    buffer = WriteBehindBuffer(max_pending=10_000, flush_interval=3600)
+    monkeypatch.setattr("src.db_utils.write_behind", buffer)
+
+    assert asyncio.run(like_until_rejected(DAILY_LIMIT + 1)) == DAILY_LIMIT
+    assert buffer.pending > 0
@@ -0,0 +1,150 @@
+# tests/test_matching_engine.py - Векторный скоринг против поштучного эталона
+
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.candidate_pool import CandidatePool, FACTOR_NAMES, HAS_NUMPY
+from src.matching_engine import MatchingEngine, UserProfile
+
+pytestmark = pytest.mark.skipif(not HAS_NUMPY, reason="batch scoring needs numpy")
+
+# Больше 200 - раньше эталон отсекал кандидатов после двухсотого
+CANDIDATES = 260
+
+CENTER = (55.75, 37.62)
+
+# Сдвиги по широте (~1.1, 11, 22, 44 и 110 км) - подальше от границ 5/15/30/50 км
+LAT_OFFSETS = (0.01, 0.1, 0.2, 0.4, 1.0)
+
+# Часы с последней активности - подальше от границ 1/24/168/720
+HOURS_INACTIVE = (0.5, 10, 100, 400, 1000)
+
+
+def candidate_rows(now: datetime):
+    """Фиксированный набор строк подбора (колонки CANDIDATE_COLUMNS)"""
+    rows = []
+    for i in range(CANDIDATES):
+        located = i % 7 != 0
+        # Половина кандидатов уже прошла ночной пересчет user_features
+        precomputed = i % 2 == 0
+        rows.append({
+            'id': 1000 + i,
+            'telegram_id': 5000 + i,
+            'name': f"user{i}",
+            'age': 25,
+            'gender': 'female',
+            'looking_for': 'male',
+            'city': 'Moscow',
+            'lat': CENTER[0] + LAT_OFFSETS[i % 5] if located else None,
+            'lon': CENTER[1] if located else None,
+            'bio': '',
+            'matches_count': i % 13,
+            'likes_received': (i * 7) % 90,
+            'views_count': i,
+            'last_active': now - timedelta(hours=HOURS_INACTIVE[(i // 5) % 5]),
+            'created_at': now - timedelta(days=(i * 3) % 120 + 0.5),
+            'is_premium': False,
+            'max_distance': 50,
+            'elo_rating': 1200 + (i % 11) * 40,
+            'interest_ids': [(i + k) % 70 for k in range(i % 6)],
+            'photo_count': i % 4,
+            'photo_quality': 0.5,
+            'photo_quality_score': (i % 64) / 64 if precomputed else None,
+            'popularity_score': ((i * 5) % 64) / 64 if precomputed else None,
+            'freshness_score': ((i * 11) % 64) / 64 if precomputed else None,
+            'elo_score': ((i * 3) % 64) / 64 if precomputed else None,
+        })
+    return rows
+
+
+def searcher(now: datetime) -> UserProfile:
+    return UserProfile(
+        id=1, telegram_id=1, name='me', age=27, gender='male', looking_for='female',
+        city='Moscow', location=CENTER, bio='', interests=[], photos=[],
+        matches_count=0, likes_received=0, views_count=0,
+        last_active=now, created_at=now - timedelta(days=30), is_premium=False,
+        interest_mask=sum(1 << interest_id for interest_id in (1, 3, 5, 8, 13, 21, 34, 55))
+    )
+
+
+def test_rank_pool_matches_reference_scoring():
+    now = datetime.now()
+    rows = candidate_rows(now)
+    user = searcher(now)
+    engine = MatchingEngine(None, batch_scoring=True)
+
+    reference = asyncio.run(engine._score_candidates(
+        user, [engine._profile_from_row(row) for row in rows], limit=None
+    ))
+    batch = engine._rank_pool(user, CandidatePool.from_rows(rows))
+
+    assert len(reference) > 200
+    assert [score.user_id for score in batch] == [score.user_id for score in reference]
+    for expected, actual in zip(reference, batch):
+        assert actual.score == pytest.approx(expected.score, abs=1e-6)
+        for name in FACTOR_NAMES:
+            assert actual.factors[name] == pytest.approx(expected.factors[name], abs=1e-6)
+
+
+def test_limit_applies_after_ranking():
+    now = datetime.now()
+    rows = candidate_rows(now)
+    user = searcher(now)
+    engine = MatchingEngine(None, batch_scoring=True)
+
+    reference = asyncio.run(engine._score_candidates(
+        user, [engine._profile_from_row(row) for row in rows], limit=20
+    ))
+    batch = engine._rank_pool(user, CandidatePool.from_rows(rows), limit=20)
+
+    assert [score.user_id for score in batch] == [score.user_id for score in reference]
+
+
+def random_rows(now: datetime, count: int = 2000, seed: int = 7):
+    """Реальные координаты вокруг центра (0-80 км) и произвольные готовые факторы"""
+    rng = random.Random(seed)
+    template = candidate_rows(now)[0]
+    rows = []
+    for i in range(count):
+        precomputed = rng.random() < 0.5
+        row = dict(template)
+        row.update({
+            'id': 10_000 + i,
+            'telegram_id': 50_000 + i,
+            'lat': CENTER[0] + rng.uniform(-0.7, 0.7),
+            'lon': CENTER[1] + rng.uniform(-1.2, 1.2),
+            'last_active': now - timedelta(seconds=rng.uniform(0, 60 * 86400)),
+            'created_at': now - timedelta(seconds=rng.uniform(0, 200 * 86400)),
+            'elo_rating': rng.uniform(900, 1600),
+            'interest_ids': rng.sample(range(70), rng.randrange(8)),
+            'photo_count': rng.randrange(5),
+            'photo_quality': rng.random(),
+            'photo_quality_score': rng.random() if precomputed else None,
+            'popularity_score': rng.random() if precomputed else None,
+            'freshness_score': rng.random() if precomputed else None,
+            'elo_score': rng.random() if precomputed else None,
+        })
+        rows.append(row)
+    return rows
+
+
+def test_rank_pool_matches_reference_on_random_coordinates():
+    now = datetime.now()
+    rows = random_rows(now)
+    user = searcher(now)
+    engine = MatchingEngine(None, batch_scoring=True)
+
+    reference = asyncio.run(engine._score_candidates(
+        user, [engine._profile_from_row(row) for row in rows], limit=None
+    ))
+    batch = engine._rank_pool(user, CandidatePool.from_rows(rows))
+
+    expected = {score.user_id: score for score in reference}
+    assert len(batch) == len(reference)
+    for actual in batch:
+        assert actual.score == pytest.approx(expected[actual.user_id].score, abs=1e-9)
+        for name in FACTOR_NAMES:
+            assert actual.factors[name] == pytest.approx(expected[actual.user_id].factors[name], abs=1e-9)
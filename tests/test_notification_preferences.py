@@ -0,0 +1,51 @@
+# tests/test_notification_preferences.py - Сброс настроек уведомлений между процессами
+
+import asyncio
+
+from src.notification_preferences import NotificationPreferences
+
+
+class FakeDatabase:
+    """users.notification_settings в памяти с интерфейсом asyncpg"""
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    async def fetch(self, query, user_ids):
+        return [{'id': user_id, 'notification_settings': self.settings.get(user_id)} for user_id in user_ids]
+
+
+class FakeBroker:
+    """Pub/sub CacheService: publish доставляет сообщение всем подписчикам канала"""
+
+    def __init__(self):
+        self.subscribers = {}
+
+    async def publish(self, channel, message):
+        for callback in self.subscribers.get(channel, []):
+            await callback(message)
+
+    async def listen(self, channel, callback):
+        self.subscribers.setdefault(channel, []).append(callback)
+
+
+async def switch_off_in_bot_process():
+    db = FakeDatabase({1: None})
+    broker = FakeBroker()
+
+    # main.py: маска закэширована, слушаем сбросы
+    worker = NotificationPreferences(db, broker)
+    await worker.start()
+    await worker.listener
+    assert await worker.is_enabled(1, 'likes')
+
+    # complete_bot.py: пишет настройку в базу и рассылает сброс
+    bot = NotificationPreferences(None, broker)
+    db.settings[1] = '{"likes": false}'
+    await bot.invalidate_everywhere(1)
+
+    return await worker.is_enabled(1, 'likes')
+
+
+def test_invalidation_from_bot_reaches_other_process():
+    assert asyncio.run(switch_off_in_bot_process()) is False